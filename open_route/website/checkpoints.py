@@ -0,0 +1,88 @@
+import os
+import pickle
+import tempfile
+
+class CheckpointStore(object):
+    """Days of a horizon already solved, kept on disk as each is solved so a
+    run that dies part way through can be resumed by running it again
+
+    Each day is kept in a file of its own, named by the fingerprint of its
+    inputs (see iterate.day_fingerprint), holding its column of
+    fleet_mileage and hauler_hours, its routes and its fleet search. A day
+    is written to a temporary file in the same directory and then renamed
+    over its own, so readers, and other runs checkpointing the same day at
+    the same time, only ever see a whole file.
+
+    Parameters
+    ----------
+    directory : str
+        Where the checkpoints are kept (created if it doesn't exist)
+
+    suffix : str, optional
+        The extension of the checkpoint files, so stores of different things
+        can share a directory
+    """
+
+    def __init__(self, directory, suffix = '.day'):
+
+        self.directory = directory
+        self.suffix = suffix
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, fingerprint):
+        """The file a day's checkpoint is kept in"""
+
+        return os.path.join(self.directory, fingerprint + self.suffix)
+
+    def load(self, fingerprint):
+        """Reads a day's checkpoint
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the day's inputs
+
+        Returns
+        -------
+        day : dict
+            The results of the day (see iterate.solve_one_day), or None if it
+            hasn't been checkpointed
+        """
+
+        try:
+            with open(self.path(fingerprint), 'rb') as day_file:
+                return pickle.load(day_file)
+        except (IOError, OSError):
+            return None
+
+    def save(self, fingerprint, day):
+        """Writes a day's checkpoint, replacing any earlier one
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the day's inputs
+
+        day : dict
+            The results of the day (see iterate.solve_one_day)
+        """
+
+        handle, temporary_path = tempfile.mkstemp(dir = self.directory,
+            suffix = '.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as day_file:
+                pickle.dump(day, day_file, protocol = 2)
+                day_file.flush()
+                os.fsync(day_file.fileno())
+
+            # renaming within a directory replaces the file all at once
+            if hasattr(os, 'replace'):
+                os.replace(temporary_path, self.path(fingerprint))
+            else:
+                os.rename(temporary_path, self.path(fingerprint))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
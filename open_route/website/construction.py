@@ -0,0 +1,120 @@
+import numpy as np
+import collections
+
+def construct_routes(fixed_parameters, variable_parameters):
+    """Quickly builds routes for a fleet of equipment haulers that meet all of
+    a day's demand, to give the routing model a starting solution and an upper
+    bound on the fleet size
+
+    Haulers are sent out one at a time. Each leaves the start-of-day hub for
+    the nearest site with demand left and keeps going to the nearest site of
+    the opposite demand type (pairing drop-offs with pick-ups) as long as he
+    could still reach the end-of-day hub within the length of his day. When no
+    such site is left he returns to the start-of-day hub to reload if that
+    lets him visit another site, and otherwise ends his day. Routes are only
+    taken as many times as their route constraints allow.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    Returns
+    -------
+    construction : dict
+        The number of haulers used, the number of times each of them takes
+        each route, and the total miles they run, or None if some demand
+        could not be met by any hauler
+    """
+
+    travel_rate = fixed_parameters['travel_rate']
+    day_length = fixed_parameters['day_length']
+    handle = fixed_parameters['handle']
+
+    demand_list = variable_parameters['demand_list']
+    route_constraints = variable_parameters['route_constraints']
+    travel_matrix = variable_parameters['travel_matrix']
+    locations = variable_parameters['locations']
+    customers = variable_parameters['customers']
+
+    start_hub = locations[0]
+    end_hub = locations[-1]
+
+    # minutes each route takes to drive and un/load, as counted in the
+    # routing model, and the minutes each hauler has in a day
+    route_minutes = handle + (travel_matrix/travel_rate).astype(int)
+    time_limit = day_length + handle
+
+    # drop-offs and pick-ups left to make at each site, and the number of
+    # times each route can still be travelled
+    remaining = np.zeros(len(locations), dtype=int)
+    remaining[customers] = np.absolute(demand_list)[customers]
+    capacity = np.array(route_constraints, dtype=int)
+
+    routes = []
+    miles = 0
+
+    while remaining.sum() > 0:
+
+        position = start_hub
+        minutes = 0
+        arcs = collections.Counter()
+
+        while True:
+
+            # sites that can be travelled to next and still leave time to
+            # reach the end-of-day hub
+            candidates = [j for j in customers if remaining[j] > 0 and
+                capacity[position, j] > 0 and minutes +
+                route_minutes[position, j] + route_minutes[j, end_hub] <=
+                time_limit]
+
+            # if none, go back to reload if there is time to visit a site after
+            if len(candidates) == 0 and position != start_hub:
+                reload_minutes = minutes + route_minutes[position, start_hub]
+                reachable = [j for j in customers if remaining[j] > 0 and
+                    capacity[start_hub, j] > 0 and reload_minutes +
+                    route_minutes[start_hub, j] + route_minutes[j, end_hub] <=
+                    time_limit]
+
+                if len(reachable) > 0 and capacity[position, start_hub] > 0:
+                    arcs[position, start_hub] += 1
+                    capacity[position, start_hub] -= 1
+                    minutes = reload_minutes
+                    miles += travel_matrix[position, start_hub]
+                    position = start_hub
+                    continue
+
+            if len(candidates) == 0:
+                break
+
+            j = min(candidates, key=lambda j: (travel_matrix[position, j], j))
+
+            arcs[position, j] += 1
+            capacity[position, j] -= 1
+            minutes += route_minutes[position, j]
+            miles += travel_matrix[position, j]
+            remaining[j] -= 1
+            position = j
+
+        # a hauler who can't reach any site means the demand left can't be met
+        if len(arcs) == 0:
+            return None
+
+        arcs[position, end_hub] += 1
+        capacity[position, end_hub] -= 1
+        miles += travel_matrix[position, end_hub]
+        routes.append(dict(arcs))
+
+    construction = {
+        'fleet_size': len(routes),
+        'routes': routes,
+        'miles': miles
+    }
+
+    return construction
@@ -0,0 +1,322 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import (connected_components, csgraph_from_dense,
+    shortest_path)
+from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
+
+from parameters import make_route_constraints, make_day_subsets
+from fleet_search import linear_scan_bound, count_solves_avoided
+from solvers import OPTIMAL, FEASIBLE_WITH_GAP, NO_SOLUTION
+
+def find_components(fixed_parameters, variable_parameters):
+    """Splits a day's customers into groups that no hauler can serve two of
+    in one day, so each group can be routed on its own
+
+    Customers are first grouped by the routes a hauler could drive between
+    them: routes only join sites with opposite kinds of demand, and only
+    those a hauler could reach from the start-hub and still get to the
+    end-hub from within his day. A hauler can still serve two groups by
+    returning to the hub in between, but only if the shortest trip from the
+    hub into and back out of each fits in his day together. Groups where
+    that's possible are merged, so the minimum fleet of the day is the sum
+    of the minimum fleets of the groups left, and its miles the sum of
+    theirs.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    Returns
+    -------
+    components : list
+        The customers (location indices) of each group, in order of their
+        first customer
+    """
+
+    rate = fixed_parameters['travel_rate']
+    L = fixed_parameters['day_length']
+    handle = fixed_parameters['handle']
+
+    customers = np.asarray(variable_parameters['customers'], dtype=int)
+    locations = variable_parameters['locations']
+    route_constraints = np.asarray(variable_parameters['route_constraints'])
+    travel = np.asarray(variable_parameters['travel_matrix'], dtype=float)
+    start_hub, end_hub = locations[0], locations[-1]
+
+    if len(customers) == 0:
+        return []
+
+    # minutes of each route, driving plus one handle, with drives rounded
+    # down so the bounds below hold however the model counts them
+    minutes = np.floor(travel/rate) + handle
+
+    # fewest minutes to reach each location from the start-hub, and to get
+    # from it to the end-hub, over any routes
+    graph = csgraph_from_dense(minutes, null_value = np.inf)
+    from_start = shortest_path(graph, indices = start_hub)
+    to_end = shortest_path(graph.T, indices = end_hub)
+
+    # customers joined by routes a hauler can drive between them in his day
+    usable = ((route_constraints > 0) & (from_start[:, None] + minutes +
+        to_end[None, :] <= L + handle))
+    linked = usable[np.ix_(customers, customers)]
+    count, labels = connected_components(sp.csr_matrix(linked),
+        directed = True, connection = 'weak')
+    groups = [customers[labels == group] for group in range(count)]
+
+    # fewest minutes a hauler serving a group spends on the route into it from
+    # the start-hub and the route out of it to either hub
+    trips = np.array([minutes[start_hub, group].min() +
+        np.minimum(minutes[group, start_hub], minutes[group, end_hub]).min()
+        for group in groups])
+
+    # groups one hauler could serve two of in a day are routed together
+    shared = trips[:, None] + trips[None, :] <= L + handle
+    np.fill_diagonal(shared, False)
+    count, labels = connected_components(sp.csr_matrix(shared),
+        directed = False)
+
+    components = [sorted(np.concatenate([groups[g] for g in
+        np.flatnonzero(labels == label)]).tolist()) for label in range(count)]
+
+    return sorted(components)
+
+def cluster_components(variable_parameters, components, size):
+    """Splits the groups of a day's customers further into clusters of nearby
+    sites, no larger than a given size
+
+    Clusters aren't independent the way the groups of find_components are,
+    as a hauler may be able to serve sites in two of them, so routing each
+    on its own only gives a fleet that is feasible, not one known to be the
+    smallest.
+
+    Parameters
+    ----------
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    components : list
+        The customers of each group (see find_components)
+
+    size : int
+        The most customers a cluster can have
+
+    Returns
+    -------
+    clusters : list
+        The customers of each cluster
+    """
+
+    travel = np.asarray(variable_parameters['travel_matrix'], dtype=float)
+    size = max(int(size), 1)
+
+    clusters = []
+    for component in components:
+        if len(component) <= size:
+            clusters.append(component)
+            continue
+
+        # miles between the group's sites either way, as a condensed matrix
+        miles = travel[np.ix_(component, component)]
+        miles = np.maximum(miles, miles.T)
+        np.fill_diagonal(miles, 0)
+        tree = linkage(squareform(miles, checks = False), method = 'average')
+
+        # the fewest clusters that keep every one small enough
+        for count in range(-(-len(component)//size), len(component) + 1):
+            labels = fcluster(tree, count, criterion = 'maxclust')
+            if np.bincount(labels).max() <= size:
+                break
+
+        component = np.asarray(component)
+        clusters.extend([component[labels == label].tolist() for label in
+            np.unique(labels)])
+
+    return sorted(clusters)
+
+def component_parameters(fixed_parameters, variable_parameters, component):
+    """Makes the variable parameters of the routing problem of one group of a
+    day's customers, with the same hubs as the day
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    component : list
+        The customers (location indices) of the group
+
+    Returns
+    -------
+    component_parameters : dict
+        The variable parameters of the group's routing problem
+
+    index : list
+        The day's location index of each of the group's locations
+    """
+
+    locations = variable_parameters['locations']
+    index = [locations[0]] + list(component) + [locations[-1]]
+
+    demand_list = [variable_parameters['demand_list'][i] for i in index]
+    travel = np.asarray(variable_parameters['travel_matrix'])
+    sub_locations = range(len(index))
+    sub_customers = sub_locations[1:-1]
+
+    component_parameters = {
+        'demand_list': demand_list,
+        'route_constraints': make_route_constraints(demand_list),
+        'travel_matrix': travel[np.ix_(index, index)],
+        'subsets': make_day_subsets(fixed_parameters, sub_customers,
+            demand_list),
+        'locations': sub_locations,
+        'customers': sub_customers
+    }
+
+    return component_parameters, index
+
+def merge_searches(fixed_parameters, variable_parameters, indices,
+    day_searches, approximate):
+    """Merges the fleet size searches of the groups of a day's customers into
+    one for the whole day
+
+    The day's fleet is every group's fleet together, its miles their miles
+    together, and its haulers numbered group by group.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    indices : list
+        The day's location index of each group's locations (see
+        component_parameters)
+
+    day_searches : list
+        The search of each group (see iterate.search_day)
+
+    approximate : bool
+        Whether the groups are clusters that may not be independent, so the
+        merged fleet isn't known to be the smallest
+
+    Returns
+    -------
+    day_search : dict
+        The search for the whole day, as iterate.search_day returns it, with
+        how many groups it was split into
+    """
+
+    fleet_upper_bound = fixed_parameters['fleet_upper_bound']
+    num_locations = len(variable_parameters['locations'])
+
+    searches = [day_search['search'] for day_search in day_searches]
+    fleet_sizes = [search['fleet_size'] for search in searches]
+    all_results = [search['results'] for search in searches]
+
+    if None in fleet_sizes:
+        # a group no fleet can serve leaves the whole day unserved
+        fleet_size = None
+        results = None
+        outcome = searches[fleet_sizes.index(None)]['outcome']
+
+    elif sum(fleet_sizes) > fleet_upper_bound:
+        fleet_size = None
+        results = None
+        outcome = NO_SOLUTION
+
+    else:
+        fleet_size = sum(fleet_sizes)
+
+        # each group's haulers follow those of the groups before it
+        x = np.zeros((num_locations, num_locations, fleet_size))
+        first = 0
+        for index, group_results, group_fleet in zip(indices, all_results,
+            fleet_sizes):
+            haulers = range(first, first + group_fleet)
+            x[np.ix_(index, index, haulers)] = group_results['x']
+            first += group_fleet
+
+        outcome = OPTIMAL
+        if approximate or any([search['outcome'] != OPTIMAL for search in
+            searches]):
+            outcome = FEASIBLE_WITH_GAP
+
+        results = {
+            'status': 'Optimal',
+            'outcome': outcome,
+            'objective': sum([group_results['objective'] for group_results in
+                all_results]),
+            'x': x,
+            'y': np.zeros((0, fleet_size))
+        }
+
+        # totals of how the groups' models were presolved or searched
+        presolves = [group_results['presolve'] for group_results in
+            all_results if 'presolve' in group_results]
+        if len(presolves) > 0:
+            results['presolve'] = dict((key, sum([presolve[key] for presolve
+                in presolves])) for key in ('variables', 'variables_removed',
+                'rows', 'rows_removed'))
+
+        reports = [group_results['search'] for group_results in all_results
+            if len(group_results.get('search', {})) > 0]
+        if len(reports) > 0:
+            results['search'] = {
+                'iterations': sum([report['iterations'] for report in
+                    reports]),
+                'best_iteration': max([report['best_iteration'] for report in
+                    reports])
+            }
+
+    construction_fleets = [day_search['construction_fleet'] for day_search in
+        day_searches]
+
+    # savings are counted against trying every fleet size for the whole day
+    ip_solves = sum([search['ip_solves'] for search in searches])
+
+    search = {
+        'fleet_size': fleet_size,
+        'results': results,
+        'outcome': outcome,
+        'ip_solves': ip_solves,
+        'solves_avoided': count_solves_avoided(fleet_size,
+            linear_scan_bound(fixed_parameters, variable_parameters),
+            ip_solves),
+        'probes_cancelled': sum([search.get('probes_cancelled', 0) for search
+            in searches]),
+        'components': len(searches)
+    }
+
+    day_search = {
+        'search': search,
+        'lower_bound': sum([day_search['lower_bound'] for day_search in
+            day_searches]),
+        'upper_bound': min(sum([day_search['upper_bound'] for day_search in
+            day_searches]), fleet_upper_bound),
+        'construction_fleet': None if None in construction_fleets else
+            sum(construction_fleets),
+        'exact': not approximate and all([day_search['exact'] for day_search
+            in day_searches]),
+        'lp_solves': sum([day_search['lp_solves'] for day_search in
+            day_searches])
+    }
+
+    return day_search
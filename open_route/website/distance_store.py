@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # no file locking outside of Unix, so only one process should add sites
+    fcntl = None
+
+from parameters import pairwise_miles
+
+class DistanceStore(object):
+    """Miles between every pair of sites in a region's catalog, kept on disk so
+    they are only ever computed once and can be shared by every process
+    routing that region
+
+    Distances are symmetric, so only the lower triangle of the matrix is kept,
+    one row per site in the order sites were added: row i holds the miles
+    from site i to sites 0 through i, as float32. New sites only append rows,
+    so the file is memory-mapped read-only and the pages read by one process
+    are shared with all others through the operating system's cache. The
+    site numbers and coordinates of each row are kept in a CSV file next to
+    it, written after the row so a reader never sees a site without its row.
+    The CSV is rewritten to a temporary file and renamed over the old one, so
+    readers, which don't take the lock, only ever see a whole file.
+
+    Parameters
+    ----------
+    directory : str
+        Where the store's files are kept (created if it doesn't exist)
+
+    metric : str, optional
+        How miles are measured between sites, 'manhattan' (the default) or
+        'haversine' (see parameters.pairwise_miles). Each metric is kept in its
+        own files.
+
+    block : int, optional
+        How many new sites' rows are computed at once when adding sites
+    """
+
+    def __init__(self, directory, metric = 'manhattan', block = 1024):
+
+        self.directory = directory
+        self.metric = metric
+        self.block = block
+
+        # raise on an unknown metric before touching any files
+        pairwise_miles([], [], [], [], metric)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.distance_path = os.path.join(directory, '%s.f32' % metric)
+        self.site_path = os.path.join(directory, '%s_sites.csv' % metric)
+        self.lock_path = os.path.join(directory, '%s.lock' % metric)
+
+        self.load()
+
+    def __len__(self):
+
+        return len(self.sites)
+
+    def load(self):
+        """Reads the sites in the store and maps the rows written for them,
+        picking up any sites other processes have added since the last load
+        """
+
+        if os.path.exists(self.site_path):
+            self.sites = pd.read_csv(self.site_path, header = None,
+                names = ['Project #', 'Lat', 'Long'])
+        else:
+            self.sites = pd.DataFrame(columns = ['Project #', 'Lat', 'Long'])
+
+        self.index = pd.Index(self.sites['Project #'].values)
+
+        # rows beyond those of the listed sites were left by an interrupted
+        # write and are ignored
+        size = len(self.sites)*(len(self.sites) + 1)//2
+        if size > 0:
+            self.distances = np.memmap(self.distance_path, dtype = np.float32,
+                mode = 'r', shape = (size,))
+        else:
+            self.distances = np.zeros(0, dtype = np.float32)
+
+    def add_sites(self, site_df):
+        """Adds the rows for any sites the store doesn't have yet
+
+        Parameters
+        ----------
+        site_df : pandas.core.frame.DataFrame
+            The latitude and longitude for each of our sites
+
+        Returns
+        -------
+        added : int
+            How many sites were added
+        """
+
+        lock = open(self.lock_path, 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # another process may have added sites since we last looked
+            self.load()
+            self.check_coordinates(site_df)
+
+            new_sites = site_df.loc[self.index.get_indexer(
+                site_df['Project #'].values) < 0, ['Project #', 'Lat', 'Long']]
+            new_sites = new_sites.drop_duplicates('Project #')
+
+            if len(new_sites) > 0:
+                self.append_rows(new_sites)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+        self.load()
+
+        return len(new_sites)
+
+    def check_coordinates(self, site_df):
+        """Makes sure sites already in the store haven't moved, since their
+        rows would no longer be right"""
+
+        index = self.index.get_indexer(site_df['Project #'].values)
+        known = index >= 0
+
+        stored = self.sites.iloc[index[known]]
+        moved = ~(np.isclose(stored['Lat'].values.astype(float),
+            site_df['Lat'].values[known].astype(float)) &
+            np.isclose(stored['Long'].values.astype(float),
+            site_df['Long'].values[known].astype(float)))
+
+        if moved.any():
+            moved_sites = stored['Project #'].values[moved].tolist()
+            raise ValueError('sites %s have different coordinates than in the '
+                'distance store at %s' % (moved_sites, self.directory))
+
+    def append_rows(self, new_sites):
+        """Computes and writes the rows of sites new to the store, then lists
+        the sites
+
+        Parameters
+        ----------
+        new_sites : pandas.core.frame.DataFrame
+            The site numbers, latitudes and longitudes of the new sites
+        """
+
+        if len(self.sites) > 0:
+            sites = pd.concat([self.sites, new_sites], ignore_index = True)
+        else:
+            sites = new_sites.reset_index(drop = True)
+        lat = sites['Lat'].values.astype(float)
+        lng = sites['Long'].values.astype(float)
+
+        first = len(self.sites)
+        size = first*(first + 1)//2
+
+        with open(self.distance_path, 'ab') as distance_file:
+
+            # drop anything an interrupted write left after the listed sites
+            distance_file.truncate(size*np.dtype(np.float32).itemsize)
+
+            for start in range(first, len(sites), self.block):
+                stop = min(start + self.block, len(sites))
+                miles = pairwise_miles(lat[start:stop], lng[start:stop],
+                    lat[:stop], lng[:stop], self.metric).astype(np.float32)
+
+                for i in range(start, stop):
+                    miles[i - start, :i + 1].tofile(distance_file)
+
+            distance_file.flush()
+            os.fsync(distance_file.fileno())
+
+        handle, temporary_path = tempfile.mkstemp(dir = self.directory,
+            suffix = '.tmp')
+        try:
+            with os.fdopen(handle, 'w') as site_file:
+                sites.to_csv(site_file, header = False, index = False,
+                    float_format = '%.17g')
+                site_file.flush()
+                os.fsync(site_file.fileno())
+
+            # renaming within a directory replaces the file all at once
+            if hasattr(os, 'replace'):
+                os.replace(temporary_path, self.site_path)
+            else:
+                os.rename(temporary_path, self.site_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def submatrix(self, locations):
+        """Reads the miles between a day's locations out of the store
+
+        Only the entries for those locations are read from disk.
+
+        Parameters
+        ----------
+        locations : list
+            The site numbers of the day's locations, in the order of the
+            day's travel matrix
+
+        Returns
+        -------
+        miles : numpy.ndarray
+            How many miles apart each pair of the locations is
+        """
+
+        index = self.index.get_indexer(locations)
+        if (index < 0).any():
+            missing = [a for a, i in zip(locations, index) if i < 0]
+            raise KeyError('no coordinates for sites %s' % missing)
+
+        # position of each (i, j) in the packed lower triangle
+        index = index.astype(np.int64)
+        row = np.maximum(index[:, None], index[None, :])
+        column = np.minimum(index[:, None], index[None, :])
+
+        return np.asarray(self.distances[row*(row + 1)//2 + column])
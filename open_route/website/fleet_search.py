@@ -0,0 +1,491 @@
+import numpy as np
+import multiprocessing
+import os
+import signal
+
+from hauler_routing import make_routing_model
+from solvers import Deadline, FEASIBLE_WITH_GAP, TIMED_OUT, NO_SOLUTION
+
+def time_lower_bound(fixed_parameters, variable_parameters):
+    """Finds the fewest haulers that could possibly have enough working time to
+    meet all of a day's demand
+
+    Each site needs to be left once for every drop-off or pick-up it has, and
+    each of those departures takes at least one handle plus the drive along the
+    shortest route out of that site that is allowed to be travelled. The total
+    of that time over all sites is then spread across haulers who can each work
+    one day's length.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    Returns
+    -------
+    lower_bound : int
+        No fleet with fewer haulers than this can meet the day's demand
+    """
+
+    travel_rate = fixed_parameters['travel_rate']
+    day_length = fixed_parameters['day_length']
+    handle = fixed_parameters['handle']
+
+    demand_list = variable_parameters['demand_list']
+    route_constraints = variable_parameters['route_constraints']
+    travel_matrix = variable_parameters['travel_matrix']
+    customers = variable_parameters['customers']
+
+    # minutes each route takes to drive and un/load, as counted in route_fleet
+    route_minutes = handle + (travel_matrix/travel_rate).astype(int)
+
+    total_minutes = 0
+    for i in customers:
+        allowed = route_constraints[i] > 0
+        if allowed.any():
+            total_minutes += abs(demand_list[i])*route_minutes[i][allowed].min()
+
+    # every hauler also gets one extra handle for the trip out of the hub,
+    # which cancels the extra handle route_fleet adds to his day
+    lower_bound = int(np.ceil(total_minutes/float(day_length)))
+
+    return lower_bound
+
+def relaxation_lower_bound(model, lower_bound, upper_bound):
+    """Raises a lower bound on fleet size to the smallest fleet for which the
+    LP relaxation of the routing model is feasible
+
+    Parameters
+    ----------
+    model : hauler_routing.RoutingModel
+        The day's routing model
+
+    lower_bound : int
+        The fewest haulers known to be needed so far
+
+    upper_bound : int
+        The most haulers the fleet can have
+
+    Returns
+    -------
+    lower_bound : int
+        No fleet with fewer haulers than this can meet the day's demand
+
+    lp_solves : int
+        The number of LP relaxations solved to find the bound
+    """
+
+    lp_solves = 0
+
+    # LP feasibility is monotone in fleet size, so binary search for the
+    # smallest feasible relaxation
+    low, high = lower_bound, upper_bound
+    while low < high:
+        fleet_size = (low + high)//2
+        model.set_fleet_size(fleet_size)
+        results = model.solve(relax = True)
+        lp_solves += 1
+
+        # a relaxation that ran out of time can't rule its fleet size out
+        if results['outcome'] != NO_SOLUTION:
+            high = fleet_size
+        else:
+            low = fleet_size + 1
+
+    return low, lp_solves
+
+def linear_scan_bound(fixed_parameters, variable_parameters):
+    """Finds the largest fleet trying every fleet size from 0 up would have
+    tried for a day, before fleet sizes were searched
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    Returns
+    -------
+    scan_bound : int
+        The smaller of the day's drop-offs and pick-ups and the fleet upper
+        bound
+    """
+
+    abs_demand_list = np.absolute(variable_parameters['demand_list'])
+    pickups = np.sum(abs_demand_list[1:-1])
+
+    return int(min(pickups, fixed_parameters['fleet_upper_bound']))
+
+def count_solves_avoided(fleet_size, scan_bound, ip_solves):
+    """Counts the integer programs a fleet search avoided, compared to trying
+    every fleet size from 0 up until one is feasible
+
+    Parameters
+    ----------
+    fleet_size : int
+        The smallest feasible fleet found, or None if there was none
+
+    scan_bound : int
+        The largest fleet trying every size would have tried (see
+        linear_scan_bound)
+
+    ip_solves : int
+        The integer programs the search solved
+
+    Returns
+    -------
+    solves_avoided : int
+        How many fewer integer programs the search solved, or 0 if it
+        solved more, as a search starting from a hint far from the smallest
+        fleet can
+    """
+
+    if fleet_size is None:
+        linear_solves = scan_bound + 1
+    else:
+        linear_solves = fleet_size + 1
+
+    return max(linear_solves - ip_solves, 0)
+
+def search_fleet_size(model, lower_bound, upper_bound, hint = None,
+    scan_bound = None):
+    """Finds the smallest fleet of equipment haulers that can meet a day's
+    demand, solving as few integer programs as possible
+
+    Starting from the hint (or the lower bound if there is none), fleet sizes
+    are probed with step sizes that double until the minimum fleet is
+    bracketed by an infeasible and a feasible size, after which the bracket is
+    binary searched.
+
+    Parameters
+    ----------
+    model : hauler_routing.RoutingModel
+        The day's routing model
+
+    lower_bound : int
+        No fleet with fewer haulers than this can meet the day's demand
+
+    upper_bound : int
+        The most haulers the fleet can have
+
+    hint : int, optional
+        A fleet size likely to be close to the minimum, such as the previous
+        day's fleet
+
+    scan_bound : int, optional
+        The largest fleet trying every size from 0 up would have tried (see
+        linear_scan_bound), the upper bound if not given
+
+    A fleet size whose solve runs out of time before finding a solution is
+    treated as infeasible, so the fleet found is only known to be the
+    smallest if no smaller fleet timed out.
+
+    Returns
+    -------
+    search : dict
+        The minimum fleet size (None if even the upper bound is infeasible),
+        the results of solving the routing problem for that fleet, whether
+        the fleet and its routes are optimal, feasible with a gap or timed out,
+        and how many integer programs were solved and avoided compared to
+        trying every fleet size from 0 up
+    """
+
+    # results of every fleet size solved, by fleet size
+    solved = {}
+
+    def feasible(fleet_size):
+        model.set_fleet_size(fleet_size)
+        solved[fleet_size] = model.solve()
+        return solved[fleet_size]['status'] == 'Optimal'
+
+    # largest fleet known to be infeasible and smallest known to be feasible
+    infeasible_size = lower_bound - 1
+    feasible_size = None
+
+    start = lower_bound
+    if hint is not None:
+        start = min(max(hint, lower_bound), upper_bound)
+
+    # bracket the minimum fleet size, stepping away from the start in
+    # doubling steps
+    if lower_bound <= upper_bound:
+        if feasible(start):
+            feasible_size = start
+            step = 1
+            while feasible_size - step > infeasible_size:
+                if feasible(feasible_size - step):
+                    feasible_size = feasible_size - step
+                    step *= 2
+                else:
+                    infeasible_size = feasible_size - step
+                    break
+        else:
+            infeasible_size = start
+            step = 1
+            while infeasible_size < upper_bound:
+                fleet_size = min(infeasible_size + step, upper_bound)
+                if feasible(fleet_size):
+                    feasible_size = fleet_size
+                    break
+                infeasible_size = fleet_size
+                step *= 2
+
+    # binary search the bracket
+    if feasible_size is not None:
+        while feasible_size - infeasible_size > 1:
+            fleet_size = (feasible_size + infeasible_size)//2
+            if feasible(fleet_size):
+                feasible_size = fleet_size
+            else:
+                infeasible_size = fleet_size
+
+    # fleet sizes that ran out of time without a solution
+    timed_out = [fleet_size for fleet_size in solved if
+        solved[fleet_size]['outcome'] == TIMED_OUT]
+
+    if feasible_size is None:
+        results = None
+        outcome = TIMED_OUT if len(timed_out) > 0 else NO_SOLUTION
+    else:
+        results = solved[feasible_size]
+        outcome = results['outcome']
+
+        # a smaller fleet might have been feasible given more time
+        if len(timed_out) > 0 and min(timed_out) < feasible_size:
+            outcome = FEASIBLE_WITH_GAP
+
+    if scan_bound is None:
+        scan_bound = upper_bound
+
+    search = {
+        'fleet_size': feasible_size,
+        'results': results,
+        'outcome': outcome,
+        'ip_solves': len(solved),
+        'solves_avoided': count_solves_avoided(feasible_size, scan_bound,
+            len(solved))
+    }
+
+    return search
+
+def run_probe(fixed_parameters, variable_parameters, fleet_size, routes,
+    deadline, connection):
+    """Solves the routing problem for one fleet size in a worker process and
+    sends back the results
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    fleet_size : int
+        The number of haulers in the fleet to solve for
+
+    routes : list
+        Routes to start the solve from (see RoutingModel.set_mip_start), or
+        None
+
+    deadline : solvers.Deadline
+        When the day's solves must be finished by
+
+    connection : multiprocessing.connection.Connection
+        Where to send the fleet size and the results of its solve
+    """
+
+    # lead a process group of our own, so cancelling the probe also stops any
+    # solver it started
+    if hasattr(os, 'setsid'):
+        os.setsid()
+
+    model = make_routing_model(fixed_parameters, variable_parameters)
+    model.deadline = deadline
+    if routes is not None:
+        model.set_mip_start(routes)
+
+    model.set_fleet_size(fleet_size)
+    connection.send((fleet_size, model.solve()))
+    connection.close()
+
+def cancel_probe(process):
+    """Stops a probe's worker process and any solver it started"""
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        # no process groups here, or the probe hasn't started its own yet
+        process.terminate()
+
+    process.join()
+
+def search_fleet_size_concurrently(fixed_parameters, variable_parameters,
+    lower_bound, upper_bound, workers, routes = None, deadline = None,
+    scan_bound = None):
+    """Finds the smallest fleet of equipment haulers that can meet a day's
+    demand, probing several fleet sizes at once in worker processes
+
+    Fleet sizes are picked to split the bracket of sizes still in question
+    as evenly as possible between the probes running. When a fleet size is
+    feasible, probes of larger fleets are cancelled, and when one is
+    infeasible (or runs out of time), probes of smaller fleets are, since
+    neither can change the answer. Probing continues until the smallest
+    feasible fleet is found or every size has been ruled out.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    lower_bound : int
+        No fleet with fewer haulers than this can meet the day's demand
+
+    upper_bound : int
+        The most haulers the fleet can have
+
+    workers : int
+        How many fleet sizes to probe at once
+
+    routes : list, optional
+        Routes to start each solve from, such as those of
+        construction.construct_routes
+
+    deadline : solvers.Deadline, optional
+        When the day's solves must be finished by
+
+    scan_bound : int, optional
+        The largest fleet trying every size from 0 up would have tried (see
+        linear_scan_bound), the upper bound if not given
+
+    Returns
+    -------
+    search : dict
+        The same as search_fleet_size, plus how many probes were cancelled
+        before they finished, which are counted as neither solved nor
+        avoided
+    """
+
+    if deadline is None:
+        deadline = Deadline()
+
+    # results of every fleet size solved, by fleet size, and the worker
+    # process and connection of each probe still running
+    solved = {}
+    running = {}
+    cancelled = 0
+
+    # largest fleet known to be infeasible and smallest known to be feasible
+    infeasible_size = lower_bound - 1
+    feasible_size = None
+
+    def untested():
+        top = upper_bound if feasible_size is None else feasible_size - 1
+        return [fleet_size for fleet_size in range(infeasible_size + 1,
+            top + 1) if fleet_size not in solved and fleet_size not in
+            running]
+
+    def launch(fleet_size):
+        receiver, sender = multiprocessing.Pipe(duplex = False)
+        process = multiprocessing.Process(target = run_probe, args = (
+            fixed_parameters, variable_parameters, fleet_size, routes,
+            deadline, sender))
+        process.start()
+        sender.close()
+        running[fleet_size] = (process, receiver)
+
+    while True:
+
+        # start probes at the sizes furthest from any size already known
+        # about or being probed
+        candidates = untested()
+        while len(running) < workers and len(candidates) > 0:
+            top = upper_bound + 1 if feasible_size is None else feasible_size
+            known = [infeasible_size, top] + list(running)
+            fleet_size = max(candidates, key = lambda size: (min([abs(size -
+                other) for other in known]), -size))
+            launch(fleet_size)
+            candidates.remove(fleet_size)
+
+        if len(running) == 0:
+            break
+
+        # wait for the next probe to finish
+        finished = None
+        while finished is None:
+            for fleet_size, (process, receiver) in sorted(running.items()):
+                if receiver.poll(0.05):
+                    finished = fleet_size
+                    break
+
+        process, receiver = running.pop(finished)
+        try:
+            fleet_size, results = receiver.recv()
+        except EOFError:
+            # the probe's process died without answering
+            fleet_size, results = finished, {'status': 'Not Solved',
+                'outcome': TIMED_OUT}
+        receiver.close()
+        process.join()
+        solved[fleet_size] = results
+
+        # a feasible fleet rules out larger ones, an infeasible one smaller
+        # ones
+        if results['status'] == 'Optimal':
+            feasible_size = fleet_size
+            stale = [size for size in running if size > fleet_size]
+        else:
+            infeasible_size = max(infeasible_size, fleet_size)
+            stale = [size for size in running if size < fleet_size]
+
+        for size in stale:
+            process, receiver = running.pop(size)
+            cancel_probe(process)
+            receiver.close()
+            cancelled += 1
+
+    # fleet sizes that ran out of time without a solution
+    timed_out = [fleet_size for fleet_size in solved if
+        solved[fleet_size]['outcome'] == TIMED_OUT]
+
+    if feasible_size is None:
+        results = None
+        outcome = TIMED_OUT if len(timed_out) > 0 else NO_SOLUTION
+    else:
+        results = solved[feasible_size]
+        outcome = results['outcome']
+
+        # a smaller fleet might have been feasible given more time
+        if len(timed_out) > 0 and min(timed_out) < feasible_size:
+            outcome = FEASIBLE_WITH_GAP
+
+    if scan_bound is None:
+        scan_bound = upper_bound
+
+    search = {
+        'fleet_size': feasible_size,
+        'results': results,
+        'outcome': outcome,
+        'ip_solves': len(solved),
+        'solves_avoided': count_solves_avoided(feasible_size, scan_bound,
+            len(solved)),
+        'probes_cancelled': cancelled
+    }
+
+    return search
@@ -1,11 +1,604 @@
 from pulp import *
 import numpy as np
+import collections
+
+from solvers import get_backend, Deadline
+from parameters import routing_engine
+
+class RoutingModel(object):
+	"""An Integer Program for determining if a given sized fleet of equipment
+	haulers can feasibly meet the demand for drop-offs and pick-ups in a
+	given day, built once per day and resized for each fleet size tested
+
+	The rows and columns belonging to each hauler (including the subset
+	constraints, which make up most of the model) are built the first time
+	that hauler is added to the fleet and kept for later probes, so growing or
+	shrinking the fleet only adds or drops whole haulers. The solution of the
+	last feasible probe is used as a warm start for the next one. Haulers are
+	only given variables for routes with a nonzero route constraint.
+
+	If the 'lazy_subtours' fixed parameter is set, the model starts with only
+	the subsets it was given (none, if make_parameters skipped enumerating
+	them) and subsets are added as solutions with routes disconnected from
+	the hub are found.
+
+	Parameters
+	----------
+	fixed_parameters : dict
+	    Parameters that are constant for any variation and region (as defined
+	    in the main function)
+
+	variable_parameters : dict
+		The parameters that vary by day but are still needed for our model
+		to run
+	"""
+
+	# solving the model proves whether or not a fleet can meet all demand
+	exact = True
+
+	def __init__(self, fixed_parameters, variable_parameters):
+
+		# instantiate parameters for equipment hauler routing problem
+		self.rate = fixed_parameters['travel_rate']
+		self.L = fixed_parameters['day_length']
+		self.handle = fixed_parameters['handle']
+
+		self.route_constraints = variable_parameters['route_constraints']
+		self.demand = variable_parameters['demand_list']
+		self.travel = variable_parameters['travel_matrix']
+		self.subsets = list(variable_parameters['subsets'])
+		self.locations = variable_parameters['locations']
+		self.customers = variable_parameters['customers']
+
+		self.subset_indices = range(len(self.subsets))
+		self.end_hub = self.locations[-1]
+
+		# A large number
+		self.M = 100
+
+		# only routes with a nonzero route constraint can be travelled, so
+		# haulers are only given variables for those
+		self.arcs = [(i, j) for i in self.locations for j in self.locations
+			if self.route_constraints[i][j] > 0]
+		self.arcs_out = dict((i, []) for i in self.locations)
+		self.arcs_in = dict((j, []) for j in self.locations)
+		for i, j in self.arcs:
+			self.arcs_out[i].append(j)
+			self.arcs_in[j].append(i)
+
+		# a route's constraint can never bind if it allows at least as many
+		# trips as the demand at either end of the route, which 2.6 already
+		# forces every trip out of or into a site to be counted against
+		self.limited_arcs = []
+		for i, j in self.arcs:
+			implied = [abs(self.demand[h]) for h in (i, j) if h in self.customers]
+			if len(implied) == 0 or self.route_constraints[i][j] < min(implied):
+				self.limited_arcs.append((i, j))
+
+		# variables, objective terms and constraints built for each hauler
+		self.hauler_blocks = {}
+
+		# haulers in the fleet currently being tested
+		self.haulers = range(0)
+
+		# values of the variables in the last feasible solution found
+		self.warm_start = {}
+
+		# whether subset constraints are only added once a solution's routes
+		# are found to be disconnected
+		self.lazy_subtours = fixed_parameters.get('lazy_subtours', False)
+
+		# the solver the model is handed to
+		self.backend = get_backend(fixed_parameters)
+
+		# when solving must be finished by; each solve may use up to half of
+		# the time left so later fleet sizes still get some
+		self.deadline = Deadline()
+
+	def set_fleet_size(self, fleet_size):
+		"""Grows or shrinks the fleet of haulers the model will be solved for
+
+		Parameters
+		----------
+		fleet_size : int
+			The number of haulers in the fleet for the next solve
+		"""
+
+		for k in range(fleet_size):
+			if k not in self.hauler_blocks:
+				self.hauler_blocks[k] = self.make_hauler_block(k)
+
+		self.haulers = range(fleet_size)
+
+	def make_hauler_block(self, k):
+		"""Creates the variables, objective terms and constraints that belong
+		to a single equipment hauler
+
+		Parameters
+		----------
+		k : int
+			The index of the hauler being added to the fleet
+
+		Returns
+		-------
+		block : dict
+			The hauler's route and subset variables, its share of the
+			objective, and its named constraints
+		"""
+
+		customers = self.customers
+		travel = self.travel
+		rate = self.rate
+		handle = self.handle
+		end_hub = self.end_hub
+		arcs_out = self.arcs_out
+		arcs_in = self.arcs_in
+
+		# Number of times a route from one site to another is run by this hauler
+		x = dict(((i, j), LpVariable('x_%s_%s_%s' % (i, j, k), lowBound = 0,
+		        upBound = None, cat = 'Integer')) for i, j in self.arcs)
+
+		# 2.1
+		# This hauler's share of the total distance traveled by all haulers
+		objective = lpSum([travel[i][j]*x[i, j] for i, j in self.arcs])
+
+		constraints = []
+
+		# 2.2
+		# Each hauler must leave the start_hub (locations[0]) each day (but can return
+		# to un/reload) but it cannot go from start_hub to start_hub
+		constraints.append(('leave_start_hub_%s' % k,
+			lpSum([x[0, j] for j in arcs_out[0] if j != 0]) >= 1))
+
+		# 2.3
+		# If a hauler goes to a site, he must also leave from that site
+		for h in customers:
+		    constraints.append(('flow_%s_%s' % (h, k),
+		    	(lpSum([x[i, h] for i in arcs_in[h]]) - lpSum([x[h, j]
+		        for j in arcs_out[h]])) == 0))
+
+		# 2.4
+		# All haulers must return to the end-of-day hub (can be same physical location
+		# as start-of-day hub)
+		constraints.append(('return_end_hub_%s' % k,
+			lpSum([x[i, end_hub] for i in arcs_in[end_hub]]) == 1))
+
+		# 2.5
+		# A hauler may only operate L hours in a day
+		# We add one handle's worth of time to workable day as we assume hauler's trailer
+		# will either be ready before day starts or not needed to be changed at end of day
+		constraints.append(('day_length_%s' % k,
+			lpSum([x[i, j]*(handle + int(travel[i][j]/rate))
+		        for i, j in self.arcs]) <= self.L + handle))
+
+		block = {
+			'x': x,
+			'y': {},
+			'objective': objective,
+			'constraints': constraints
+		}
+
+		# 2.8 - 2.9
+		for m in self.subset_indices:
+			self.add_subset_constraints(block, k, m)
+
+		return block
+
+	def add_subset_constraints(self, block, k, m):
+		"""Adds the variable and constraints forcing a hauler's routes
+		amongst a subset of customers to be connected to the rest of his routes
+
+		Parameters
+		----------
+		block : dict
+			The hauler's variables, objective terms and constraints
+
+		k : int
+			The index of the hauler
+
+		m : int
+			The index of the subset of customers
+		"""
+
+		x = block['x']
+		subset = set(self.subsets[m])
+		arcs_out = self.arcs_out
+
+		# Whether or not a subset of site locations is traveled to by this hauler
+		y = LpVariable('y_%s_%s' % (m, k), lowBound = 0, upBound = 1,
+			cat = 'Integer')
+		block['y'][m] = y
+
+		# 2.8
+		# Whether or not a hauler travels amongst a set of customers
+		block['constraints'].append(('enter_subset_%s_%s' % (m, k),
+			lpSum([x[i, j] for i in subset for j in arcs_out[i]
+			if j in subset]) <= y*self.M))
+
+		# 2.9
+		# If a hauler travels amongst a set of customers, it must leave that set
+		block['constraints'].append(('leave_subset_%s_%s' % (m, k),
+			lpSum([x[i, j] for i in subset for j in arcs_out[i]
+			if j not in subset]) >= y))
+
+	def add_subset(self, subset):
+		"""Adds a subset of customers that every hauler's routes must
+		leave if they enter it
+
+		Parameters
+		----------
+		subset : list
+			The indices of the customers in the subset
+		"""
+
+		self.subsets.append(subset)
+		m = len(self.subsets) - 1
+		self.subset_indices = range(len(self.subsets))
+
+		for k in self.hauler_blocks:
+			self.add_subset_constraints(self.hauler_blocks[k], k, m)
+
+	def travelled_arcs(self, k):
+		"""Lists the routes a hauler travels in the current solution
+
+		Parameters
+		----------
+		k : int
+			The index of the hauler
+
+		Returns
+		-------
+		arcs : list
+			The (i, j) location pairs of the routes the hauler travels
+		"""
+
+		x = self.hauler_blocks[k]['x']
+
+		return [(i, j) for i, j in self.arcs if x[i, j].varValue is not None
+			and x[i, j].varValue > 0.5]
+
+	def find_subtours(self):
+		"""Finds the groups of customers each hauler visits in the current
+		solution that are disconnected from his routes out of the hub
+
+		Returns
+		-------
+		subtours : list
+			Lists of customer indices, one for each disconnected group of
+			routes, that aren't already subsets in the model
+		"""
+
+		subtours = []
+		known = set(tuple(sorted(subset)) for subset in self.subsets)
+
+		for k in self.haulers:
+
+			# the locations each of this hauler's travelled routes connects
+			neighbors = collections.defaultdict(set)
+			for i, j in self.travelled_arcs(k):
+				neighbors[i].add(j)
+				neighbors[j].add(i)
+
+			# everything reachable from the hubs is connected to the day's start
+			unreached = set(neighbors)
+			stack = [h for h in (self.locations[0], self.end_hub) if h in unreached]
+			while len(stack) > 0:
+				h = stack.pop()
+				if h in unreached:
+					unreached.remove(h)
+					stack.extend(neighbors[h] & unreached)
+
+			# whatever is left is split into its separate subtours
+			while len(unreached) > 0:
+				component = set()
+				stack = [unreached.pop()]
+				while len(stack) > 0:
+					h = stack.pop()
+					component.add(h)
+					stack.extend(neighbors[h] & unreached)
+					unreached -= neighbors[h]
+
+				subtour = tuple(sorted(component))
+				if subtour not in known:
+					known.add(subtour)
+					subtours.append(list(subtour))
+
+		return subtours
+
+	def make_problem(self):
+		"""Assembles the PuLP problem for the fleet currently being tested from
+		the haulers' prebuilt blocks
+
+		Returns
+		-------
+		prob : pulp.LpProblem
+			The equipment hauler routing problem for the current fleet
+		"""
+
+		haulers = self.haulers
+		blocks = self.hauler_blocks
+
+		# Create a variable, "prob", to contain our problem data
+		prob = LpProblem("morton_function_4", LpMinimize)
+
+		# 2.1
+		# Objective is to minimize total distance traveled by all haulers
+		prob += lpSum([blocks[k]['objective'] for k in haulers])
+
+		# 2.2 - 2.5, 2.8 - 2.9
+		for k in haulers:
+			for name, constraint in blocks[k]['constraints']:
+				prob += constraint, name
+
+		# 2.6
+		# Each site's demand for dropped-off/picked-up equipment sets must be met
+		for i in self.customers:
+		    prob += lpSum([blocks[k]['x'][i, j] for j in self.arcs_out[i]
+		    	for k in haulers]) == abs(self.demand[i]), 'demand_%s' % i
+
+		# 2.7
+		# Haulers are limited by how many times a given route between two sites
+		# can be traveled (routes that can't be traveled have no variables, and
+		# routes whose limit is implied by 2.6 need no row)
+		for i, j in self.limited_arcs:
+		    prob += lpSum([blocks[k]['x'][i, j] for k in haulers]) \
+		    	<= self.route_constraints[i][j], 'route_%s_%s' % (i, j)
+
+		return prob
+
+	def presolve_report(self):
+		"""Counts the variables and rows left out of the model for the fleet
+		currently being tested because their routes can't be travelled or their
+		route constraints can never bind
+
+		Returns
+		-------
+		report : dict
+			The number of variables and rows in the model, and how many were
+			removed compared to giving every hauler every route
+		"""
+
+		num_locations = len(self.locations)
+		num_haulers = len(self.haulers)
+		num_subsets = len(self.subsets)
+		num_customers = len(self.customers)
+
+		# rows for 2.2 - 2.5 and 2.8 - 2.9 belong to each hauler
+		hauler_rows = 3 + num_customers + 2*num_subsets
+
+		variables = (len(self.arcs) + num_subsets)*num_haulers
+		rows = hauler_rows*num_haulers + num_customers + len(self.limited_arcs)
+
+		dense_variables = (num_locations**2 + num_subsets)*num_haulers
+		dense_rows = hauler_rows*num_haulers + num_customers + num_locations**2
+
+		report = {
+			'variables': variables,
+			'rows': rows,
+			'variables_removed': dense_variables - variables,
+			'rows_removed': dense_rows - rows
+		}
+
+		return report
+
+	def set_initial_values(self):
+		"""Seeds the variables of the current fleet with the last feasible
+		solution found
+
+		Haulers that were not part of that solution are started on the route
+		from the start-of-day hub straight to the end-of-day hub, which is
+		equivalent to not being used.
+		"""
+
+		for k in self.haulers:
+			x = self.hauler_blocks[k]['x']
+			y = self.hauler_blocks[k]['y']
+
+			for i, j in self.arcs:
+				if x[i, j].name in self.warm_start:
+					x[i, j].setInitialValue(self.warm_start[x[i, j].name])
+				elif i == self.locations[0] and j == self.end_hub:
+					x[i, j].setInitialValue(1)
+				else:
+					x[i, j].setInitialValue(0)
+
+			for m in self.subset_indices:
+				y[m].setInitialValue(self.warm_start.get(y[m].name, 0))
+
+	def set_mip_start(self, routes):
+		"""Uses routes found outside of the model, such as by
+		construction.construct_routes, as the solution to start the next solve
+		from
+
+		Parameters
+		----------
+		routes : list
+			The number of times each hauler takes each route, by the (i, j)
+			locations of the route
+		"""
+
+		warm_start = {}
+
+		for k, arcs in enumerate(routes):
+			for i, j in self.arcs:
+				warm_start['x_%s_%s_%s' % (i, j, k)] = arcs.get((i, j), 0)
+
+			# a hauler enters a subset if he travels any route within it
+			for m in self.subset_indices:
+				subset = set(self.subsets[m])
+				inside = any([i in subset and j in subset for i, j in arcs])
+				warm_start['y_%s_%s' % (m, k)] = int(inside)
+
+		self.warm_start = warm_start
+
+	def solve(self, relax = False):
+		"""Solves the routing problem for the fleet currently being tested
+
+		Parameters
+		----------
+		relax : bool, optional
+			Whether to solve only the LP relaxation of the problem, which is
+			much faster and infeasible whenever the full problem is
+
+		Returns
+		-------
+		results : dict
+			Returns whether or not the IP found a solution and whether it is
+			optimal, feasible with a gap or timed out, the total number of
+			miles run by the fleet, the number of times each hauler ran each
+			route ('x', by i, j and hauler) and entered each subset ('y', by
+			subset and hauler), and how much smaller the model was made by
+			leaving out untravelable routes.
+		"""
+
+		# number of times subset constraints were added for disconnected routes
+		cut_rounds = 0
+
+		while True:
+			status, objective, outcome = self.solve_problem(relax)
+
+			# without every subset constraint, an optimal solution can still
+			# have routes disconnected from the hub; cut those off and resolve
+			if not self.lazy_subtours or relax or status != 'Optimal':
+				break
+
+			subtours = self.find_subtours()
+			if len(subtours) == 0:
+				break
+
+			for subset in subtours:
+				self.add_subset(subset)
+			cut_rounds += 1
+
+		x, y = self.solution_arrays()
+
+		results = {
+			'status': status,
+			'outcome': outcome,
+			'objective': objective,
+			'x': x,
+			'y': y,
+			'presolve': self.presolve_report(),
+			'cut_rounds': cut_rounds
+		}
+
+		return results
+
+	def solve_problem(self, relax):
+		"""Builds and solves the PuLP problem for the fleet currently being
+		tested once
+
+		Parameters
+		----------
+		relax : bool
+			Whether to solve only the LP relaxation of the problem
+
+		Returns
+		-------
+		status : str
+			The solver's status for the problem
+
+		objective : float
+			The total number of miles run by the fleet
+
+		outcome : str
+			Whether the solution is optimal, feasible with a gap, timed out
+			without a solution, or proven not to exist
+		"""
+
+		prob = self.make_problem()
+
+		warm_start = len(self.warm_start) > 0 and not relax
+		if warm_start:
+			self.set_initial_values()
+
+		# The problem is solved by the chosen backend
+		status, objective, outcome = self.backend.solve_problem(prob, relax,
+			warm_start, self.deadline.share(2))
+
+		# keep this solution to warm start the next fleet size tested
+		if status == 'Optimal' and not relax:
+			self.warm_start = dict((v.name, v.varValue) for v in prob.variables())
+
+		self.prob = prob
+
+		return status, objective, outcome
+
+	def solution_arrays(self):
+		"""Gathers the last solution into arrays by location and hauler
+
+		Returns
+		-------
+		x : numpy.ndarray
+			The number of times each hauler travels each route, indexed by the
+			route's (i, j) locations then the hauler
+
+		y : numpy.ndarray
+			Whether or not each hauler enters each subset, indexed by subset
+			then hauler
+		"""
+
+		num_locations = len(self.locations)
+		x = np.zeros((num_locations, num_locations, len(self.haulers)))
+		y = np.zeros((len(self.subsets), len(self.haulers)))
+
+		if len(self.arcs) == 0:
+			return x, y
+
+		tails, heads = np.array(self.arcs, dtype=int).T
+
+		# variables the solver gave no value to are counted as never travelled
+		for k in self.haulers:
+			block = self.hauler_blocks[k]
+			x[tails, heads, k] = [block['x'][i, j].varValue or 0 for i, j in
+				self.arcs]
+			y[:, k] = [block['y'][m].varValue or 0 for m in self.subset_indices]
+
+		return x, y
+
+def make_routing_model(fixed_parameters, variable_parameters):
+	"""Creates the day's routing model with the builder named by the
+	'model_builder' fixed parameter, or the search that replaces it on days
+	routing_engine picks it for
+
+	Parameters
+	----------
+	fixed_parameters : dict
+	    Parameters that are constant for any variation and region (as defined
+	    in the main function)
+
+	variable_parameters : dict
+		The parameters that vary by day but are still needed for our model
+		to run
+
+	Returns
+	-------
+	model : RoutingModel
+		A RoutingModel built with PuLP ('pulp', the default), a
+		MatrixRoutingModel built from sparse arrays ('matrix'), or an
+		AlnsRoutingModel
+	"""
+
+	if routing_engine(fixed_parameters,
+		variable_parameters['customers']) == 'alns':
+		from routing_alns import AlnsRoutingModel
+		return AlnsRoutingModel(fixed_parameters, variable_parameters)
+
+	if fixed_parameters.get('model_builder', 'pulp') == 'matrix':
+		# the matrix builder needs scipy, so only import it when asked for
+		from routing_matrix import MatrixRoutingModel
+		return MatrixRoutingModel(fixed_parameters, variable_parameters)
+
+	return RoutingModel(fixed_parameters, variable_parameters)
 
 def route_fleet(fixed_parameters, variable_parameters, haulers):
 	"""An Integer Program for determining if a given sized fleet of equipment
 	haulers can feasibly meet the demand for drop-offs and pick-ups in a
 	given day
 
+	Builds a routing model for just this fleet. When testing several fleet
+	sizes for the same day, reuse one model from make_routing_model instead.
+
 	Parameters
 	----------
 	fixed_parameters : dict
@@ -24,109 +617,13 @@ def route_fleet(fixed_parameters, variable_parameters, haulers):
 	results : dict
 		Returns whether or not the IP solved to optimality, the total number
 		of miles run by the fleet, and the number of times each hauler ran
-		each route available to be travelled this day.
+		each route available to be travelled this day as an array 'x' indexed
+		by i, j and hauler (with 'y', whether each hauler entered each
+		subset, indexed by subset and hauler).
 
 	"""
 
-	# instantiate parameters for equipment hauler routing problem
-	rate = fixed_parameters['travel_rate']
-	L = fixed_parameters['day_length']
-	handle = fixed_parameters['handle']
-
-	route_constraints = variable_parameters['route_constraints']
-	demand = variable_parameters['demand_list']
-	travel = variable_parameters['travel_matrix']
-	subsets = variable_parameters['subsets']
-	locations = variable_parameters['locations']
-	customers = variable_parameters['customers']
-
-	subset_indices = range(len(subsets))
-	end_hub = locations[-1]
-
-	# A large number
-	M = 100
-
-	# Create a variable, "prob", to contain our problem data
-	prob = LpProblem("morton_function_4", LpMinimize)
-
-	# Create problem variables
-	# Number of times a route from one site to another is run by a given hauler 
-	x = LpVariable.dicts('x', (locations,locations,haulers), lowBound = 0,
-	        upBound = None, cat = 'Integer')
-
-	# Whether or not a subset of site locations is traveled to by a given hauler
-	y = LpVariable.dicts('y', (subset_indices,haulers), lowBound = 0, upBound = 1,
-		cat = 'Integer')	
-
-	# 2.1
-	# Objective is to minimize total distance traveled by all haulers
-	prob += lpSum([lpSum([lpSum([travel[i][j]*x[i][j][k] for k in haulers])
-	    for j in locations]) for i in locations])
-
-	# 2.2
-	# Each hauler must leave the start_hub (locations[0]) each day (but can return
-	# to un/reload) but it cannot go from start_hub to start_hub
-	for k in haulers:
-	    prob += lpSum([x[0][j][k] for j in list(set(locations)-set([0]))]) >= 1,''
-
-	# 2.3
-	# If a hauler goes to a site, he must also leave from that site
-	for h in customers:
-	    for k in haulers:
-	        prob += (lpSum([x[i][h][k] for i in locations]) - lpSum([x[h][j][k]
-	            for j in locations])) == 0,''
-
-	# 2.4
-	# All haulers must return to the end-of-day hub (can be same physical location
-	# as start-of-day hub)
-	for k in haulers:
-	    prob += lpSum([x[i][end_hub][k] for i in locations]) == 1,''
-
-	# 2.5
-	# A hauler may only operate L hours in a day
-	# We add one handle's worth of time to workable day as we assume hauler's trailer
-	# will either be ready before day starts or not needed to be changed at end of day 
-	for k in haulers:
-	    prob += lpSum([lpSum([x[i][j][k]*(handle + int(travel[i][j]/rate))
-	        for i in locations]) for j in locations]) <= L + handle,''
-
-	# 2.6
-	# Each site's demand for dropped-off/picked-up equipment sets must be met
-	for i in customers:
-	    prob += lpSum([lpSum([x[i][j][k] for j in locations]) for k in haulers]) \
-	            == abs(demand[i]),''
-
-	# 2.7
-	# Haulers are limited by how many times a given route between two sites
-	# can be traveled
-	for i in locations:
-	    for j in locations:
-	        prob += lpSum([x[i][j][k] for k in haulers]) <= route_constraints[i][j],''
-	
-	# 2.8
-	# Whether or not a hauler travels amongst a set of customers
-	for k in haulers:
-		for m in subset_indices:
-			prob += lpSum([lpSum([x[i][j][k] for i in subsets[m]])
-				for j in subsets[m]]) <= y[m][k]*M
-	
-	# 2.9
-	# If a hauler travels amongst a set of customers, it must leave that set
-	for k in haulers:
-	    for m in subset_indices:
-	        prob += lpSum([lpSum([x[i][j][k] for i in subsets[m]]) for j
-	        	in list(set(locations)-set(subsets[m]))]) >= y[m][k],''
-	
-	# The problem data is written to an lp file
-	prob.writeLP('morton_toy_problem.lp')
-
-	# The problem is solved using PuLP's choice of Solver
-	prob.solve()
-
-	results = {
-		'status': LpStatus[prob.status],
-		'objective': value(prob.objective),
-		'variables': prob.variables()
-	}
-
-	return results
+	model = make_routing_model(fixed_parameters, variable_parameters)
+	model.set_fleet_size(len(haulers))
+
+	return model.solve()
@@ -2,13 +2,247 @@ import numpy as np
 import pandas as pd
 import datetime
 import collections
-
-from parameters import make_parameters
-from hauler_routing import route_fleet
+import multiprocessing
+import hashlib
+
+from parameters import make_parameters, load_site_distances
+from hauler_routing import make_routing_model
+from construction import construct_routes
+from fleet_search import (time_lower_bound, relaxation_lower_bound,
+    linear_scan_bound, search_fleet_size, search_fleet_size_concurrently)
 from recording import record_fleet_mileage, record_hauler_hours
 
 from smoothing import smooth_demand
-from reporting import make_report
+from solvers import get_backend, Deadline, TIMED_OUT
+from reporting import make_report, ReportTotals
+from checkpoints import CheckpointStore
+from memo import get_cache, fingerprint, LruCache
+
+def search_day(fixed_parameters, variable_parameters, daily_inputs):
+    """Builds a day's routing model and searches it for the smallest fleet
+    that meets the day's demand
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    daily_inputs : dict
+        The day's inputs, which may include a 'fleet_hint' and a 'deadline'
+        (see solve_day)
+
+    Returns
+    -------
+    day_search : dict
+        The fleet size search (see fleet_search.search_fleet_size), the
+        lower and upper bounds it searched between, the fleet the
+        constructed routes used, whether the model was exact and how many LP
+        relaxations were solved
+    """
+
+    # use the smaller of the day's pick-ups and drop-offs and the fleet upper
+    # bound for best run time, as far as trying every fleet size would go
+    scan_bound = linear_scan_bound(fixed_parameters, variable_parameters)
+    upper_bound = scan_bound
+
+    # build the routing model once and resize it for each fleet size tested
+    model = make_routing_model(fixed_parameters, variable_parameters)
+    model.deadline = daily_inputs.get('deadline', model.deadline)
+
+    # quickly built routes give a fleet size known to be feasible, which
+    # no larger fleet needs to be searched beyond, and a solution for the
+    # integer programs to start from
+    construction = construct_routes(fixed_parameters, variable_parameters)
+    construction_fleet = None
+    if construction is not None:
+        construction_fleet = construction['fleet_size']
+        upper_bound = min(upper_bound, construction_fleet)
+        model.set_mip_start(construction['routes'])
+
+    # fleets without the time to meet all demand, or whose LP relaxation
+    # is infeasible, never need to be solved as integer programs
+    lower_bound = time_lower_bound(fixed_parameters, variable_parameters)
+    lp_solves = 0
+    if model.exact:
+        lower_bound, lp_solves = relaxation_lower_bound(model, lower_bound,
+            upper_bound)
+
+    # find the smallest feasible fleet, starting from the hint if given.
+    # A search can't prove fleets infeasible, so rather than spending its
+    # time on fleets that are likely too small, it starts from one known
+    # to be feasible and works down
+    fleet_hint = daily_inputs.get('fleet_hint')
+    if not model.exact and fleet_hint is None:
+        fleet_hint = upper_bound
+
+    # several fleet sizes can be probed at once, except by a worker
+    # already solving days in parallel, which can't start processes
+    probe_workers = fixed_parameters.get('probe_workers', 1)
+    if probe_workers > 1 and not multiprocessing.current_process().daemon:
+        routes = None
+        if construction is not None:
+            routes = construction['routes']
+        search = search_fleet_size_concurrently(fixed_parameters,
+            variable_parameters, lower_bound, upper_bound, probe_workers,
+            routes, model.deadline, scan_bound)
+    else:
+        search = search_fleet_size(model, lower_bound, upper_bound, fleet_hint,
+            scan_bound)
+
+    day_search = {
+        'search': search,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound,
+        'construction_fleet': construction_fleet,
+        'exact': model.exact,
+        'lp_solves': lp_solves
+    }
+
+    return day_search
+
+def memoized_search_day(fixed_parameters, variable_parameters, daily_inputs):
+    """Searches a day's routing problem for the smallest fleet as search_day
+    does, unless the same problem has been searched before
+
+    Days routing the same demand over the same miles share a search (see
+    routing_fingerprint), so it's only built and solved once.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    daily_inputs : dict
+        The day's inputs, which may include a 'fleet_hint' and a 'deadline'
+        (see solve_day)
+
+    Returns
+    -------
+    day_search : dict
+        The search and its bounds (see search_day)
+
+    memoized : bool
+        Whether the search was found rather than run
+    """
+
+    cache = get_cache('routing', fixed_parameters)
+    key = routing_fingerprint(fixed_parameters, variable_parameters,
+        daily_inputs)
+
+    day_search = cache.get(key)
+    if day_search is not None:
+        return day_search, True
+
+    day_search = search_day(fixed_parameters, variable_parameters,
+        daily_inputs)
+
+    # a search that ran out of time might do better given more
+    if day_search['search']['outcome'] != TIMED_OUT:
+        cache.put(key, day_search)
+
+    return day_search, False
+
+def search_component(component_inputs):
+    """Searches the routing problem of one group of a day's sites, in this
+    process or a worker (see search_decomposed_day)"""
+
+    fixed_parameters, variable_parameters, daily_inputs = component_inputs
+
+    return memoized_search_day(fixed_parameters, variable_parameters,
+        daily_inputs)
+
+def search_decomposed_day(fixed_parameters, variable_parameters, daily_inputs):
+    """Searches a day's routing problem for the smallest fleet by splitting
+    its sites into groups, searching each on its own and merging the results
+
+    With a 'decomposition' of 'exact', the groups are those no hauler can
+    serve two of in a day (see decomposition.find_components), so the merged
+    fleet and miles are the same as searching the whole day at once. With
+    'clusters', groups larger than 'cluster_size' sites are further split
+    into clusters of nearby sites, which is faster for large days but only
+    gives a feasible fleet. The groups are searched in 'component_workers'
+    processes at once, if more than one.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    daily_inputs : dict
+        The day's inputs, which may include a 'fleet_hint' and a 'deadline'
+        (see solve_day)
+
+    Returns
+    -------
+    day_search : dict
+        The search and its bounds (see search_day), with how many groups
+        the day was split into
+
+    memoized : bool
+        Whether every group's search was found rather than run
+    """
+
+    # splitting days needs scipy, so only import it when asked for
+    from decomposition import (find_components, cluster_components,
+        component_parameters, merge_searches)
+
+    approximate = fixed_parameters['decomposition'] == 'clusters'
+
+    components = find_components(fixed_parameters, variable_parameters)
+    if approximate:
+        components = cluster_components(variable_parameters, components,
+            fixed_parameters.get('cluster_size', 10))
+
+    # a day that doesn't split is searched whole
+    if len(components) < 2:
+        return memoized_search_day(fixed_parameters, variable_parameters,
+            daily_inputs)
+
+    # the day's fleet hint doesn't apply to any one group, and each group
+    # gets an equal share of the day's time
+    deadline = daily_inputs.get('deadline', Deadline())
+    component_inputs = []
+    indices = []
+    for component in components:
+        parameters, index = component_parameters(fixed_parameters,
+            variable_parameters, component)
+        inputs = {'deadline': deadline.split(len(components))}
+        component_inputs.append((fixed_parameters, parameters, inputs))
+        indices.append(index)
+
+    # groups can be searched at once, except by a worker already solving
+    # days in parallel, which can't start processes
+    workers = min(fixed_parameters.get('component_workers', 1),
+        len(components))
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        pool = multiprocessing.Pool(workers)
+        try:
+            searches = pool.map(search_component, component_inputs)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        searches = [search_component(inputs) for inputs in component_inputs]
+
+    day_search = merge_searches(fixed_parameters, variable_parameters,
+        indices, [search for search, memoized in searches], approximate)
+
+    return day_search, all([memoized for search, memoized in searches])
 
 def solve_day(fixed_parameters, daily_inputs):
     """Determine the usage of semi-trucks and equipment haulers for a given day.
@@ -26,7 +260,12 @@ def solve_day(fixed_parameters, daily_inputs):
 
     daily_inputs : dict
         inputs needed each day to make remaining parameters and record the
-        outputs of our routing model
+        outputs of our routing model. May include a 'fleet_hint', a fleet size
+        to start searching from, such as the previous day's fleet, a
+        'deadline' the day's solves must be finished by, 'site_distances',
+        the miles between all sites made once for the horizon, and the
+        'column' of fleet_mileage and hauler_hours to record the day in, if
+        not its date_index
 
     Returns
     -------
@@ -39,6 +278,11 @@ def solve_day(fixed_parameters, daily_inputs):
     hauler_routes : OrderedDict
         What routes each hauler took each day
 
+    fleet_searches : list
+        The minimum fleet size found each day, whether it and its routes are
+        optimal, feasible with a gap or timed out, and how many LP and IP
+        solves were needed to find it
+
     """
 
     # make the remaining parameters used to solve a day's equipment hauler routing
@@ -50,81 +294,602 @@ def solve_day(fixed_parameters, daily_inputs):
     handle = fixed_parameters['handle']
     
     date_index = daily_inputs['date_index']
+    column = daily_inputs.get('column', date_index)
     fleet_mileage = daily_inputs['fleet_mileage']
     hauler_hours = daily_inputs['hauler_hours']
     hauler_routes = daily_inputs['hauler_routes']
+    fleet_searches = daily_inputs['fleet_searches']
     daily_demand = daily_inputs['daily_demand']
 
     demand_list = variable_parameters['demand_list']
     locations = variable_parameters['locations']
     travel_matrix = variable_parameters['travel_matrix']
 
-    # start fleet size at 0 and increment until feasible
-    fleet_size = 0
-    
-    # boolean stating if problem can be solved for given sized fleet
-    feasible = False
-
     # if our demand_list includes more than our "start-of-day" hub and
     # "end-of-day" hub, we have demand for equipment haulers and solve
     # routing problem
     if len(demand_list)>2:
-        abs_demand_list = np.absolute(demand_list)
-        pickups = np.sum(abs_demand_list[1:-1])
-        
-        # use the smaller of two values for best run time
-        upper_bound = min(pickups, fleet_upper_bound)
-
-        while fleet_size <= upper_bound and not feasible: 
-            # create a list of equipment haulers as our last parameter
-            haulers = range(fleet_size)
-
-            # this solves the equipment hauler routing problem
-            results = route_fleet(fixed_parameters, variable_parameters, haulers)      
-            
+        # if asked, split the day into groups of sites no hauler can serve
+        # two of and search each on its own
+        if fixed_parameters.get('decomposition') in ('exact', 'clusters'):
+            day_search, memoized = search_decomposed_day(fixed_parameters,
+                variable_parameters, daily_inputs)
+        else:
+            day_search, memoized = memoized_search_day(fixed_parameters,
+                variable_parameters, daily_inputs)
+
+        search = day_search['search']
+        lower_bound = day_search['lower_bound']
+        upper_bound = day_search['upper_bound']
+        construction_fleet = day_search['construction_fleet']
+        exact = day_search['exact']
+        lp_solves = day_search['lp_solves']
+        fleet_size = search['fleet_size']
+
+        fleet_searches.append(('day %s' % (date_index + 1), {
+            'fleet_size': fleet_size,
+            'outcome': search['outcome'],
+            'lower_bound': lower_bound,
+            'upper_bound': upper_bound,
+            'construction_fleet': construction_fleet,
+            'exact': exact,
+            'lp_solves': lp_solves,
+            'ip_solves': search['ip_solves'],
+            'solves_avoided': search['solves_avoided'],
+            'probes_cancelled': search.get('probes_cancelled', 0),
+            'components': search.get('components', 1),
+            'memoized': memoized
+        }))
+
+        if fleet_size is not None:
+            results = search['results']
+
             status = results['status']
             objective = results['objective']
-            variables = results['variables']
-
-            # don't record a mileage for a given size fleet if infeasible
-            if status == 'Infeasible' or status == 'Undefined':
-                fleet_mileage[fleet_size, date_index] = np.nan
-                
-            elif status == 'Optimal':
-                feasible = True
-                
-                # record mileage run by fleet
-                fleet_mileage = record_fleet_mileage(fleet_size, date_index,
-                    fleet_mileage, objective, fleet_upper_bound)
-                
-                # record hours that each hauler in fleet works
-                hauler_hours, hauler_routes  = record_hauler_hours(hauler_hours,
-                    hauler_routes, variables, handle, travel_rate, fleet_size,
-                    date_index, locations, travel_matrix, daily_demand)
-                
-                print('trucks, status, objective = %s, %s, %s' % (fleet_size, status,
-                    objective))
-
-            # if we reach upper bound still infeasible, large negative number
-            # will make it easy to find
-            if not feasible and fleet_size == upper_bound:
-                print('trucks, status = %s, %s' % (fleet_size, status))
-                objective_matrix[fleet_size, date_index] = -9999999
-
-            fleet_size = fleet_size + 1
+            x = results['x']
+
+            # don't record a mileage for any fleet too small to be feasible
+            fleet_mileage[:fleet_size, column] = np.nan
+
+            # record mileage run by fleet
+            fleet_mileage = record_fleet_mileage(fleet_size, column,
+                fleet_mileage, objective, fleet_upper_bound)
+            
+            # record hours that each hauler in fleet works
+            hauler_hours, hauler_routes  = record_hauler_hours(hauler_hours,
+                hauler_routes, x, handle, travel_rate, date_index, locations,
+                travel_matrix, daily_demand, column)
+            
+            print('trucks, status, objective = %s, %s, %s' % (fleet_size,
+                search['outcome'], objective))
+
+            # a day split into groups may have been routed both ways
+            if 'presolve' in results:
+                presolve = results['presolve']
+                print('presolve removed %s of %s variables and %s of %s rows' % (
+                    presolve['variables_removed'], presolve['variables'] +
+                    presolve['variables_removed'], presolve['rows_removed'],
+                    presolve['rows'] + presolve['rows_removed']))
+            if 'search' in results:
+                print('search ran %s iterations, best found on %s' % (
+                    results['search']['iterations'],
+                    results['search']['best_iteration']))
+
+        # if we reach upper bound still infeasible, large negative number
+        # will make it easy to find
+        else:
+            print('trucks, status = %s, %s' % (upper_bound, search['outcome']))
+            fleet_mileage[:upper_bound, column] = np.nan
+            fleet_mileage[upper_bound, column] = -9999999
+
+        print('fleet search: %s IP solves, %s avoided, construction used %s' % (
+            search['ip_solves'], search['solves_avoided'], construction_fleet))
     
     # if we do not have any sites with demand (aka len(demand_list) = 2)
     # print the following and move to next day
     else:
         print('No Demand!')
             
-    return fleet_mileage, hauler_hours, hauler_routes
+    return fleet_mileage, hauler_hours, hauler_routes, fleet_searches
 
-def solve_horizon(fixed_parameters, demand_df):
-    """ Find truck, hauler, and equipment usages for all days in our range.
+# the fixed parameters and miles between sites each worker process of a
+# parallel horizon is given once, when it starts
+worker_inputs = {}
 
-    Finds and smoothes delivery demand for all days. Determines day by day
-    usage of all assets. Creates report detailing usage over whole range.
+# results of the days this process has solved most recently, by the
+# fingerprint of their inputs, so a resubmitted horizon only re-solves the
+# days that changed
+solved_days = LruCache(4096)
+
+# fixed parameters that don't change how a day is routed, so are left out of
+# its fingerprint
+UNROUTED_PARAMETERS = ('start_date', 'end_date', 'window', 'directory_name',
+    'site_df', 'horizon_time_limit', 'day_workers', 'probe_workers',
+    'reuse_days', 'checkpoint_dir', 'memo_size', 'memo_dir',
+    'component_workers', 'smoothing_engine', 'smoothing_periods',
+    'smoothing_workers')
+
+def start_day_worker(fixed_parameters):
+    """Readies a worker process to solve days of a horizon in parallel
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+    """
+
+    worker_inputs['fixed_parameters'] = fixed_parameters
+    worker_inputs['site_distances'] = load_site_distances(fixed_parameters)
+
+def solve_one_day(fixed_parameters, daily_inputs):
+    """Solves one day of a horizon, recording it apart from every other day
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    daily_inputs : dict
+        The date, its index and its demand, and optionally a 'fleet_hint',
+        'deadline' and 'site_distances' (see solve_day)
+
+    Returns
+    -------
+    day : dict
+        The date and its index, the number of haulers needed (0 without
+        demand, None if no fleet could meet it), the day's column of
+        fleet_mileage ('mileage') and of hauler_hours ('hours'), and the
+        routes and fleet search it recorded ('hauler_routes',
+        'fleet_searches', empty without demand)
+    """
+
+    fleet_upper_bound = fixed_parameters['fleet_upper_bound']
+
+    daily_inputs = dict(daily_inputs)
+    daily_inputs.update({
+        'fleet_mileage': np.zeros((fleet_upper_bound + 1, 1)),
+        'hauler_hours': np.zeros((fleet_upper_bound + 1, 1)),
+        'hauler_routes': [],
+        'fleet_searches': [],
+        'column': 0
+    })
+
+    fleet_mileage, hauler_hours, hauler_routes, fleet_searches = \
+        solve_day(fixed_parameters, daily_inputs)
+
+    fleet_size = 0
+    if len(fleet_searches) > 0:
+        fleet_size = fleet_searches[0][1]['fleet_size']
+
+    day = {
+        'date': daily_inputs['date'],
+        'date_index': daily_inputs['date_index'],
+        'fleet_size': fleet_size,
+        'mileage': fleet_mileage[:, 0],
+        'hours': hauler_hours[:, 0],
+        'hauler_routes': hauler_routes,
+        'fleet_searches': fleet_searches
+    }
+
+    return day
+
+def solve_day_in_worker(daily_inputs):
+    """Solves one day of a horizon in a worker process (see solve_one_day)"""
+
+    daily_inputs = dict(daily_inputs)
+    daily_inputs['site_distances'] = worker_inputs['site_distances']
+
+    return solve_one_day(worker_inputs['fixed_parameters'], daily_inputs)
+
+def day_fingerprint(fixed_parameters, daily_inputs):
+    """Fingerprints everything a day is routed from: its smoothed demand, the
+    coordinates of its sites and hubs, the fleet size hint it starts from and
+    the fixed parameters that affect routing
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    daily_inputs : dict
+        The day's demand and fleet hint, if any (see solve_day)
+
+    Returns
+    -------
+    fingerprint : str
+        A digest that only days with the same inputs share
+    """
+
+    site_df = fixed_parameters['site_df']
+    daily_demand = daily_inputs['daily_demand']
+
+    # the day's locations, hubs first and last as in make_travel_matrix
+    site_numbers = site_df['Project #'].values
+    locations = ([site_numbers[0]] + daily_demand.index.tolist() +
+        [site_numbers[-1]])
+    index = pd.Index(site_numbers).get_indexer(locations)
+    coordinates = site_df[['Lat', 'Long']].values.astype(float)[index]
+    coordinates[index < 0] = np.nan
+
+    parameters = sorted([(key, value) for key, value in
+        fixed_parameters.items() if key not in UNROUTED_PARAMETERS])
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(repr((parameters,
+        daily_inputs.get('fleet_hint'))).encode('utf-8'))
+    fingerprint.update(np.asarray(locations, dtype=float).tobytes())
+    fingerprint.update(daily_demand.values.astype(float).tobytes())
+    fingerprint.update(coordinates.tobytes())
+
+    return fingerprint.hexdigest()
+
+def routing_fingerprint(fixed_parameters, variable_parameters, daily_inputs):
+    """Fingerprints a day's routing problem: the signed demand of each
+    location, the miles between them, the fleet size hint it starts from and
+    the fixed parameters that affect routing
+
+    Days at different sites with the same demand and the same miles between
+    them share a fingerprint, as they are the same routing problem.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    daily_inputs : dict
+        The day's inputs, which may include a 'fleet_hint'
+
+    Returns
+    -------
+    fingerprint : str
+        A digest that only the same routing problems share
+    """
+
+    parameters = sorted([(key, value) for key, value in
+        fixed_parameters.items() if key not in UNROUTED_PARAMETERS])
+
+    return fingerprint('routing', parameters, daily_inputs.get('fleet_hint'),
+        np.asarray(variable_parameters['demand_list'], dtype=float),
+        np.asarray(variable_parameters['travel_matrix'], dtype=float))
+
+def reuse_day(day, date, date_index):
+    """Copies a day solved before for another date with the same inputs
+
+    Parameters
+    ----------
+    day : dict
+        The results of the day solved before (see solve_one_day)
+
+    date : str
+        The date being solved
+
+    date_index : int
+        The index of the date being solved
+
+    Returns
+    -------
+    day : dict
+        The same results, labelled with the date being solved
+    """
+
+    name = 'day %s' % (date_index + 1)
+
+    day = dict(day)
+    day.update({
+        'date': date,
+        'date_index': date_index,
+        'mileage': day['mileage'].copy(),
+        'hours': day['hours'].copy(),
+        'hauler_routes': [(name, routes) for label, routes in
+            day['hauler_routes']],
+        'fleet_searches': [(name, dict(search)) for label, search in
+            day['fleet_searches']],
+        'recomputed': False
+    })
+
+    return day
+
+def finished_day(day):
+    """Whether none of a day's fleet searches ran out of time, so its results
+    would be the same given more and can be reused
+
+    Parameters
+    ----------
+    day : dict
+        The results of the day (see solve_one_day)
+
+    Returns
+    -------
+    finished : bool
+        Whether no fleet search of the day timed out
+    """
+
+    return all([search['outcome'] != TIMED_OUT for name, search in
+        day['fleet_searches']])
+
+def open_checkpoints(fixed_parameters):
+    """Opens the store days are checkpointed to, if one is asked for by
+    'checkpoint_dir'
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    Returns
+    -------
+    checkpoints : checkpoints.CheckpointStore
+        The store, or None if days aren't checkpointed
+    """
+
+    checkpoint_dir = fixed_parameters.get('checkpoint_dir')
+    if checkpoint_dir is None:
+        return None
+
+    return CheckpointStore(checkpoint_dir)
+
+def find_solved_day(fingerprint, reuse_days, checkpoints):
+    """Looks for a day solved before with the same inputs, by this process or
+    by any run checkpointing to the same store
+
+    Checkpoints of days that ran out of time, which stores written before
+    those were left out can still hold, are solved again rather than
+    resumed from.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The fingerprint of the day's inputs, or None if it has none
+
+    reuse_days : bool
+        Whether to look among the days this process has solved
+
+    checkpoints : checkpoints.CheckpointStore
+        The store days are checkpointed to, or None
+
+    Returns
+    -------
+    day : dict
+        The results of the day solved before (see solve_one_day), or None
+    """
+
+    if fingerprint is None:
+        return None
+
+    if reuse_days:
+        day = solved_days.get(fingerprint)
+        if day is not None:
+            return day
+
+    if checkpoints is not None:
+        day = checkpoints.load(fingerprint)
+        if day is not None and finished_day(day):
+            return day
+
+    return None
+
+def keep_solved_day(fingerprint, day, reuse_days, checkpoints):
+    """Keeps a day just solved for later horizons to reuse, and checkpoints
+    it, unless it ran out of time
+
+    Time limits aren't part of a day's fingerprint, so a day that timed out
+    is left to be solved again by a later horizon that may have more time.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The fingerprint of the day's inputs, or None if it has none
+
+    day : dict
+        The results of the day (see solve_one_day)
+
+    reuse_days : bool
+        Whether to keep the day in this process
+
+    checkpoints : checkpoints.CheckpointStore
+        The store days are checkpointed to, or None
+    """
+
+    if fingerprint is None or not finished_day(day):
+        return
+
+    day = dict(day)
+
+    if reuse_days:
+        solved_days.put(fingerprint, day)
+
+    if checkpoints is not None:
+        checkpoints.save(fingerprint, day)
+
+def iterate_days(fixed_parameters, demand_df, deadline):
+    """Solves the days of the horizon one after another, yielding each as soon
+    as it is solved
+
+    A day solved before by this process, or checkpointed, with the same
+    fingerprint (see day_fingerprint) isn't solved again, its results are
+    reused. Days solved are checkpointed as soon as they are.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    demand_df : pandas.core.frame.DataFrame
+        The smoothed demand each site has for each day
+
+    deadline : solvers.Deadline
+        When every day must be solved by
+
+    Yields
+    ------
+    day : dict
+        The results of each day in date order (see solve_one_day), with its
+        column of demand_df ('demand') and whether it was solved rather than
+        reused ('recomputed')
+    """
+
+    num_dates = len(demand_df.columns)
+
+    # miles between every pair of sites, sliced for each day's locations
+    site_distances = load_site_distances(fixed_parameters)
+
+    # if asked, start each day's fleet search from the previous day's fleet
+    use_fleet_hint = fixed_parameters.get('use_fleet_hint', False)
+    fleet_hint = None
+
+    # unless asked not to, days solved before with the same inputs are reused,
+    # and if asked, days are checkpointed as they are solved
+    reuse_days = fixed_parameters.get('reuse_days', True)
+    checkpoints = open_checkpoints(fixed_parameters)
+
+    # record the sites with demand and how large that demand is each day
+    for date_index, date in enumerate(demand_df.columns):
+        daily_demand = demand_df[date]
+        daily_demand = daily_demand[daily_demand != 0]
+
+        # inputs needed each day to make remaining parameters for equipment
+        # hauler routing
+        daily_inputs = {
+            'fleet_hint': fleet_hint,
+            'deadline': deadline.split(num_dates - date_index),
+            'site_distances': site_distances,
+            'date': date,
+            'daily_demand': daily_demand,
+            'date_index': date_index
+        }
+
+        # reuse the day if it was solved before with the same inputs
+        fingerprint = None
+        if reuse_days or checkpoints is not None:
+            fingerprint = day_fingerprint(fixed_parameters, daily_inputs)
+
+        day = find_solved_day(fingerprint, reuse_days, checkpoints)
+        if day is not None:
+            day = reuse_day(day, date, date_index)
+        else:
+            day = solve_one_day(fixed_parameters, daily_inputs)
+            day['recomputed'] = True
+            keep_solved_day(fingerprint, day, reuse_days, checkpoints)
+
+        day['demand'] = demand_df[date]
+
+        # days without demand leave the hint from the last day with some
+        if use_fleet_hint and day['fleet_size']:
+            fleet_hint = day['fleet_size']
+
+        yield day
+
+def iterate_days_in_parallel(fixed_parameters, demand_df, deadline, workers):
+    """Solves every day of the horizon at once across a pool of worker
+    processes, yielding each day in date order as soon as it and the days
+    before it are solved
+
+    Days are independent once demand is smoothed, except that the previous
+    day's fleet can't be used as a hint, so the results are the same as
+    solving the days one after another without hints.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for the whole horizon (as defined
+        in the main function)
+
+    demand_df : pandas.core.frame.DataFrame
+        The smoothed demand each site has for each day
+
+    deadline : solvers.Deadline
+        When every day must be solved by
+
+    workers : int
+        How many worker processes to solve days in
+
+    Yields
+    ------
+    day : dict
+        The results of each day (see iterate_days)
+    """
+
+    reuse_days = fixed_parameters.get('reuse_days', True)
+    checkpoints = open_checkpoints(fixed_parameters)
+
+    # the inputs of each day, and its fingerprint and the results of solving
+    # it before, if it was
+    days = []
+    for date_index, date in enumerate(demand_df.columns):
+        daily_demand = demand_df[date]
+        daily_demand = daily_demand[daily_demand != 0]
+
+        daily_inputs = {
+            'date': date,
+            'date_index': date_index,
+            'daily_demand': daily_demand
+        }
+
+        fingerprint = None
+        if reuse_days or checkpoints is not None:
+            fingerprint = day_fingerprint(fixed_parameters, daily_inputs)
+
+        days.append((daily_inputs, fingerprint, find_solved_day(fingerprint,
+            reuse_days, checkpoints)))
+
+    # days left to solve are solved a pool's worth at a time, so each gets the
+    # time left up to the end of its turn
+    unsolved = [daily_inputs for daily_inputs, fingerprint, day in days if day
+        is None]
+    turns = int(np.ceil(len(unsolved)/float(workers)))
+
+    for position, daily_inputs in enumerate(unsolved):
+        turn = position//workers
+        daily_inputs['deadline'] = Deadline(None if deadline.remaining() is
+            None else deadline.share(turns)*(turn + 1))
+
+    pool = multiprocessing.Pool(workers, start_day_worker, (fixed_parameters,))
+    try:
+        # results come back in date order whichever day finishes first
+        solved = pool.imap(solve_day_in_worker, unsolved)
+
+        for daily_inputs, fingerprint, day in days:
+            date = daily_inputs['date']
+
+            if day is None:
+                day = next(solved)
+                day['recomputed'] = True
+                keep_solved_day(fingerprint, day, reuse_days, checkpoints)
+            else:
+                day = reuse_day(day, date, daily_inputs['date_index'])
+
+            day['demand'] = demand_df[date]
+            yield day
+
+        pool.close()
+    finally:
+        # a consumer that stops early doesn't wait on the days left
+        pool.terminate()
+        pool.join()
+
+def iterate_horizon(fixed_parameters, demand_df):
+    """Finds truck and hauler usage for all days in our range, yielding each
+    day's results as soon as it is solved
+
+    Demand is smoothed when the first day is asked for. Only the day being
+    yielded is kept, so memory doesn't grow with the length of the horizon
+    and consumers can start on the first days before the last is solved.
+    Unless 'reuse_days' is False, periods of demand and days smoothed and
+    solved before by this process with the same inputs are reused rather
+    than solved again, and kept for later horizons to reuse. Given a
+    'checkpoint_dir', each day is checkpointed there as soon as it is
+    solved, so running a horizon that died part way through again resumes
+    it from the days that are missing.
 
     Parameters
     ----------
@@ -135,48 +900,100 @@ def solve_horizon(fixed_parameters, demand_df):
     demand_df : pandas.core.frame.DataFrame
         demand for number of drop-offs or pick-ups that each site has for
         each day. This df has already been smoothed for the web edition
+
+    Yields
+    ------
+    day : dict
+        The date and its index, its column of smoothed demand ('demand'), the
+        number of haulers needed ('fleet_size', 0 without demand, None if no
+        fleet could meet it), its column of fleet_mileage ('mileage') and of
+        hauler_hours ('hours'), the routes and fleet search it recorded
+        ('hauler_routes', 'fleet_searches'), and whether it was solved rather
+        than reused ('recomputed')
     """
 
     # declare needed fixed_parameters (do this before the functions using them
     # need them so they don't need to be created more than once)
     start_date = fixed_parameters['start_date']
     end_date = fixed_parameters['end_date']
-    fleet_upper_bound = fixed_parameters['fleet_upper_bound']
     window = fixed_parameters['window']
 
-    # smooth our input demand as evenly as possible
-    demand_df = smooth_demand(demand_df, window, start_date, end_date)
-    num_dates = len(demand_df.columns)
-    
+    # time allowed for the whole horizon, shared by smoothing and each day
+    deadline = Deadline(fixed_parameters.get('horizon_time_limit'))
+    num_dates = (demand_df.columns.get_loc(end_date) -
+        demand_df.columns.get_loc(start_date) + 1)
+
+    # smooth our input demand as evenly as possible with the chosen engine,
+    # reusing the periods smoothed before unless asked not to
+    demand_df = smooth_demand(demand_df, window, start_date, end_date,
+        get_backend(fixed_parameters), deadline.split(num_dates + 1),
+        fixed_parameters.get('reuse_days', True),
+        fixed_parameters.get('smoothing_engine', 'ip'),
+        fixed_parameters.get('smoothing_periods'),
+        fixed_parameters.get('smoothing_workers', 1),
+        get_cache('smoothing', fixed_parameters))
+
+    # if asked, solve days in parallel across a pool of worker processes
+    day_workers = fixed_parameters.get('day_workers', 1)
+    if day_workers > 1:
+        days = iterate_days_in_parallel(fixed_parameters, demand_df, deadline,
+            day_workers)
+    else:
+        days = iterate_days(fixed_parameters, demand_df, deadline)
+
+    for day in days:
+        yield day
+
+def solve_horizon(fixed_parameters, demand_df):
+    """ Find truck, hauler, and equipment usages for all days in our range.
+
+    Finds and smoothes delivery demand for all days. Determines day by day
+    usage of all assets. Creates report detailing usage over whole range.
+    The report shows every day, so unlike iterate_horizon, every day's
+    mileage, hours, routes and demand are kept until it is made.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    demand_df : pandas.core.frame.DataFrame
+        demand for number of drop-offs or pick-ups that each site has for
+        each day. This df has already been smoothed for the web edition
+    """
+
+    fleet_upper_bound = fixed_parameters['fleet_upper_bound']
+
+    # only the days from start_date to end_date are smoothed and solved
+    num_dates = (demand_df.columns.get_loc(fixed_parameters['end_date']) -
+        demand_df.columns.get_loc(fixed_parameters['start_date']) + 1)
+
     # matrix to store miles run by each fleet of a given size each day
     fleet_mileage = np.zeros((fleet_upper_bound + 1, num_dates))
-    
+
     # matrix to store hours worked by each hauler each day
     hauler_hours = np.zeros((fleet_upper_bound + 1, num_dates))
 
     # dictionary to store routes run by each hauler each day
     hauler_routes = []
-    
-    # record the sites with demand and how large that demand is each day
-    for date in demand_df.columns:
-        daily_demand = demand_df[date]
-        daily_demand = daily_demand[daily_demand != 0]
 
-        date_index = demand_df.columns.get_loc(date)
+    # list to store how each day's minimum fleet size was found
+    fleet_searches = []
 
-        # inputs needed each day to make remaining parameters for equipment
-        # hauler routing
-        daily_inputs = {
-            'fleet_mileage': fleet_mileage,
-            'hauler_hours': hauler_hours,
-            'hauler_routes' : hauler_routes,
-            'date': date,
-            'daily_demand': daily_demand,
-            'date_index': date_index
-        }
-    
-        fleet_mileage, hauler_hours, hauler_routes = solve_day(fixed_parameters,
-                                                               daily_inputs)
+    # smoothed demand for each day, and the report's totals so far
+    demands = []
+    totals = ReportTotals(fleet_upper_bound)
+
+    for day in iterate_horizon(fixed_parameters, demand_df):
+        fleet_mileage[:, day['date_index']] = day['mileage']
+        hauler_hours[:, day['date_index']] = day['hours']
+        hauler_routes.extend(day['hauler_routes'])
+        fleet_searches.extend(day['fleet_searches'])
+        demands.append(day['demand'])
+        totals.add_day(day)
+
+    demand_df = pd.concat(demands, axis = 1)
 
     # convert fleet_mileage and hauler_hours to dataframes and save as csv's 
     mileage_df = pd.DataFrame(data = fleet_mileage, columns = demand_df.columns)
@@ -192,11 +1009,12 @@ def solve_horizon(fixed_parameters, demand_df):
         'demand_df': demand_df,
         'mileage_df': mileage_df,
         'hours_df': hours_df,
-        'hauler_routes': hauler_routes
+        'hauler_routes': hauler_routes,
+        'fleet_searches': collections.OrderedDict(fleet_searches),
+        'totals': totals
     }
 
     # make report to record a summary of the results for this variation
     template_vars = make_report(data, fixed_parameters)
 
     return(template_vars)
-
@@ -0,0 +1,147 @@
+import collections
+import hashlib
+import numpy as np
+
+from checkpoints import CheckpointStore
+
+# caches made by this process, by name and directory, so every day and
+# request it serves shares them
+caches = {}
+
+def get_cache(name, fixed_parameters):
+    """Returns the cache of the given name, made the first time it is asked for
+
+    Parameters
+    ----------
+    name : str
+        What the cache holds, such as 'routing' or 'subsets'
+
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function). 'memo_size' sets how many results are kept in
+        memory (1024 by default, 0 to keep none) and 'memo_dir' a directory
+        to keep every result in as well, shared with other processes
+
+    Returns
+    -------
+    cache : LruCache
+        The cache
+    """
+
+    size = fixed_parameters.get('memo_size', 1024)
+    directory = fixed_parameters.get('memo_dir')
+
+    key = (name, directory)
+    if key not in caches:
+        caches[key] = LruCache(size, directory)
+
+    caches[key].size = size
+
+    return caches[key]
+
+def fingerprint(*parts):
+    """Digests strings, numbers and arrays into a key that only the same parts
+    share
+
+    Arrays are digested by their shape, type and contents, anything else by
+    its repr.
+
+    Returns
+    -------
+    key : str
+        A hexadecimal digest of the parts
+    """
+
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(repr((part.shape, part.dtype.str)).encode('utf-8'))
+            digest.update(part.tobytes())
+        else:
+            digest.update(repr(part).encode('utf-8'))
+
+    return digest.hexdigest()
+
+class LruCache(object):
+    """Results kept by key, evicting the least recently used once there are
+    more than the cache's size, and optionally kept on disk as well
+
+    Results on disk are never evicted, and are shared by every process using
+    the same directory, such as the workers of a parallel horizon.
+
+    Parameters
+    ----------
+    size : int, optional
+        How many results to keep in memory
+
+    directory : str, optional
+        Where to keep every result on disk as well
+    """
+
+    def __init__(self, size = 1024, directory = None):
+
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+        self.store = None
+        if directory is not None:
+            self.store = CheckpointStore(directory, suffix = '.memo')
+
+    def __len__(self):
+
+        return len(self.entries)
+
+    def get(self, key):
+        """Looks up a result, in memory and then on disk
+
+        Parameters
+        ----------
+        key : str
+            The result's key, such as a fingerprint
+
+        Returns
+        -------
+        value : object
+            The result, or None if it isn't kept
+        """
+
+        if key in self.entries:
+            # most recently used results are kept at the end
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+        if self.store is not None:
+            value = self.store.load(key)
+            if value is not None:
+                self.keep(key, value)
+            return value
+
+        return None
+
+    def put(self, key, value):
+        """Keeps a result, in memory and on disk
+
+        Parameters
+        ----------
+        key : str
+            The result's key, such as a fingerprint
+
+        value : object
+            The result
+        """
+
+        self.keep(key, value)
+
+        if self.store is not None:
+            self.store.save(key, value)
+
+    def keep(self, key, value):
+        """Keeps a result in memory, evicting the least recently used"""
+
+        self.entries.pop(key, None)
+        self.entries[key] = value
+
+        while len(self.entries) > max(self.size, 0):
+            self.entries.popitem(last = False)
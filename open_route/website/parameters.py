@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import itertools
 
+from memo import get_cache, fingerprint
+
 def make_demand_list(daily_demand):
     """Converts our daily demand from a pandas series to a list and adds the
     demands (0 demand) for where haulers start and end their days
@@ -75,13 +77,143 @@ def make_route_constraints(demand_list):
     return route_constraints
 
 
-def make_travel_matrix(daily_demand, site_df, travel_rate, day_length, handle):
+# miles per degree of latitude and of longitude in the USA, and the Earth's
+# radius in miles
+MILES_PER_LAT = 69
+MILES_PER_LONG = 53
+EARTH_RADIUS = 3958.8
+
+def pairwise_miles(lat1, lng1, lat2, lng2, metric = 'manhattan'):
+    """Finds the miles between every site of one group and every site of
+    another
+
+    Parameters
+    ----------
+    lat1, lng1 : numpy.ndarray
+        The latitude and longitude of each site in the first group
+
+    lat2, lng2 : numpy.ndarray
+        The latitude and longitude of each site in the second group
+
+    metric : str, optional
+        'manhattan' (the default) converts the differences in latitude and
+        longitude to miles separately and adds them, as a hauler driving a grid
+        of roads would. 'haversine' uses the straight line distance over the
+        Earth's surface.
+
+    Returns
+    -------
+    miles : numpy.ndarray
+        How many miles apart each site of the first group (rows) is from each
+        site of the second (columns)
+    """
+
+    lat1, lng1 = np.asarray(lat1, dtype=float), np.asarray(lng1, dtype=float)
+    lat2, lng2 = np.asarray(lat2, dtype=float), np.asarray(lng2, dtype=float)
+
+    if metric == 'manhattan':
+        miles = (MILES_PER_LAT*np.absolute(lat1[:, None] - lat2[None, :]) +
+            MILES_PER_LONG*np.absolute(lng1[:, None] - lng2[None, :]))
+
+    elif metric == 'haversine':
+        lat1, lng1 = np.radians(lat1), np.radians(lng1)
+        lat2, lng2 = np.radians(lat2), np.radians(lng2)
+        h = (np.sin((lat1[:, None] - lat2[None, :])/2)**2 +
+            np.cos(lat1[:, None])*np.cos(lat2[None, :])*
+            np.sin((lng1[:, None] - lng2[None, :])/2)**2)
+        miles = 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.minimum(h, 1)))
+
+    else:
+        raise ValueError("unknown distance metric '%s', expected 'manhattan' "
+            "or 'haversine'" % metric)
+
+    return miles
+
+def make_distance_matrix(site_df, metric = 'manhattan'):
+    """Makes a matrix of the miles between every pair of sites, to be built
+    once for the whole horizon and sliced for each day by make_travel_matrix
+
+    Parameters
+    ----------
+    site_df : pandas.core.frame.DataFrame
+        The latitude and longitude for each of our sites
+
+    metric : str, optional
+        How miles are measured between sites, 'manhattan' (the default) or
+        'haversine' (see pairwise_miles)
+
+    Returns
+    -------
+    distances : pandas.core.frame.DataFrame
+        How many miles apart any two sites are, indexed by the site numbers
+        ('Project #') of both sites
+    """
+
+    lat = site_df['Lat'].values
+    lng = site_df['Long'].values
+    miles = pairwise_miles(lat, lng, lat, lng, metric)
+
+    sites = site_df['Project #'].values
+    distances = pd.DataFrame(data = miles, index = sites, columns = sites)
+
+    return distances
+
+def load_site_distances(fixed_parameters):
+    """Gets the miles between all sites for the horizon: driven over the road
+    network in the 'road_network' edge list if one is given, from the
+    distance store in the 'distance_store' directory, adding any sites it
+    doesn't have yet, or by making them from scratch otherwise
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    Returns
+    -------
+    distances : pandas.core.frame.DataFrame, DistanceStore or RoadNetwork
+        How many miles apart any two sites are, by the site numbers of both
+    """
+
+    site_df = fixed_parameters['site_df']
+    metric = fixed_parameters.get('distance_metric', 'manhattan')
+    directory = fixed_parameters.get('distance_store')
+    road_network = fixed_parameters.get('road_network')
+
+    if road_network is not None:
+        from road_network import load_road_network
+
+        # make_travel_matrix rounds routes longer than this down to it, so
+        # the network is never searched any further
+        max_dist = int((fixed_parameters['day_length'] -
+            fixed_parameters['handle'])*fixed_parameters['travel_rate']/2.0)
+
+        network = load_road_network(road_network,
+            fixed_parameters.get('road_landmarks', 8), max_dist)
+        network.add_sites(site_df)
+
+        return network
+
+    if directory is None:
+        return make_distance_matrix(site_df, metric)
+
+    from distance_store import DistanceStore
+
+    store = DistanceStore(directory, metric)
+    store.add_sites(site_df)
+
+    return store
+
+def make_travel_matrix(daily_demand, site_df, travel_rate, day_length, handle,
+    distances = None):
     """Makes a matrix describing how long the route from location i to location
     j is
 
-    Takes the difference in coordinates for each location to be visited on a given
-    day and converts them to mileage. Rounds routes that are greater than one
-    day's worth of miles to the max miles that can be done in one day.
+    Picks the miles between each pair of locations to be visited on a given day
+    out of the matrix of miles between all sites. Rounds routes that are
+    greater than one day's worth of miles to the max miles that can be done in
+    one day.
 
     Parameters
     ----------
@@ -90,7 +222,8 @@ def make_travel_matrix(daily_demand, site_df, travel_rate, day_length, handle):
         needs at least one drop-off or one pick-up
 
     site_df : pandas.core.frame.DataFrame
-        The latitude and longitude for each of our sites
+        The latitude and longitude for each of our sites, listing the
+        start-of-day hub first and the end-of-day hub last
 
     travel_rate : float
         How many miles per minute a hauler can drive on average
@@ -101,6 +234,11 @@ def make_travel_matrix(daily_demand, site_df, travel_rate, day_length, handle):
     handle : int
         How long it takes on average for a hauler to unload or reload his trailer
 
+    distances : pandas.core.frame.DataFrame, DistanceStore or RoadNetwork, optional
+        How many miles apart any two sites are, as made by make_distance_matrix,
+        kept in a distance store or driven over a road network. Made from
+        site_df if not given.
+
     Returns
     -------
     travel_matrix : numpy.ndarray
@@ -109,37 +247,32 @@ def make_travel_matrix(daily_demand, site_df, travel_rate, day_length, handle):
     
     locations = daily_demand.index.tolist()
     
-    # 0 and 6 are ID's for our hubs (matched to index.html)
-    locations.insert(0,0)
-    locations.append(6)
+    # the first and last sites are our start-of-day and end-of-day hubs
+    # (0 and N+1 in index.html, for N sites with demand)
+    site_numbers = site_df['Project #'].values
+    locations.insert(0,site_numbers[0])
+    locations.append(site_numbers[-1])
 
-    length = len(locations)
-    travel_matrix = np.zeros((length,length))
+    if distances is None:
+        distances = make_distance_matrix(site_df)
 
     # max distance that can be covered in one day by one hauler
     max_dist = int((day_length - handle)*travel_rate/2.0)
-    
-
-    for i in range(length):
-        for j in range(length):
-
-            a = locations[i]
-            b = locations[j]
-
-            # find coords of each site, find the differences, convert them to miles
-            lat1 = site_df.loc[site_df['Project #'] == a, 'Lat'].iloc[0]
-            long1 = site_df.loc[site_df['Project #'] == a, 'Long'].iloc[0]
-
-            lat2 = site_df.loc[site_df['Project #'] == b, 'Lat'].iloc[0]
-            long2 = site_df.loc[site_df['Project #'] == b, 'Long'].iloc[0]
-            
-            # 69 miles between latitudes and 53 for longitudes in USA
-            actual_dist = int(69*abs(lat1 - lat2) + 53*abs(long1 - long2))
 
-            # round actual distance to the maximum, making the assumption that the
-            # hauler could legally run a bit longer to finish day or finish negligbly
-            # early the next day
-            travel_matrix[i,j] = min(max_dist, actual_dist)
+    # whole miles between each pair of locations
+    if isinstance(distances, pd.DataFrame):
+        index = distances.index.get_indexer(locations)
+        if (index < 0).any():
+            missing = [a for a, i in zip(locations, index) if i < 0]
+            raise KeyError('no coordinates for sites %s' % missing)
+        actual_dist = np.floor(distances.values[np.ix_(index, index)])
+    else:
+        actual_dist = np.floor(distances.submatrix(locations))
+
+    # round actual distance to the maximum, making the assumption that the
+    # hauler could legally run a bit longer to finish day or finish negligbly
+    # early the next day
+    travel_matrix = np.minimum(max_dist, actual_dist)
 
     return travel_matrix
 
@@ -184,6 +317,112 @@ def make_subsets(customers, demand_list):
     return subsets
 
 
+def memoized_subsets(fixed_parameters, customers, demand_list):
+    """Makes the subsets of customers as make_subsets does, reusing those made
+    before for the same pattern of drop-offs and pick-ups
+
+    Customers are always numbered from 1, so the subsets only depend on
+    which of them have drop-offs and which pick-ups.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function), which may size the cache and give it a
+        directory (see memo.get_cache)
+
+    customers : list
+        A list of the indices corresponding to each job site with a demand on
+        a given day
+
+    demand_list : list
+        Demands for all locations (job sites with demands and the hub) to be
+        included on our graph for the day's hauler routing
+
+    Returns
+    -------
+    subsets : list
+        The list of all even sized subsets of customers where both types of
+        demand are present
+    """
+
+    cache = get_cache('subsets', fixed_parameters)
+    signs = np.sign(np.asarray(demand_list, dtype=float)[list(customers)])
+    key = fingerprint('subsets', signs.astype(np.int8))
+
+    subsets = cache.get(key)
+    if subsets is None:
+        subsets = make_subsets(customers, demand_list)
+        cache.put(key, subsets)
+
+    return list(subsets)
+
+def make_day_subsets(fixed_parameters, customers, demand_list):
+    """Makes the subsets of customers the day's routing model starts with
+
+    Subsets grow exponentially with the number of customers, so when they are
+    added to the routing model only as needed, or the day is routed by the
+    search, which doesn't need them, none are made.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    customers : list
+        A list of the indices corresponding to each job site with a demand on
+        a given day
+
+    demand_list : list
+        Demands for all locations (job sites with demands and the hub) to be
+        included on our graph for the day's hauler routing
+
+    Returns
+    -------
+    subsets : list
+        The subsets of customers (see make_subsets), or none
+    """
+
+    if (fixed_parameters.get('lazy_subtours', False) or
+        routing_engine(fixed_parameters, customers) == 'alns'):
+        return []
+
+    return memoized_subsets(fixed_parameters, customers, demand_list)
+
+def routing_engine(fixed_parameters, customers):
+    """Chooses whether a day is routed by the exact Integer Program or by the
+    Adaptive Large Neighborhood Search
+
+    The 'routing_engine' fixed parameter can be 'ip', 'alns' or 'auto' (the
+    default), which uses the search only for days with more sites than the
+    'alns_site_threshold' fixed parameter (10 by default), as the Integer
+    Program's subsets grow exponentially with the number of sites.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    customers : list
+        A list of the indices corresponding to each job site with a demand on
+        a given day
+
+    Returns
+    -------
+    engine : str
+        'ip' or 'alns'
+    """
+
+    engine = fixed_parameters.get('routing_engine', 'auto')
+
+    if engine == 'auto':
+        threshold = fixed_parameters.get('alns_site_threshold', 10)
+        engine = 'alns' if len(customers) > threshold else 'ip'
+
+    return engine
+
 def make_parameters(fixed_parameters, daily_inputs):
     """Create the remaining parameters (all of which vary by day) to solve
     our daily routing problem
@@ -222,10 +461,15 @@ def make_parameters(fixed_parameters, daily_inputs):
 
     route_constraints = make_route_constraints(demand_list)
 
+    # miles between all sites, made once for the whole horizon if given
+    distances = daily_inputs.get('site_distances')
+    if distances is None:
+        distances = load_site_distances(fixed_parameters)
+
     travel_matrix = make_travel_matrix(daily_demand, site_df, travel_rate,
-                                   day_length, handle)
+                                   day_length, handle, distances)
 
-    subsets = make_subsets(customers, demand_list)
+    subsets = make_day_subsets(fixed_parameters, customers, demand_list)
 
 
     variable_parameters = {
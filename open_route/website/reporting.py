@@ -1,12 +1,15 @@
 import pandas as pd
 import numpy as np
 import itertools
+import collections
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
 from jinja2 import Environment, FileSystemLoader
 
+from solvers import OPTIMAL, FEASIBLE_WITH_GAP, TIMED_OUT
+
 # compute summary statistics for each equipment hauler
 # hours_df (how much each hauler works each day) is passed in as df when run
 def summarize(df):
@@ -28,12 +31,36 @@ def summarize(df):
         A dataframe with the summary statistics outlined above
     """
     
-    summary = pd.DataFrame(index = df.index)
-    num_dates = float(len(df.columns))
+    return summarize_totals(df.sum(axis=1), (df[df.columns] > 0).sum(1),
+        len(df.columns))
+
+def summarize_totals(minutes_worked, days_utilized, num_dates):
+    """Computes summary statistics for each equipment hauler from how much he
+    worked over the time range (see summarize)
+
+    Parameters
+    ----------
+    minutes_worked : pandas.core.series.Series
+        How many minutes each hauler works in the time range
+
+    days_utilized : pandas.core.series.Series
+        How many days each hauler works at all
+
+    num_dates : int
+        The number of days in the time range
+
+    Returns
+    -------
+    summary : pandas.core.frame.DataFrame
+        A dataframe with the summary statistics outlined in summarize
+    """
+
+    summary = pd.DataFrame(index = minutes_worked.index)
+    num_dates = float(num_dates)
     
     # number is in minutes so divide by 60
-    summary['Hours Worked in Time Range'] = df.sum(axis=1)/60.
-    summary['Days Utilized'] = (df[df.columns] > 0).sum(1)
+    summary['Hours Worked in Time Range'] = minutes_worked/60.
+    summary['Days Utilized'] = days_utilized
     
     summary['Percentage of Working Days Utilized'] = \
         summary['Days Utilized'].apply(lambda x: x/num_dates*100.)
@@ -56,6 +83,62 @@ def summarize(df):
     
     return summary
 
+class ReportTotals(object):
+    """Running totals over the time range that the report is made from,
+    updated one day at a time as each day is solved
+
+    Parameters
+    ----------
+    fleet_upper_bound : int
+        The maximum number of haulers that can be available on one day
+    """
+
+    def __init__(self, fleet_upper_bound):
+
+        self.fleet_upper_bound = fleet_upper_bound
+        self.num_dates = 0
+
+        # miles run by the largest fleet, integer programs the fleet size
+        # searches avoided and how each day's search ended
+        self.fleet_miles = 0
+        self.solves_avoided = 0
+        self.outcomes = collections.Counter()
+
+        # the days solved rather than reused from an earlier horizon
+        self.recomputed = []
+
+        # minutes each hauler works and the days he works at all
+        self.minutes_worked = np.zeros(fleet_upper_bound + 1)
+        self.days_utilized = np.zeros(fleet_upper_bound + 1, dtype=int)
+
+    def add_day(self, day):
+        """Adds a solved day to the totals
+
+        Parameters
+        ----------
+        day : dict
+            The day's results, as yielded by iterate.iterate_horizon
+        """
+
+        self.num_dates += 1
+        self.fleet_miles += day['mileage'][self.fleet_upper_bound]
+        self.minutes_worked += day['hours']
+        self.days_utilized += day['hours'] > 0
+
+        for name, search in day['fleet_searches']:
+            self.solves_avoided += search['solves_avoided']
+            self.outcomes[search['outcome']] += 1
+
+        if day.get('recomputed', True):
+            self.recomputed.append('day %s' % (day['date_index'] + 1))
+
+    def hauler_summary(self):
+        """Computes summary statistics for each equipment hauler over the days
+        added so far (see summarize)"""
+
+        return summarize_totals(pd.Series(self.minutes_worked),
+            pd.Series(self.days_utilized), self.num_dates)
+
 def equipment_usage_analysis(demand_df, directory_name):
     """Determines for each day whether or not a given set of equipment was
     used
@@ -76,16 +159,18 @@ def equipment_usage_analysis(demand_df, directory_name):
         equipment was utilized on a given day
     """
 
-    # make a dictionary for 100 equipment sets and their locations
-    equipment = np.arange(100)
-    location = np.zeros(100)
+    # make a dictionary for enough equipment sets to meet every drop-off and
+    # their locations (0 for the hub, site index + 1 for a site)
+    num_equip = max(int(np.absolute(demand_df.values[demand_df.values <
+        0]).sum()), 1)
+    equipment = np.arange(num_equip)
+    location = np.zeros(num_equip, dtype=int)
 
     equip_dict = dict(zip(equipment, location))
 
     # get matrices' dimensions
     num_days = len(demand_df.columns)
     num_sites = len(demand_df.index)
-    num_equip = len(equipment)
 
     # create matrix for whether or not a set of equipment gets used
     # on a given day
@@ -106,8 +191,10 @@ def equipment_usage_analysis(demand_df, directory_name):
                 pickups = int(demand[site,day])
                 
                 for iterations in range(pickups):
-                    if site in set(equip_dict.values()):
-                        equip_dict[equip_dict.values().index(site)] = 0
+                    at_site = [key for key in equip_dict if
+                        equip_dict[key] == site + 1]
+                    if len(at_site) > 0:
+                        equip_dict[at_site[0]] = 0
                     
         # if a site has a demand for x equipment sets to be dropped-off on a
         # given day, assign x equipment sets to that site (possible inclusions are
@@ -117,7 +204,8 @@ def equipment_usage_analysis(demand_df, directory_name):
                 dropoffs = int(abs(demand[site,day]))
                 
                 for iterations in range(dropoffs):
-                    equip_dict[equip_dict.values().index(0)] = site
+                    at_hub = [key for key in equip_dict if equip_dict[key] == 0]
+                    equip_dict[at_hub[0]] = site + 1
         
         # mark all equipment sets that end the day at a site as in use
         # (we've effectly taken superset of equipment sets starting day in use
@@ -177,6 +265,7 @@ def equipment_graph_maker(demand_df, directory_name, plotlist):
     graph_location = directory_name + image_name
 
     plt.savefig(graph_location)
+    plt.close(fig)
     plotlist.append(image_name)
 
     # make graph showing how much equipment demand is met by x equipment sets
@@ -196,6 +285,7 @@ def equipment_graph_maker(demand_df, directory_name, plotlist):
     graph_location = directory_name + image_name
    
     plt.savefig(graph_location)
+    plt.close(fig)
     plotlist.append(image_name)
 
     return plotlist
@@ -251,6 +341,7 @@ def hauler_graph_maker(hours_df, index, plotlist, directory_name):
     graph_location = os.path.join(directory_name, image_name)
   
     plt.savefig(graph_location)
+    plt.close(fig)
     
     # add where we saved this plot to the list of plots to add to the report
     plotlist.append(image_name)
@@ -266,8 +357,9 @@ def make_report(data, fixed_parameters):
     Parameters
     ----------
     data : dict
-        A dictionary containing daily site demands, truck mileage totals, and
-        hours worked by each hauler
+        A dictionary containing daily site demands, truck mileage totals,
+        hours worked by each hauler, how each day's fleet size was found and
+        the running totals over the time range (a ReportTotals)
 
     fixed_parameters : dict
         Parameters that are constant for any variation and region (as defined
@@ -278,15 +370,22 @@ def make_report(data, fixed_parameters):
     mileage_df = data['mileage_df']
     hours_df = data['hours_df']
     hauler_routes = data['hauler_routes']
+    fleet_searches = data['fleet_searches']
+    totals = data['totals']
 
     directory_name = fixed_parameters['directory_name']
-    fleet_upper_bound = fixed_parameters['fleet_upper_bound']
 
     # compile summary statistics for how much each hauler works
-    hauler_summary = summarize(hours_df)
+    hauler_summary = totals.hauler_summary()
     
-    # find the total number of miles the fleet runs over the entire time range
-    fleet_miles = mileage_df.values.sum(axis=1)[fleet_upper_bound]
+    # the total number of miles the fleet runs over the entire time range
+    fleet_miles = totals.fleet_miles
+
+    # how many integer programs the fleet size search saved us solving
+    solves_avoided = totals.solves_avoided
+
+    # the days whose routing was optimal, feasible with a gap or timed out
+    outcomes = totals.outcomes
 
     plotlist = []
     
@@ -300,6 +399,13 @@ def make_report(data, fixed_parameters):
     # variables to be passed back to views.end
     template_vars = {
         'truck_miles': 'Total Miles Driven by All Trucks: %s' % fleet_miles,
+        'solves_avoided': 'Fleet Size Solves Avoided: %s' % solves_avoided,
+        'solve_outcomes': 'Days Solved Optimally: %s, With a Gap: %s, Timed Out: %s'
+            % (outcomes[OPTIMAL], outcomes[FEASIBLE_WITH_GAP], outcomes[TIMED_OUT]),
+        'recomputed_days': 'Days Recomputed: %s of %s' % (len(totals.recomputed),
+            totals.num_dates),
+        'recomputed_dates': totals.recomputed,
+        'fleet_searches': fleet_searches,
         'table_intro': 'Usage Statistics by Truck',
         'truck_table': hauler_summary.to_html(),
         'pictures': plotlist,
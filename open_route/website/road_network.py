@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from parameters import MILES_PER_LAT, MILES_PER_LONG
+
+# road networks already loaded by this process, by file, number of landmarks
+# and search limit, so the preprocessing and cached distances are shared by
+# every request it serves
+loaded_networks = {}
+
+def load_road_network(path, landmarks = 8, limit = np.inf):
+    """Loads a road network, or returns the one already loaded from the same
+    file
+
+    Parameters
+    ----------
+    path : str
+        The road network's edge list (see RoadNetwork)
+
+    landmarks : int, optional
+        How many landmarks to precompute distances from
+
+    limit : float, optional
+        Miles beyond which distances aren't needed exactly
+
+    Returns
+    -------
+    network : RoadNetwork
+        The road network
+    """
+
+    key = (path, landmarks, limit)
+    if key not in loaded_networks:
+        loaded_networks[key] = RoadNetwork(pd.read_csv(path), landmarks, limit)
+
+    return loaded_networks[key]
+
+class RoadNetwork(object):
+    """Miles driven between sites over a road network, such as one exported
+    from OpenStreetMap, used in place of the miles estimated from differences
+    in coordinates
+
+    Each site is snapped to the nearest intersection of the network and the
+    miles between two sites are the shortest drive between their
+    intersections, plus the estimated miles from each site to its
+    intersection. A day's distances are found together, in one batch of
+    shortest path searches over the network, one from each location.
+
+    When the network is loaded, the shortest drives to and from a few
+    landmarks spread across the network are found. By the triangle
+    inequality these bound the drive between any two intersections from
+    above and below, so pairs of sites known to be further apart than the
+    limit are never searched for, and the searches stop once every
+    intersection they need is within reach. Drives found are kept by pair of
+    intersections and reused by later days.
+
+    Parameters
+    ----------
+    edges : pandas.core.frame.DataFrame
+        One row per road segment, with the latitude and longitude of the two
+        ends ('from_lat', 'from_long', 'to_lat', 'to_long'), its length
+        ('miles') and optionally whether it can only be driven from the
+        first end to the second ('oneway')
+
+    landmarks : int, optional
+        How many landmarks to precompute distances from
+
+    limit : float, optional
+        Miles beyond which distances aren't needed exactly, such as the
+        furthest a hauler can drive between two sites in a day. Sites further
+        apart are given infinite miles.
+    """
+
+    def __init__(self, edges, landmarks = 8, limit = np.inf):
+
+        self.limit = limit
+
+        # intersections are the distinct ends of road segments
+        ends = np.vstack([edges[['from_lat', 'from_long']].values,
+            edges[['to_lat', 'to_long']].values]).astype(float)
+        self.nodes, inverse = np.unique(ends, axis = 0, return_inverse = True)
+        inverse = inverse.ravel()
+        tails, heads = inverse[:len(edges)], inverse[len(edges):]
+        miles = edges['miles'].values.astype(float)
+
+        # roads are two-way unless marked otherwise
+        if 'oneway' in edges:
+            twoway = ~edges['oneway'].values.astype(bool)
+        else:
+            twoway = np.ones(len(edges), dtype=bool)
+
+        tails, heads = (np.concatenate([tails, heads[twoway]]),
+            np.concatenate([heads, tails[twoway]]))
+        miles = np.concatenate([miles, miles[twoway]])
+
+        # keep the shortest of any parallel segments
+        num_nodes = len(self.nodes)
+        order = np.lexsort((miles, heads, tails))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ((tails[order][1:] != tails[order][:-1]) |
+            (heads[order][1:] != heads[order][:-1]))
+        order = order[first]
+        self.graph = sp.csr_matrix((miles[order], (tails[order],
+            heads[order])), shape=(num_nodes, num_nodes))
+
+        # nodes are found by estimated miles, as used between sites
+        self.tree = cKDTree(self.scale(self.nodes))
+
+        self.landmarks, self.from_landmarks, self.to_landmarks = \
+            self.make_landmarks(landmarks)
+
+        # nearest intersection of each site and the miles to it, and the
+        # shortest drives found between pairs of intersections
+        self.site_nodes = {}
+        self.access_miles = {}
+        self.drives = {}
+
+    def scale(self, coordinates):
+        """Converts latitudes and longitudes to miles north and east"""
+
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        return coordinates*np.array([MILES_PER_LAT, MILES_PER_LONG])
+
+    def make_landmarks(self, count):
+        """Picks landmarks spread across the network, each the intersection
+        furthest from those already picked, and finds the shortest drives
+        from and to each of them
+
+        Parameters
+        ----------
+        count : int
+            How many landmarks to pick
+
+        Returns
+        -------
+        landmarks : list
+            The intersection of each landmark
+
+        from_landmarks, to_landmarks : numpy.ndarray
+            The miles from and to each landmark (rows) for each intersection
+            (columns)
+        """
+
+        num_nodes = len(self.nodes)
+        count = min(count, num_nodes)
+
+        landmarks = []
+        from_landmarks = np.zeros((0, num_nodes))
+        to_landmarks = np.zeros((0, num_nodes))
+        nearest = np.full(num_nodes, np.inf)
+
+        node = 0
+        for landmark in range(count):
+            landmarks.append(node)
+            from_landmark = dijkstra(self.graph, indices = node)
+            to_landmark = dijkstra(self.graph.T.tocsr(), indices = node)
+            from_landmarks = np.vstack([from_landmarks, from_landmark])
+            to_landmarks = np.vstack([to_landmarks, to_landmark])
+
+            # the next landmark is the reachable intersection furthest from
+            # the picked ones
+            nearest = np.minimum(nearest, np.where(np.isinf(from_landmark),
+                np.nan, from_landmark))
+            if np.isnan(nearest).all():
+                break
+            node = int(np.nanargmax(nearest))
+            if node in landmarks:
+                break
+
+        return landmarks, from_landmarks, to_landmarks
+
+    def bounds(self, sources, targets):
+        """Bounds the shortest drive from each of some intersections to each of
+        others using the landmarks
+
+        Parameters
+        ----------
+        sources, targets : numpy.ndarray
+            The intersections driven from and to
+
+        Returns
+        -------
+        lower, upper : numpy.ndarray
+            Miles the drive from each source (rows) to each target (columns)
+            can't be shorter or longer than
+        """
+
+        from_s = self.from_landmarks[:, sources][:, :, None]
+        from_t = self.from_landmarks[:, targets][:, None, :]
+        to_s = self.to_landmarks[:, sources][:, :, None]
+        to_t = self.to_landmarks[:, targets][:, None, :]
+
+        with np.errstate(invalid='ignore'):
+            lower = np.concatenate([from_t - from_s, to_s - to_t])
+            upper = (to_s + from_t).min(axis = 0)
+
+        # a landmark that can't reach (or be reached from) either end says
+        # nothing about the drive between them
+        lower = np.where(np.isnan(lower), 0, lower).max(axis = 0)
+        lower = np.maximum(lower, 0)
+
+        return lower, upper
+
+    def add_sites(self, site_df):
+        """Snaps sites to their nearest intersection
+
+        Sites are snapped again every time they are added, so a site number
+        given new coordinates moves with them.
+
+        Parameters
+        ----------
+        site_df : pandas.core.frame.DataFrame
+            The latitude and longitude for each of our sites
+
+        Returns
+        -------
+        added : int
+            How many sites were snapped
+        """
+
+        access, nodes = self.tree.query(self.scale(site_df[['Lat',
+            'Long']].values), p = 1)
+
+        for site, node, miles in zip(site_df['Project #'].values, nodes,
+            access):
+            self.site_nodes[site] = int(node)
+            self.access_miles[site] = miles
+
+        return len(site_df)
+
+    def submatrix(self, locations):
+        """Finds the miles between a day's locations, searching the network only
+        for pairs of intersections not searched before
+
+        Parameters
+        ----------
+        locations : list
+            The site numbers of the day's locations, in the order of the
+            day's travel matrix
+
+        Returns
+        -------
+        miles : numpy.ndarray
+            How many miles apart each pair of the locations is, or infinity for
+            those further apart than the limit
+        """
+
+        missing = [a for a in locations if a not in self.site_nodes]
+        if len(missing) > 0:
+            raise KeyError('no coordinates for sites %s' % missing)
+
+        nodes = [self.site_nodes[a] for a in locations]
+        unknown = [(u, v) for u in set(nodes) for v in set(nodes) if (u, v) not
+            in self.drives]
+
+        if len(unknown) > 0:
+            self.find_drives(unknown)
+
+        access = np.array([self.access_miles[a] for a in locations])
+        drives = np.array([[self.drives[u, v] for v in nodes] for u in nodes])
+
+        miles = access[:, None] + drives + access[None, :]
+        miles[miles > self.limit] = np.inf
+        np.fill_diagonal(miles, 0)
+
+        return miles
+
+    def find_drives(self, pairs):
+        """Searches the network for the shortest drives between pairs of
+        intersections, all at once, and keeps them
+
+        Parameters
+        ----------
+        pairs : list
+            The (u, v) intersections of each pair
+        """
+
+        sources = np.array(sorted(set([u for u, v in pairs])))
+        targets = np.array(sorted(set([v for u, v in pairs])))
+
+        lower, upper = self.bounds(sources, targets)
+        needed = lower <= self.limit
+
+        drives = np.full((len(sources), len(targets)), np.inf)
+        searched = needed.any(axis = 1)
+        if searched.any():
+
+            # searches only need to reach as far as the furthest target of
+            # any source
+            limit = np.where(needed, np.minimum(upper, self.limit),
+                -np.inf)[searched].max()
+
+            drives[searched] = dijkstra(self.graph, indices =
+                sources[searched], limit = limit)[:, targets]
+
+        drives[drives > self.limit] = np.inf
+
+        for s, u in enumerate(sources):
+            for t, v in enumerate(targets):
+                self.drives[u, v] = drives[s, t]
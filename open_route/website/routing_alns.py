@@ -0,0 +1,811 @@
+import numpy as np
+import collections
+import random
+import math
+import time
+
+from hauler_routing import RoutingModel
+from solvers import combine_time_limits, FEASIBLE_WITH_GAP, TIMED_OUT
+
+class AlnsRoutingModel(RoutingModel):
+    """An Adaptive Large Neighborhood Search for routing a given sized fleet of
+    equipment haulers, used in place of the routing Integer Program on days
+    with too many sites for it to solve
+
+    Each hauler's route is kept as the list of locations he stops at between
+    leaving the start-of-day hub and arriving at the end-of-day hub, where a
+    stop at the start-of-day hub is a return to reload. Every iteration
+    removes some drop-offs and pick-ups from the routes with one of several
+    destroy operators and puts them back with one of several repair operators,
+    keeping the new routes if simulated annealing accepts them. Operators that
+    lead to better routes are chosen more often as the search goes on.
+
+    Routes follow the same rules as the Integer Program: sites are only
+    travelled between if their route constraint allows it (and no more often
+    than it allows), each site is left once per drop-off or pick-up, and no
+    hauler works longer than the length of the day plus one handle. The search
+    finds fleets that can meet all demand but can never prove a fleet can't,
+    so it is not exact.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function). 'alns_iterations' (default 1000) limits the
+        iterations of each search and 'alns_seed' seeds its random choices.
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+    """
+
+    # a heuristic can find fleets that work but never prove one doesn't
+    exact = False
+
+    # scores given to the operators of an iteration that finds a new best
+    # solution, improves on the current one, or is accepted anyway
+    scores = (33, 9, 13)
+
+    # how many iterations operator weights are kept for before being updated,
+    # and how far each update moves them towards the operators' latest scores
+    segment = 100
+    reaction = 0.1
+
+    def __init__(self, fixed_parameters, variable_parameters):
+
+        RoutingModel.__init__(self, fixed_parameters, variable_parameters)
+
+        self.start_hub = self.locations[0]
+
+        # miles, minutes (driving plus one handle) and number of times each
+        # route can be travelled, as lists for fast lookups
+        travel = np.asarray(self.travel, dtype=float)
+        self.miles = travel.tolist()
+        self.minutes = (self.handle + (travel/self.rate).astype(int)).tolist()
+        self.capacity = np.asarray(self.route_constraints, dtype=int).tolist()
+        self.day_minutes = self.L + self.handle
+
+        # drop-offs and pick-ups each site needs
+        self.site_demand = collections.Counter(dict((i, int(abs(self.demand[i])))
+            for i in self.customers))
+
+        # an unmet drop-off or pick-up costs more than fitting it in anywhere
+        self.penalty = 4*max(travel.max(), 1)
+
+        self.iterations = fixed_parameters.get('alns_iterations', 1000)
+        self.solve_time_limit = fixed_parameters.get('solve_time_limit')
+        self.random = random.Random(fixed_parameters.get('alns_seed', 0))
+
+        self.destroy_operators = [self.random_removal, self.worst_removal,
+            self.related_removal, self.route_removal]
+        self.repair_operators = [self.greedy_insertion, self.regret_insertion]
+
+        # routes given to start from, the best routes found for the last fleet
+        # size solved, and those found for the current fleet (None if it
+        # couldn't be routed)
+        self.start_routes = None
+        self.routes = None
+        self.solution = None
+
+    def set_fleet_size(self, fleet_size):
+        """Grows or shrinks the fleet of haulers the model will be solved for
+
+        Parameters
+        ----------
+        fleet_size : int
+            The number of haulers in the fleet for the next solve
+        """
+
+        self.haulers = range(fleet_size)
+
+    def set_mip_start(self, routes):
+        """Uses routes found outside of the search, such as by
+        construction.construct_routes, as the solution to start the next search
+        from
+
+        Parameters
+        ----------
+        routes : list
+            The number of times each hauler takes each route, by the (i, j)
+            locations of the route
+        """
+
+        self.start_routes = [self.order_stops(arcs) for arcs in routes]
+
+    def order_stops(self, arcs):
+        """Orders the routes a hauler takes into the stops he makes, following
+        them from the start-of-day hub to the end-of-day hub
+
+        Parameters
+        ----------
+        arcs : dict
+            The number of times the hauler takes each route, by the (i, j)
+            locations of the route
+
+        Returns
+        -------
+        stops : list
+            The locations the hauler stops at between the hubs
+        """
+
+        leaving = collections.defaultdict(list)
+        for (i, j), count in sorted(arcs.items()):
+            leaving[i].extend([j]*int(round(count)))
+
+        # Hierholzer's algorithm for a walk using every route once
+        stack = [self.start_hub]
+        walk = []
+        while len(stack) > 0:
+            i = stack[-1]
+            if len(leaving[i]) > 0:
+                stack.append(leaving[i].pop())
+            else:
+                walk.append(stack.pop())
+        walk.reverse()
+
+        return [i for i in walk[1:-1] if i != self.end_hub]
+
+    def walk(self, stops):
+        """The locations a hauler travels through, hub to hub"""
+
+        return [self.start_hub] + stops + [self.end_hub]
+
+    def route_miles(self, stops):
+        """The miles a hauler runs making his stops"""
+
+        walk = self.walk(stops)
+        return sum([self.miles[a][b] for a, b in zip(walk[:-1], walk[1:])])
+
+    def route_minutes(self, stops):
+        """The minutes a hauler works making his stops"""
+
+        walk = self.walk(stops)
+        return sum([self.minutes[a][b] for a, b in zip(walk[:-1], walk[1:])])
+
+    def usage(self, routes):
+        """Counts how many times the fleet takes each route"""
+
+        usage = collections.Counter()
+        for stops in routes:
+            walk = self.walk(stops)
+            usage.update(zip(walk[:-1], walk[1:]))
+
+        return usage
+
+    def cost(self, routes, unassigned):
+        """The miles run by the fleet, plus a penalty for each drop-off or
+        pick-up left unmet
+        """
+
+        return (sum([self.route_miles(stops) for stops in routes]) +
+            self.penalty*sum(unassigned.values()))
+
+    def place_reloads(self, stops):
+        """Returns a hauler to the start-of-day hub between sites that can't
+        be travelled between directly, and drops returns that aren't needed
+
+        Parameters
+        ----------
+        stops : list
+            The locations the hauler stops at between the hubs
+
+        Returns
+        -------
+        stops : list
+            The stops, with returns to reload only where they are needed
+        """
+
+        start = self.start_hub
+
+        placed = []
+        for i in stops:
+            previous = placed[-1] if len(placed) > 0 else start
+            if i == start:
+                if previous != start:
+                    placed.append(i)
+            else:
+                if self.capacity[previous][i] == 0:
+                    placed.append(start)
+                placed.append(i)
+
+        # returning to reload just before the end of the day does nothing
+        while len(placed) > 0 and placed[-1] == start:
+            placed.pop()
+
+        # nor does returning between sites that can be travelled between
+        # directly for no more miles
+        tidy = []
+        for n, i in enumerate(placed):
+            if i == start and len(tidy) > 0 and n + 1 < len(placed):
+                a, b = tidy[-1], placed[n + 1]
+                if (self.capacity[a][b] > 0 and self.miles[a][b] <=
+                    self.miles[a][start] + self.miles[start][b]):
+                    continue
+            tidy.append(i)
+
+        return tidy
+
+    def share_routes(self, routes):
+        """Returns haulers to the start-of-day hub between sites whose route
+        the fleet travels more often than its route constraint allows
+
+        Parameters
+        ----------
+        routes : list
+            The stops of each hauler, changed in place
+        """
+
+        start = self.start_hub
+
+        excess = dict((arc, count - self.capacity[arc[0]][arc[1]]) for arc,
+            count in self.usage(routes).items() if count >
+            self.capacity[arc[0]][arc[1]])
+        if len(excess) == 0:
+            return
+
+        for r, stops in enumerate(routes):
+            shared = []
+            previous = start
+            for i in stops + [self.end_hub]:
+                if (excess.get((previous, i), 0) > 0 and previous != start and
+                    i != start):
+                    excess[previous, i] -= 1
+                    shared.append(start)
+                shared.append(i)
+                previous = i
+            routes[r] = shared[:-1]
+
+    def tidy(self, routes, unassigned):
+        """Makes every route travellable after stops are removed or added,
+        taking sites off any route that runs past the length of the day
+
+        Parameters
+        ----------
+        routes : list
+            The stops of each hauler, changed in place
+
+        unassigned : collections.Counter
+            The drop-offs and pick-ups left unmet at each site, changed in
+            place
+        """
+
+        while True:
+            for r in range(len(routes)):
+                routes[r] = self.place_reloads(routes[r])
+            self.share_routes(routes)
+
+            over = [r for r in range(len(routes)) if
+                self.route_minutes(routes[r]) > self.day_minutes and
+                any([i != self.start_hub for i in routes[r]])]
+            if len(over) == 0:
+                break
+
+            # take off the site that saves the most time, then tidy again
+            for r in over:
+                walk = self.walk(routes[r])
+                savings = [(self.minutes[walk[p-1]][walk[p]] +
+                    self.minutes[walk[p]][walk[p+1]] -
+                    self.minutes[walk[p-1]][walk[p+1]], p)
+                    for p in range(1, len(walk) - 1)
+                    if walk[p] != self.start_hub]
+                saving, p = max(savings)
+                unassigned[walk[p]] += 1
+                del routes[r][p - 1]
+
+    def insertion_sequences(self, a, i, b):
+        """The ways a site can be added between two stops: directly, after a
+        return to reload, or followed by one"""
+
+        sequences = [(i,)]
+        if a != self.start_hub:
+            sequences.append((self.start_hub, i))
+        if b != self.start_hub and b != self.end_hub:
+            sequences.append((i, self.start_hub))
+
+        return sequences
+
+    def route_insertion(self, stops, minutes, usage, i, r):
+        """Finds the cheapest way of adding a drop-off or pick-up at a site to
+        a route
+
+        Parameters
+        ----------
+        stops : list
+            The stops of the hauler
+
+        minutes : int
+            The minutes the hauler works
+
+        usage : collections.Counter
+            How many times the fleet takes each route
+
+        i : int
+            The site
+
+        r : int
+            The index of the hauler
+
+        Returns
+        -------
+        insertion : tuple
+            The added miles, hauler, position and stops of the cheapest
+            insertion, or None if the site doesn't fit in the route
+        """
+
+        miles = self.miles
+        route_minutes = self.minutes
+        walk = self.walk(stops)
+        slack = self.day_minutes - minutes
+        best = None
+
+        for p in range(len(walk) - 1):
+            a, b = walk[p], walk[p + 1]
+
+            for sequence in self.insertion_sequences(a, i, b):
+                path = (a,) + sequence + (b,)
+                arcs = list(zip(path[:-1], path[1:]))
+
+                added_minutes = (sum([route_minutes[u][v] for u, v in arcs]) -
+                    route_minutes[a][b])
+                if added_minutes > slack:
+                    continue
+
+                added_miles = (sum([miles[u][v] for u, v in arcs]) -
+                    miles[a][b])
+                if best is not None and added_miles >= best[0]:
+                    continue
+
+                if self.fits(arcs, (a, b), usage):
+                    best = (added_miles, r, p, sequence)
+
+        return best
+
+    def fits(self, arcs, replaced, usage):
+        """Whether routes can be taken in place of another without any route
+        being taken more often than it's allowed"""
+
+        return all([usage[u, v] + 1 - ((u, v) == replaced) <=
+            self.capacity[u][v] for u, v in arcs])
+
+    def insert(self, routes, unassigned, regret):
+        """Adds unmet drop-offs and pick-ups to the routes one at a time
+        until no more fit
+
+        The cheapest insertion of each site into each route is kept between
+        insertions, and only those into the route just changed are found
+        again.
+
+        Parameters
+        ----------
+        routes : list
+            The stops of each hauler, changed in place
+
+        unassigned : collections.Counter
+            The drop-offs and pick-ups left unmet at each site, changed in
+            place
+
+        regret : bool
+            Whether to add the site that would cost the most to add to its
+            second best route instead of its best first, rather than the site
+            that is cheapest to add
+        """
+
+        minutes = [self.route_minutes(stops) for stops in routes]
+        usage = self.usage(routes)
+        cache = {}
+
+        while True:
+            choice = None
+            for i in sorted(unassigned):
+                if unassigned[i] == 0:
+                    continue
+
+                for r in range(len(routes)):
+                    if (i, r) not in cache:
+                        cache[i, r] = self.route_insertion(routes[r],
+                            minutes[r], usage, i, r)
+
+                insertions = sorted([cache[i, r] for r in range(len(routes))
+                    if cache[i, r] is not None])
+                if len(insertions) == 0:
+                    continue
+
+                if regret and len(insertions) > 1:
+                    key = (insertions[0][0] - insertions[1][0],
+                        insertions[0][0])
+                elif regret:
+                    key = (-np.inf, insertions[0][0])
+                else:
+                    key = (insertions[0][0],)
+
+                if choice is None or key < choice[0]:
+                    choice = (key, i, insertions[0])
+
+            if choice is None:
+                break
+
+            key, i, (added_miles, r, p, sequence) = choice
+            walk = self.walk(routes[r])
+            path = (walk[p],) + sequence + (walk[p + 1],)
+            arcs = list(zip(path[:-1], path[1:]))
+
+            # insertions kept from before other routes changed may no longer
+            # fit, so find this one again
+            if not self.fits(arcs, (walk[p], walk[p + 1]), usage):
+                del cache[i, r]
+                continue
+
+            usage[walk[p], walk[p + 1]] -= 1
+            usage.update(arcs)
+            minutes[r] += (sum([self.minutes[u][v] for u, v in arcs]) -
+                self.minutes[walk[p]][walk[p + 1]])
+            routes[r][p:p] = list(sequence)
+            unassigned[i] -= 1
+
+            for j in unassigned:
+                cache.pop((j, r), None)
+
+    def greedy_insertion(self, routes, unassigned):
+        """Repairs routes by adding the cheapest drop-off or pick-up first"""
+
+        self.insert(routes, unassigned, regret = False)
+
+    def regret_insertion(self, routes, unassigned):
+        """Repairs routes by adding the drop-off or pick-up with the most to
+        lose from waiting first
+        """
+
+        self.insert(routes, unassigned, regret = True)
+
+    def site_stops(self, routes):
+        """Lists the (route, position) of every stop at a site"""
+
+        return [(r, p) for r, stops in enumerate(routes)
+            for p, i in enumerate(stops) if i != self.start_hub]
+
+    def remove_stops(self, routes, unassigned, removals):
+        """Takes stops off routes, leaving their drop-offs or pick-ups unmet"""
+
+        for r, p in sorted(set(removals), reverse = True):
+            unassigned[routes[r][p]] += 1
+            del routes[r][p]
+
+    def random_removal(self, routes, unassigned, q):
+        """Destroys routes by removing randomly chosen stops"""
+
+        stops = self.site_stops(routes)
+        self.remove_stops(routes, unassigned, self.random.sample(stops,
+            min(q, len(stops))))
+
+    def worst_removal(self, routes, unassigned, q):
+        """Destroys routes by removing the stops that add the most miles,
+        with some randomness
+        """
+
+        savings = []
+        for r, p in self.site_stops(routes):
+            walk = self.walk(routes[r])
+            a, i, b = walk[p], walk[p + 1], walk[p + 2]
+            savings.append((self.miles[a][i] + self.miles[i][b] -
+                self.miles[a][b], r, p))
+        savings.sort(reverse = True)
+
+        removals = []
+        while len(removals) < q and len(savings) > 0:
+            n = int(len(savings)*self.random.random()**3)
+            saving, r, p = savings.pop(n)
+            removals.append((r, p))
+
+        self.remove_stops(routes, unassigned, removals)
+
+    def related_removal(self, routes, unassigned, q):
+        """Destroys routes by removing the stops closest to a randomly chosen
+        stop, so they can be rearranged amongst each other
+        """
+
+        stops = self.site_stops(routes)
+        if len(stops) == 0:
+            return
+
+        r, p = self.random.choice(stops)
+        seed = routes[r][p]
+        stops.sort(key = lambda stop: (self.miles[seed][routes[stop[0]][stop[1]]],
+            self.random.random()))
+
+        self.remove_stops(routes, unassigned, stops[:q])
+
+    def route_removal(self, routes, unassigned, q):
+        """Destroys a whole route, more likely the shorter ones, so its stops
+        can be shared out amongst the other haulers
+        """
+
+        used = [r for r, stops in enumerate(routes) if len(stops) > 0]
+        if len(used) == 0:
+            return
+
+        used.sort(key = lambda r: len(routes[r]))
+        r = used[int(len(used)*self.random.random()**2)]
+
+        self.remove_stops(routes, unassigned, [(r, p) for p, i in
+            enumerate(routes[r]) if i != self.start_hub])
+        routes[r] = []
+
+    def choose(self, weights):
+        """Chooses an operator with probability in proportion to its weight"""
+
+        pick = self.random.random()*sum(weights)
+        for n, weight in enumerate(weights):
+            pick -= weight
+            if pick < 0:
+                return n
+
+        return len(weights) - 1
+
+    def initial_solution(self, fleet_size):
+        """Starts the search from the routes found for the last fleet size
+        solved, or else the routes given to start from, keeping the busiest
+        routes that fit in the fleet
+
+        Parameters
+        ----------
+        fleet_size : int
+            The number of haulers in the fleet
+
+        Returns
+        -------
+        routes : list
+            The stops of each hauler
+
+        unassigned : collections.Counter
+            The drop-offs and pick-ups left unmet at each site
+        """
+
+        source = self.routes or self.start_routes or []
+        source = sorted(source, key = lambda stops: -len(stops))[:fleet_size]
+
+        # never serve a site more often than it needs
+        served = collections.Counter()
+        routes = []
+        for stops in source:
+            kept = []
+            for i in stops:
+                if i != self.start_hub:
+                    if served[i] >= self.site_demand[i]:
+                        continue
+                    served[i] += 1
+                kept.append(i)
+            routes.append(kept)
+
+        routes.extend([[] for k in range(fleet_size - len(routes))])
+
+        unassigned = self.site_demand - served
+        self.tidy(routes, unassigned)
+
+        return routes, unassigned
+
+    def search(self, routes, unassigned, time_limit):
+        """Improves routes by destroying and repairing them until out of
+        iterations or time
+
+        Parameters
+        ----------
+        routes : list
+            The stops of each hauler to start from
+
+        unassigned : collections.Counter
+            The drop-offs and pick-ups left unmet at each site
+
+        time_limit : float
+            The most seconds the search may take, or None for no limit
+
+        Returns
+        -------
+        best : list
+            The stops of each hauler in the best routes found that meet all
+            demand, or None if none were found
+
+        report : dict
+            How many iterations were run and which found the best routes
+        """
+
+        started = time.time()
+
+        self.greedy_insertion(routes, unassigned)
+        self.tidy(routes, unassigned)
+
+        current = (routes, unassigned)
+        current_cost = self.cost(routes, unassigned)
+
+        best = None
+        best_cost = np.inf
+        best_iteration = 0
+        if sum(unassigned.values()) == 0:
+            best = [list(stops) for stops in routes]
+            best_cost = current_cost
+
+        # stop once the best routes haven't improved in this many iterations
+        patience = max(self.segment, self.iterations//4)
+
+        # accept routes 5% worse than the first with probability one half at
+        # first, cooling to almost never by the last iteration
+        temperature = 0.05*current_cost/math.log(2) + 1e-9
+        cooling = 0.01**(1.0/max(self.iterations, 1))
+
+        num_destroy = len(self.destroy_operators)
+        num_repair = len(self.repair_operators)
+        destroy_weights = [1.0]*num_destroy
+        repair_weights = [1.0]*num_repair
+        destroy_scores = [0.0]*num_destroy
+        repair_scores = [0.0]*num_repair
+        destroy_uses = [0]*num_destroy
+        repair_uses = [0]*num_repair
+
+        units = sum(self.site_demand.values())
+
+        iteration = 0
+        while iteration < self.iterations and units > 0:
+            if time_limit is not None and time.time() - started > time_limit:
+                break
+            if best is not None and iteration - best_iteration > patience:
+                break
+            iteration += 1
+
+            d = self.choose(destroy_weights)
+            r = self.choose(repair_weights)
+
+            routes = [list(stops) for stops in current[0]]
+            unassigned = collections.Counter(current[1])
+
+            q = self.random.randint(min(2, units), max(2, int(0.3*units)))
+            self.destroy_operators[d](routes, unassigned, q)
+            self.tidy(routes, unassigned)
+            self.repair_operators[r](routes, unassigned)
+            self.tidy(routes, unassigned)
+
+            cost = self.cost(routes, unassigned)
+            score = 0
+
+            if sum(unassigned.values()) == 0 and cost < best_cost - 1e-9:
+                best = [list(stops) for stops in routes]
+                best_cost = cost
+                best_iteration = iteration
+                score = self.scores[0]
+
+            if cost < current_cost - 1e-9:
+                current, current_cost = (routes, unassigned), cost
+                score = max(score, self.scores[1])
+            elif self.random.random() < math.exp(-(cost - current_cost)/
+                temperature):
+                current, current_cost = (routes, unassigned), cost
+                score = max(score, self.scores[2])
+
+            destroy_scores[d] += score
+            repair_scores[r] += score
+            destroy_uses[d] += 1
+            repair_uses[r] += 1
+
+            # move the weights towards each operator's average score
+            if iteration % self.segment == 0:
+                for weights, scores, uses in ((destroy_weights,
+                    destroy_scores, destroy_uses), (repair_weights,
+                    repair_scores, repair_uses)):
+                    for n in range(len(weights)):
+                        if uses[n] > 0:
+                            weights[n] = ((1 - self.reaction)*weights[n] +
+                                self.reaction*scores[n]/uses[n])
+                        weights[n] = max(weights[n], 0.01)
+                        scores[n], uses[n] = 0.0, 0
+
+            temperature *= cooling
+
+        report = {
+            'iterations': iteration,
+            'best_iteration': best_iteration
+        }
+
+        return best, report
+
+    def solve(self, relax = False):
+        """Searches for routes that meet all demand with the fleet currently
+        being tested
+
+        Parameters
+        ----------
+        relax : bool, optional
+            There is no relaxation to solve, so a relaxed solve never rules
+            out a fleet size
+
+        Returns
+        -------
+        results : dict
+            Returns whether or not routes meeting all demand were found (never
+            proven optimal), the total number of miles run by the fleet, the
+            number of times each hauler ran each route, and how long the
+            search ran.
+        """
+
+        if relax:
+            self.solution = None
+            x, y = self.solution_arrays()
+            results = {
+                'status': 'Not Solved',
+                'outcome': TIMED_OUT,
+                'objective': None,
+                'x': x,
+                'y': y,
+                'search': {}
+            }
+            return results
+
+        routes, unassigned = self.initial_solution(len(self.haulers))
+
+        time_limit = combine_time_limits(self.solve_time_limit,
+            self.deadline.share(2))
+        self.solution, report = self.search(routes, unassigned, time_limit)
+
+        if self.solution is not None:
+            self.routes = self.solution
+            status, outcome = 'Optimal', FEASIBLE_WITH_GAP
+            objective = sum([self.route_miles(stops) for stops in
+                self.solution])
+        else:
+            status, outcome = 'Not Solved', TIMED_OUT
+            objective = None
+
+        x, y = self.solution_arrays()
+
+        results = {
+            'status': status,
+            'outcome': outcome,
+            'objective': objective,
+            'x': x,
+            'y': y,
+            'search': report
+        }
+
+        return results
+
+    def travelled_arcs(self, k):
+        """Lists the routes a hauler travels in the current solution
+
+        Parameters
+        ----------
+        k : int
+            The index of the hauler
+
+        Returns
+        -------
+        arcs : list
+            The (i, j) location pairs of the routes the hauler travels
+        """
+
+        walk = self.walk(self.solution[k])
+        return sorted(set(zip(walk[:-1], walk[1:])))
+
+    def solution_arrays(self):
+        """Counts the routes each hauler travels in the last solution found,
+        as the routing Integer Program's variables
+
+        Returns
+        -------
+        x : numpy.ndarray
+            The number of times each hauler travels each route, indexed by the
+            route's (i, j) locations then the hauler
+
+        y : numpy.ndarray
+            Whether or not each hauler enters each subset, indexed by subset
+            then hauler (the search has no subsets)
+        """
+
+        num_locations = len(self.locations)
+        x = np.zeros((num_locations, num_locations, len(self.haulers)))
+        y = np.zeros((len(self.subsets), len(self.haulers)))
+
+        if self.solution is None:
+            return x, y
+
+        for k, stops in enumerate(self.solution):
+            walk = self.walk(stops)
+            np.add.at(x, (walk[:-1], walk[1:], k), 1)
+
+        return x, y
@@ -0,0 +1,424 @@
+import numpy as np
+import scipy.sparse as sp
+import timeit
+
+from hauler_routing import RoutingModel
+from solvers import NO_SOLUTION
+
+class MatrixRoutingModel(RoutingModel):
+    """The equipment hauler routing Integer Program of RoutingModel, built
+    directly as NumPy/SciPy sparse arrays and handed to the solver backend as
+    matrices
+
+    Columns are ordered by hauler, each hauler having one column per
+    travelable route followed by one per subset. The rows belonging to a
+    single hauler are built once as a sparse block and repeated along the
+    diagonal for each hauler in the fleet, so no Python loops run over
+    locations, haulers or subsets.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+    """
+
+    def __init__(self, fixed_parameters, variable_parameters):
+
+        RoutingModel.__init__(self, fixed_parameters, variable_parameters)
+
+        num_locations = len(self.locations)
+
+        # the start and end of each travelable route
+        arcs = np.array(self.arcs, dtype=int).reshape(-1, 2)
+        self.tails = arcs[:, 0]
+        self.heads = arcs[:, 1]
+
+        travel = np.asarray(self.travel, dtype=float)
+        route_constraints = np.asarray(self.route_constraints, dtype=float)
+
+        # miles and minutes (driving plus one handle) of each route
+        self.arc_miles = travel[self.tails, self.heads]
+        self.arc_minutes = self.handle + (self.arc_miles/self.rate).astype(int)
+
+        # routes whose route constraint can bind, and their limits
+        arc_index = dict((arc, a) for a, arc in enumerate(self.arcs))
+        self.limited_index = np.array([arc_index[arc] for arc in
+            self.limited_arcs], dtype=int)
+        self.limits = route_constraints[self.tails[self.limited_index],
+            self.heads[self.limited_index]]
+
+        self.demand_magnitude = np.absolute(np.asarray(self.demand,
+            dtype=float))
+        self.customer_index = np.asarray(self.customers, dtype=int)
+
+        # which routes leave and enter each location
+        num_arcs = len(self.arcs)
+        self.leaves = sp.csr_matrix((np.ones(num_arcs), (self.tails,
+            np.arange(num_arcs))), shape=(num_locations, num_arcs))
+        self.enters = sp.csr_matrix((np.ones(num_arcs), (self.heads,
+            np.arange(num_arcs))), shape=(num_locations, num_arcs))
+
+        self.solution = None
+
+    def set_fleet_size(self, fleet_size):
+        """Grows or shrinks the fleet of haulers the model will be solved for
+
+        Parameters
+        ----------
+        fleet_size : int
+            The number of haulers in the fleet for the next solve
+        """
+
+        self.haulers = range(fleet_size)
+
+    def add_subset(self, subset):
+        """Adds a subset of customers that every hauler's routes must
+        leave if they enter it
+
+        Parameters
+        ----------
+        subset : list
+            The indices of the customers in the subset
+        """
+
+        self.subsets.append(subset)
+        self.subset_indices = range(len(self.subsets))
+
+    def make_hauler_matrix(self):
+        """Builds the rows for constraints 2.2 - 2.5 and 2.8 - 2.9 for a single
+        hauler
+
+        Returns
+        -------
+        A : scipy.sparse.csr_matrix
+            The coefficients of one hauler's route and subset columns in
+            each of his rows
+
+        row_lower, row_upper : numpy.ndarray
+            The bounds on each of those rows
+        """
+
+        num_arcs = len(self.arcs)
+        num_subsets = len(self.subsets)
+        start_hub = self.locations[0]
+        end_hub = self.end_hub
+        customers = self.customer_index
+
+        # 2.2
+        # Each hauler must leave the start_hub (locations[0]) each day (but can
+        # return to un/reload) but it cannot go from start_hub to start_hub
+        leave_start = ((self.tails == start_hub) &
+            (self.heads != start_hub)).astype(float)
+
+        # 2.3
+        # If a hauler goes to a site, he must also leave from that site
+        flow = self.enters[customers] - self.leaves[customers]
+
+        # 2.4
+        # All haulers must return to the end-of-day hub
+        return_end = (self.heads == end_hub).astype(float)
+
+        # 2.5
+        # A hauler may only operate L hours in a day, plus one handle
+        day_length = self.arc_minutes
+
+        # 2.8 - 2.9
+        # Whether or not a hauler travels amongst a set of customers, and if
+        # he does, that he leaves it
+        member = np.zeros((num_subsets, len(self.locations)), dtype=bool)
+        for m, subset in enumerate(self.subsets):
+            member[m, subset] = True
+        inside = (member[:, self.tails] & member[:, self.heads]).astype(float)
+        leaving = (member[:, self.tails] & ~member[:, self.heads]).astype(float)
+
+        arc_rows = sp.vstack([
+            sp.csr_matrix(leave_start),
+            flow,
+            sp.csr_matrix(return_end),
+            sp.csr_matrix(day_length),
+            sp.csr_matrix(inside),
+            sp.csr_matrix(leaving)
+        ])
+
+        identity = sp.identity(num_subsets)
+        subset_rows = sp.vstack([
+            sp.csr_matrix((3 + len(customers), num_subsets)),
+            -self.M*identity,
+            -identity
+        ])
+
+        A = sp.hstack([arc_rows, subset_rows]).tocsr()
+
+        row_lower = np.concatenate([[1], np.zeros(len(customers)), [1, -np.inf],
+            np.full(num_subsets, -np.inf), np.zeros(num_subsets)])
+        row_upper = np.concatenate([[np.inf], np.zeros(len(customers)),
+            [1, self.L + self.handle], np.zeros(num_subsets),
+            np.full(num_subsets, np.inf)])
+
+        return A, row_lower, row_upper
+
+    def make_matrices(self):
+        """Assembles the objective, constraint matrix and bounds for the fleet
+        currently being tested
+
+        Returns
+        -------
+        matrices : dict
+            The objective coefficients, sparse constraint matrix, row bounds,
+            column bounds and integrality of every column
+        """
+
+        num_haulers = len(self.haulers)
+        num_arcs = len(self.arcs)
+        num_subsets = len(self.subsets)
+        num_columns = num_arcs + num_subsets
+
+        hauler_A, hauler_lower, hauler_upper = self.make_hauler_matrix()
+
+        # selects each hauler's route columns out of his block of columns
+        arc_columns = sp.hstack([sp.identity(num_arcs),
+            sp.csr_matrix((num_arcs, num_subsets))])
+        every_hauler = sp.csr_matrix(np.ones((1, num_haulers)))
+
+        # 2.6
+        # Each site's demand for dropped-off/picked-up equipment sets must be met
+        demand_rows = sp.kron(every_hauler,
+            self.leaves[self.customer_index].dot(arc_columns))
+        demand = self.demand_magnitude[self.customer_index]
+
+        # 2.7
+        # Haulers are limited by how many times a given route between two sites
+        # can be traveled
+        route_rows = sp.kron(every_hauler, arc_columns.tocsr()[self.limited_index])
+
+        A = sp.vstack([
+            sp.kron(sp.identity(num_haulers), hauler_A),
+            demand_rows,
+            route_rows
+        ]).tocsr()
+
+        row_lower = np.concatenate([np.tile(hauler_lower, num_haulers), demand,
+            np.full(len(self.limits), -np.inf)])
+        row_upper = np.concatenate([np.tile(hauler_upper, num_haulers), demand,
+            self.limits])
+
+        # 2.1
+        # Objective is to minimize total distance traveled by all haulers
+        c = np.tile(np.concatenate([self.arc_miles, np.zeros(num_subsets)]),
+            num_haulers)
+
+        # 2.10 - 2.11
+        lower = np.zeros(num_columns*num_haulers)
+        upper = np.tile(np.concatenate([np.full(num_arcs, np.inf),
+            np.ones(num_subsets)]), num_haulers)
+
+        matrices = {
+            'c': c,
+            'A': A,
+            'row_lower': row_lower,
+            'row_upper': row_upper,
+            'lower': lower,
+            'upper': upper,
+            'integrality': np.ones(num_columns*num_haulers)
+        }
+
+        return matrices
+
+    def solve_problem(self, relax):
+        """Builds and solves the routing problem for the fleet currently being
+        tested once
+
+        Parameters
+        ----------
+        relax : bool
+            Whether to solve only the LP relaxation of the problem
+
+        Returns
+        -------
+        status : str
+            The solver's status for the problem, named as PuLP names them
+
+        objective : float
+            The total number of miles run by the fleet
+
+        outcome : str
+            Whether the solution is optimal, feasible with a gap, timed out
+            without a solution, or proven not to exist
+        """
+
+        matrices = self.make_matrices()
+
+        # a fleet of no haulers can't meet any demand
+        if len(matrices['c']) == 0:
+            self.solution = None
+            return 'Infeasible', None, NO_SOLUTION
+
+        # start from the routes set by set_mip_start or the last fleet
+        # size's solution, for backends that can be given a start
+        start = None
+        if len(self.warm_start) > 0 and not relax:
+            start = self.start_values()
+
+        status, objective, self.solution, outcome = \
+            self.backend.solve_matrices(matrices, relax, 'morton_function_4',
+            self.deadline.share(2), start)
+
+        # count the miles of the rounded solution so they come out whole,
+        # and keep it to start the next fleet size tested from
+        if self.solution is not None and not relax:
+            objective = matrices['c'].dot(np.round(self.solution))
+            self.keep_warm_start()
+
+        return status, objective, outcome
+
+    def start_values(self):
+        """Lays the warm start out as the value of each column, the same way
+        RoutingModel.set_initial_values seeds its variables
+
+        Haulers that were not part of the warm start are started on the route
+        from the start-of-day hub straight to the end-of-day hub, which is
+        equivalent to not being used.
+
+        Returns
+        -------
+        start : numpy.ndarray
+            The value of each column to start the solve from
+        """
+
+        unused = np.array([i == self.locations[0] and j == self.end_hub for
+            i, j in self.arcs], dtype=float)
+
+        start = []
+        for k in self.haulers:
+            start.append([self.warm_start.get('x_%s_%s_%s' % (i, j, k),
+                unused[a]) for a, (i, j) in enumerate(self.arcs)])
+            start.append([self.warm_start.get('y_%s_%s' % (m, k), 0) for m in
+                self.subset_indices])
+
+        return np.concatenate(start).astype(float)
+
+    def keep_warm_start(self):
+        """Keeps the last solution, named as RoutingModel names its variables,
+        to start the next solve from"""
+
+        x, y = self.solution_values()
+
+        self.warm_start = {}
+        for k in self.haulers:
+            for a, (i, j) in enumerate(self.arcs):
+                self.warm_start['x_%s_%s_%s' % (i, j, k)] = x[k, a]
+            for m in self.subset_indices:
+                self.warm_start['y_%s_%s' % (m, k)] = y[k, m]
+
+    def solution_values(self):
+        """Reshapes the last solution into route and subset values by hauler
+
+        Returns
+        -------
+        x : numpy.ndarray
+            The number of times each hauler travels each route, indexed by
+            hauler then route
+
+        y : numpy.ndarray
+            Whether or not each hauler enters each subset, indexed by hauler
+            then subset
+        """
+
+        num_arcs = len(self.arcs)
+        values = np.round(self.solution).reshape(len(self.haulers), -1)
+
+        return values[:, :num_arcs], values[:, num_arcs:]
+
+    def travelled_arcs(self, k):
+        """Lists the routes a hauler travels in the current solution
+
+        Parameters
+        ----------
+        k : int
+            The index of the hauler
+
+        Returns
+        -------
+        arcs : list
+            The (i, j) location pairs of the routes the hauler travels
+        """
+
+        x, y = self.solution_values()
+
+        return [self.arcs[a] for a in np.flatnonzero(x[k] > 0.5)]
+
+    def solution_arrays(self):
+        """Gathers the last solution into arrays by location and hauler
+
+        Returns
+        -------
+        x : numpy.ndarray
+            The number of times each hauler travels each route, indexed by the
+            route's (i, j) locations then the hauler
+
+        y : numpy.ndarray
+            Whether or not each hauler enters each subset, indexed by subset
+            then hauler
+        """
+
+        num_locations = len(self.locations)
+        x = np.zeros((num_locations, num_locations, len(self.haulers)))
+        y = np.zeros((len(self.subsets), len(self.haulers)))
+
+        if self.solution is None:
+            return x, y
+
+        arc_values, subset_values = self.solution_values()
+        x[self.tails, self.heads, :] = arc_values.T
+        y[:, :] = subset_values.T
+
+        return x, y
+
+def benchmark_builders(fixed_parameters, variable_parameters, fleet_size,
+    repeats = 3):
+    """Times building the routing model for a fleet with the PuLP builder
+    and with the matrix builder
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    variable_parameters : dict
+        The parameters that vary by day but are still needed for our model
+        to run
+
+    fleet_size : int
+        The number of haulers in the fleet
+
+    repeats : int, optional
+        How many times to build each model, keeping the fastest
+
+    Returns
+    -------
+    timings : dict
+        The fastest time in seconds each builder took to build the model
+    """
+
+    def build_pulp():
+        model = RoutingModel(fixed_parameters, variable_parameters)
+        model.set_fleet_size(fleet_size)
+        model.make_problem()
+
+    def build_matrix():
+        model = MatrixRoutingModel(fixed_parameters, variable_parameters)
+        model.set_fleet_size(fleet_size)
+        model.make_matrices()
+
+    timings = {
+        'pulp': min(timeit.repeat(build_pulp, number = 1, repeat = repeats)),
+        'matrix': min(timeit.repeat(build_matrix, number = 1, repeat = repeats))
+    }
+
+    return timings
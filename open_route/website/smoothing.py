@@ -1,8 +1,14 @@
 from pulp import *
 import numpy as np
 import pandas as pd
+import timeit
+import multiprocessing
 
-def smoothing_model(d, s):
+from solvers import (PulpBackend, Deadline, OPTIMAL, FEASIBLE_WITH_GAP,
+    TIMED_OUT)
+from memo import get_cache, fingerprint
+
+def smoothing_model(d, windows, backend = None, time_limit = None):
     """The integer program responsible for smoothing 'period' days of demand
 
     Minimizes the total number of demand for any one day, while ensuring all
@@ -13,17 +19,23 @@ def smoothing_model(d, s):
     d : numpy.ndarray
         The number of drop-offs or pick-ups each site needs each day
 
-    s : list
-        Three dimensional list describing the alternative delivery dates
-        each site has for each day it has demand. If a site has no demand on
-        a given day, its list of alternatives is empty.
+    windows : dict
+        The days each site's demand on each day can be moved to (see
+        make_windows)
+
+    backend : solvers.PulpBackend or solvers.HighsBackend, optional
+        The solver to hand the IP to, CBC through PuLP if not given
+
+    time_limit : float, optional
+        The most seconds the solve may take, or None for no limit
     
     Returns
     -------
     results : dict
-        Whether or not the IP solved to optimality, what the largest
-        demand for the period was after smoothing, and the newly assigned
-        demands to each site each day.
+        Whether or not the IP found a solution and whether it is optimal,
+        feasible with a gap or timed out, what the largest demand for the
+        period was after smoothing, and the newly assigned demands to each
+        site each day as an array 'w' indexed by site then day.
     """
 
     num_locations, num_days = d.shape
@@ -47,36 +59,570 @@ def smoothing_model(d, s):
     # 1.2
     # sum of pick-ups/drop-offs for each site over all days in window must
     # equal magnitude of demand on original date for that site
-    for i in locations:
-        for l in days:
-            if len(s[i][l]) > 0:
-                prob += lpSum([w[i][l_prime] for l_prime in s[i][l]]) \
-                        == abs(d[i][l])
+    for i, start, end, demand in zip(windows['site'], windows['start'],
+        windows['end'], windows['demand']):
+        prob += lpSum([w[i][l_prime] for l_prime in range(start, end)]) \
+                == demand
 
     # 1.3
     # z must be greater than or equal to each day's sum of deliveries
     for l in days:
         prob += lpSum([w[i][l] for i in locations]) <= z
 
-    prob.writeLP('smoothing.lp')
+    if backend is None:
+        backend = PulpBackend()
+
+    status, objective, outcome = backend.solve_problem(prob,
+        time_limit = time_limit)
+
+    # drop-offs/pick-ups assigned to each site each day, with any the solver
+    # gave no value to left at 0
+    w = np.array([[w[i][l].varValue or 0 for l in days] for i in locations],
+        dtype=float).reshape(num_locations, num_days)
+
+    results = {
+        'status': status,
+        'outcome': outcome,
+        'objective': objective,
+        'w': w
+    }
+
+    return results
+
+class SmoothingModel(object):
+    """The demand smoothing integer program of smoothing_model for periods of
+    one shape, built once and re-solved for each period's demand
+
+    Every site has a row for drop-offs over the days before and including
+    each day, and a row for pick-ups over the days after and including it,
+    so a row never changes from one period to the next, only its right-hand
+    side, the demand. Each period sets the right-hand sides of the rows for
+    the demand its sites actually have, and hands just those rows and the
+    rows of each day to the solver.
+
+    With CBC through PuLP, the rows are PuLP constraints, each built the
+    first time a period needs it. With any other backend, they are rows of
+    one sparse matrix, built up front, which the solver takes directly.
+
+    Each solve starts from the last solution found for every site it still
+    meets the demand of (see start_values).
+
+    Parameters
+    ----------
+    num_locations : int
+        The number of sites in each period
+
+    num_days : int
+        The number of days in each period
+
+    window : int
+        The number of different days a site can have equipment dropped-off or
+        picked-up
+
+    backend : solvers.PulpBackend or solvers.HighsBackend, optional
+        The solver to hand the IP to, CBC through PuLP if not given
+    """
+
+    def __init__(self, num_locations, num_days, window, backend = None):
+
+        self.num_locations = num_locations
+        self.num_days = num_days
+        self.window = window
+        self.backend = backend if backend is not None else PulpBackend()
+
+        # PuLP's solvers take problems, any other backend matrices
+        self.matrix_form = self.backend.name != 'pulp'
+
+        # the last solution found, to start the next solve from
+        self.last_w = None
+
+        if self.matrix_form:
+            self.make_rows()
+            return
+
+        locations = range(num_locations)
+        days = range(num_days)
+
+        # variable detailing number of drop-offs/pick-ups in each day in time
+        # window for each site
+        self.w = LpVariable.dicts('w', (locations,days), lowBound = 0,
+            upBound = None, cat = 'Integer')
+
+        # variable detailing max number of drop-offs/pickups at all sites in
+        # each day
+        self.z = LpVariable('z', lowBound = 0, upBound = None,
+            cat = 'Integer')
+
+        # 1.3
+        # z must be greater than or equal to each day's sum of deliveries
+        self.day_rows = [LpConstraint(LpAffineExpression([(self.w[i][l], 1)
+            for i in locations] + [(self.z, -1)]), LpConstraintLE,
+            'day_%s' % l, 0) for l in days]
+
+        # rows of the demand of each site and day, drop-off or pick-up, made
+        # the first time a period has that demand
+        self.demand_rows = {}
+
+    def make_rows(self):
+        """Builds every row of the program as one sparse matrix, for backends
+        that take the matrix form"""
+
+        # the sparse matrices need scipy, so only import it when asked for
+        import scipy.sparse as sp
+
+        num_locations = self.num_locations
+        num_days = self.num_days
+        window = self.window
+        num_cells = num_locations*num_days
+
+        # which days are within the window before and after each day
+        days = np.arange(num_days)
+        before = ((days[None, :] <= days[:, None]) &
+            (days[None, :] > days[:, None] - window)).astype(float)
+        after = ((days[None, :] >= days[:, None]) &
+            (days[None, :] < days[:, None] + window)).astype(float)
+
+        # columns are each site's drop-offs/pick-ups each day, by site then
+        # day, followed by z
+        site_identity = sp.identity(num_locations)
+        no_z = sp.csr_matrix((num_cells, 1))
+
+        # 1.2
+        # sum of drop-offs over the days before, or pick-ups over the days
+        # after, each day must equal the magnitude of the site's demand that
+        # day, if it has any
+        drop_off_rows = sp.hstack([sp.kron(site_identity, before), no_z])
+        pick_up_rows = sp.hstack([sp.kron(site_identity, after), no_z])
+
+        # 1.3
+        # z must be greater than or equal to each day's sum of deliveries
+        day_rows = sp.hstack([sp.kron(np.ones((1, num_locations)),
+            sp.identity(num_days)), -np.ones((num_days, 1))])
+
+        self.A = sp.vstack([drop_off_rows, pick_up_rows, day_rows]).tocsr()
+
+        # 1.1
+        # minimize greatest amount of drop-offs/pick-ups on one day in current
+        # period
+        self.c = np.zeros(num_cells + 1)
+        self.c[-1] = 1
+
+    def make_problem(self, windows):
+        """Assembles the PuLP problem of one period's demand
+
+        Parameters
+        ----------
+        windows : dict
+            The days each site's demand on each day can be moved to (see
+            make_windows)
+
+        Returns
+        -------
+        prob : pulp.LpProblem
+            The rows of the period's demand, with their right-hand sides set,
+            and the rows of each day
+        """
+
+        prob = LpProblem("smoothing", LpMinimize)
+
+        # 1.1
+        # minimize greatest amount of drop-offs/pick-ups on one day in current
+        # period
+        prob += self.z
+
+        # 1.2
+        # sum of pick-ups/drop-offs for each site over all days in window must
+        # equal magnitude of demand on original date for that site
+        for i, l, start, end, demand, drop_off in zip(windows['site'],
+            windows['day'], windows['start'], windows['end'],
+            windows['demand'], windows['drop_off']):
+
+            key = (int(i), int(l), bool(drop_off))
+            if key not in self.demand_rows:
+                self.demand_rows[key] = LpConstraint(LpAffineExpression([
+                    (self.w[key[0]][l_prime], 1) for l_prime in
+                    range(start, end)]), LpConstraintEQ, 'demand_%s_%s' % (
+                    key[0], key[1]))
+
+            row = self.demand_rows[key]
+            row.changeRHS(float(demand))
+            prob.addConstraint(row)
+
+        for row in self.day_rows:
+            prob.addConstraint(row)
+
+        return prob
+
+    def make_matrices(self, windows):
+        """Assembles the rows and bounds of one period's demand
+
+        Parameters
+        ----------
+        windows : dict
+            The days each site's demand on each day can be moved to (see
+            make_windows)
+
+        Returns
+        -------
+        matrices : dict
+            The objective coefficients, sparse constraint matrix, row bounds,
+            column bounds and integrality of every column
+        """
+
+        num_days = self.num_days
+        num_cells = len(self.c) - 1
+        demand = windows['demand'].astype(float)
+
+        # only the rows of the demand each site has, drop-offs among the
+        # first rows and pick-ups among the next, and every day's row
+        cells = windows['site']*num_days + windows['day']
+        rows = np.concatenate([np.where(windows['drop_off'], cells,
+            num_cells + cells), 2*num_cells + np.arange(num_days)])
+        row_lower = np.concatenate([demand, np.full(num_days, -np.inf)])
+        row_upper = np.concatenate([demand, np.zeros(num_days)])
+
+        # every column is a non-negative integer
+        num_columns = len(self.c)
+        matrices = {
+            'c': self.c,
+            'A': self.A[rows],
+            'row_lower': row_lower,
+            'row_upper': row_upper,
+            'lower': np.zeros(num_columns),
+            'upper': np.full(num_columns, np.inf),
+            'integrality': np.ones(num_columns)
+        }
+
+        return matrices
+
+    def start_values(self, d, windows):
+        """The drop-offs/pick-ups of each site each day to start a solve from
+
+        Parameters
+        ----------
+        d : numpy.ndarray
+            The number of drop-offs or pick-ups each site needs each day
+
+        windows : dict
+            The days each site's demand on each day can be moved to (see
+            make_windows)
+
+        Returns
+        -------
+        w : numpy.ndarray
+            The last solution found for each site it meets the demand of,
+            and the demand as it was asked for otherwise, by site then day
+        """
+
+        magnitude = np.absolute(d).astype(float)
+        if self.last_w is None:
+            return magnitude
+
+        # how many the last solution has over each demand's window, from
+        # running totals
+        site = windows['site']
+        totals = np.concatenate([np.zeros((d.shape[0], 1)),
+            np.cumsum(self.last_w, axis=1)], axis=1)
+        moved = totals[site, windows['end']] - totals[site, windows['start']]
+
+        missed = np.bincount(site[moved != windows['demand']],
+            minlength = d.shape[0])
+        kept = missed == 0
+
+        magnitude[kept] = self.last_w[kept]
+
+        return magnitude
+
+    def solve(self, d, windows, time_limit = None):
+        """Smoothes one period's demand
+
+        Parameters
+        ----------
+        d : numpy.ndarray
+            The number of drop-offs or pick-ups each site needs each day
+
+        windows : dict
+            The days each site's demand on each day can be moved to (see
+            make_windows)
+
+        time_limit : float, optional
+            The most seconds the solve may take, or None for no limit
+
+        Returns
+        -------
+        results : dict
+            The same as smoothing_model returns, with the demand as it was
+            asked for as 'w' if no solution was found
+        """
+
+        start = self.start_values(d, windows)
+
+        w = None
+        if self.matrix_form:
+            status, objective, solution, outcome = \
+                self.backend.solve_matrices(self.make_matrices(windows),
+                False, 'smoothing', time_limit, np.append(start.ravel(),
+                start.sum(axis=0).max()))
+            if solution is not None:
+                w = solution[:-1].reshape(d.shape)
+        else:
+            for i in range(self.num_locations):
+                for l in range(self.num_days):
+                    self.w[i][l].setInitialValue(start[i, l])
+            self.z.setInitialValue(start.sum(axis=0).max())
+
+            status, objective, outcome = self.backend.solve_problem(
+                self.make_problem(windows), warm_start = True,
+                time_limit = time_limit)
+            if status == 'Optimal':
+                w = np.array([[self.w[i][l].varValue or 0 for l in
+                    range(self.num_days)] for i in
+                    range(self.num_locations)], dtype=float)
+
+        # drop-offs/pick-ups assigned to each site each day
+        if w is None:
+            w = np.absolute(d).astype(float)
+            objective = w.sum(axis=0).max()
+        else:
+            w = np.round(w)
+            self.last_w = w
+
+        results = {
+            'status': status,
+            'outcome': outcome,
+            'objective': objective,
+            'w': w
+        }
+
+        return results
+
+def smoothing_flow(d, windows, time_limit = None):
+    """The demand smoothing problem of smoothing_model, solved as a bottleneck
+    transportation problem rather than an integer program
+
+    Each day a site has demand is a source of that many drop-offs or
+    pick-ups, and each day of the period a sink, joined by the days in the
+    demand's window. Whether every day can be kept to at most z is a maximum
+    flow in which each day takes at most z, so the smallest z is found by
+    binary search between the average and the largest day of the original
+    demand, taking polynomial time however many sites and days there are.
+
+    Unlike smoothing_model, each visit meets the demand of only one day, so
+    the two only differ for sites whose windows overlap within the period,
+    where the integer program lets one visit count towards both.
+
+    Parameters
+    ----------
+    d : numpy.ndarray
+        The number of drop-offs or pick-ups each site needs each day
+
+    windows : dict
+        The days each site's demand on each day can be moved to (see
+        make_windows)
+
+    time_limit : float, optional
+        The most seconds the search may take, or None for no limit. The best
+        z found by then is used, and reported as feasible with a gap
+
+    Returns
+    -------
+    results : dict
+        The same as smoothing_model returns
+    """
+
+    # the flow engine needs scipy (1.4 or later for maximum_flow, which
+    # needs Python 3), so only import it when it is chosen
+    import scipy.sparse as sp
+    from scipy.sparse.csgraph import maximum_flow
 
-    prob.solve()
+    deadline = Deadline(time_limit)
+    num_locations, num_days = d.shape
+    magnitude = np.absolute(d).astype(int)
+
+    # each day with demand, and the days its demand can be moved to, one arc
+    # for each counted from the start of its window
+    source_sites = windows['site']
+    source_demand = windows['demand'].astype(int)
+    num_sources = len(source_sites)
+    lengths = windows['end'] - windows['start']
+    arc_sources = np.repeat(np.arange(num_sources), lengths)
+    arc_days = np.repeat(windows['start'] - np.cumsum(lengths) + lengths,
+        lengths) + np.arange(lengths.sum())
+
+    # nodes are the start, then each source, then each day, then the end
+    start = 0
+    source_nodes = 1 + np.arange(num_sources)
+    day_nodes = 1 + num_sources + np.arange(num_days)
+    end = 1 + num_sources + num_days
+
+    tails = np.concatenate([np.full(num_sources, start), source_nodes[
+        arc_sources], day_nodes]).astype(np.int32)
+    heads = np.concatenate([source_nodes, day_nodes[arc_days], np.full(
+        num_days, end)]).astype(np.int32)
+
+    def route(z):
+        capacity = np.concatenate([source_demand, source_demand[arc_sources],
+            np.full(num_days, z)]).astype(np.int32)
+        graph = sp.csr_matrix((capacity, (tails, heads)), shape = (end + 1,
+            end + 1))
+        return maximum_flow(graph, start, end)
+
+    # the original demand is always feasible, and no day can be below the
+    # average
+    total = source_demand.sum()
+    lower = int(np.ceil(total/float(num_days)))
+    upper = int(magnitude.sum(axis=0).max())
+    flow = None
+
+    outcome = OPTIMAL
+    while lower < upper:
+        if deadline.remaining() == 0:
+            outcome = FEASIBLE_WITH_GAP
+            break
+
+        z = (lower + upper)//2
+        result = route(z)
+        if result.flow_value == total:
+            upper = z
+
+            # scipy 1.8 renamed the flow of each arc from residual to flow
+            flow = getattr(result, 'flow', None)
+            if flow is None:
+                flow = result.residual
+        else:
+            lower = z + 1
+
+    # drop-offs/pick-ups assigned to each site each day
+    if flow is None:
+        w = magnitude.astype(float)
+    else:
+        moved = np.asarray(flow[source_nodes[arc_sources],
+            day_nodes[arc_days]]).ravel()
+        w = np.zeros((num_locations, num_days))
+        np.add.at(w, (source_sites[arc_sources], arc_days), moved)
 
     results = {
-        'status': LpStatus[prob.status],
-        'objective': value(prob.objective),
-        'variables': prob.variables()
+        'status': 'Optimal',
+        'outcome': outcome,
+        'objective': float(upper),
+        'w': w
     }
 
     return results
 
+def make_windows(d, window):
+    """Lists the days each site's demand on each day can be moved to
+
+    Drop-offs can be made up to 'window' days before and including the day
+    they were asked for, and pick-ups up to 'window' days after, as long as
+    they stay within the period. Only the days sites have demand are listed,
+    as arrays with one entry for each, so the windows take as much memory
+    as there is demand rather than sites times days.
+
+    Parameters
+    ----------
+    d : numpy.ndarray
+        The number of drop-offs or pick-ups each site needs each day of the
+        period
+
+    window : int
+        The number of different days a site can have equipment dropped-off or
+        picked-up
+
+    Returns
+    -------
+    windows : dict
+        For each site and day with demand, by site then day: the 'site', the
+        'day' it was asked for, the 'start' and 'end' of the days it can be
+        moved to (end excluded, like a range), its magnitude as 'demand', and
+        whether it is a 'drop_off'
+
+    transform : numpy.ndarray
+        -1 for each site and day whose smoothed demand are drop-offs, 1
+        otherwise
+    """
+
+    locations, days = d.shape
+
+    # the sites and days with demand for a drop-off/pick-up
+    site, day = np.nonzero(d)
+    demand = d[site, day]
+    drop_off = demand < 0
+
+    # drop-offs can move to the days before, pick-ups to the days after
+    start = np.where(drop_off, np.maximum(day - (window - 1), 0), day)
+    end = np.where(drop_off, day + 1, np.minimum(day + window, days))
+
+    windows = {
+        'site': site,
+        'day': day,
+        'start': start,
+        'end': end,
+        'demand': np.absolute(demand),
+        'drop_off': drop_off
+    }
+
+    # mark every day within a drop-off's window so we can return their
+    # negative values after smoothing, counting the windows covering each
+    # day from where they start and end
+    covering = np.zeros((locations, days + 1))
+    np.add.at(covering, (site[drop_off], start[drop_off]), 1)
+    np.add.at(covering, (site[drop_off], end[drop_off]), -1)
+    transform = np.where(np.cumsum(covering[:, :-1], axis=1) > 0, -1., 1.)
+
+    return windows, transform
+
+def benchmark_engines(d, window, backend = None, time_limit = None):
+    """Times smoothing a demand matrix as a single period with the integer
+    program and with the flow engine
+
+    Parameters
+    ----------
+    d : numpy.ndarray
+        The number of drop-offs or pick-ups each site needs each day, such
+        as several years of many sites' demand
+
+    window : int
+        The number of different days a site can have equipment dropped-off or
+        picked-up
+
+    backend : solvers.PulpBackend or solvers.HighsBackend, optional
+        The solver to hand the IP to, CBC through PuLP if not given
+
+    time_limit : float, optional
+        The most seconds either engine may take
+
+    Returns
+    -------
+    timings : dict
+        The seconds each engine took, the largest day it smoothed demand to
+        and whether that is optimal, feasible with a gap or timed out
+    """
+
+    windows, transform = make_windows(d, window)
+
+    timings = {}
+    for engine, smooth in (('ip', lambda: smoothing_model(d, windows, backend,
+        time_limit)), ('flow', lambda: smoothing_flow(d, windows,
+        time_limit))):
+        start = timeit.default_timer()
+        results = smooth()
+        timings[engine] = {
+            'seconds': timeit.default_timer() - start,
+            'objective': results['objective'],
+            'outcome': results['outcome']
+        }
+
+    return timings
+
 # run the smoothing algorithm for each period of time from start_date to end_date
 def iterate(period_inputs, current_start_index):
     """Smoothes 'period' days of demand data
     
     Pulls the original demand data for the next 'period' days to be smoothed.
-    Creates a matrix of possible days each site can have drop-offs or pick-ups,
-    constrained by the 'window' and the 'period' of days being considered.
+    Lists the possible days each site can have drop-offs or pick-ups for each
+    day it has demand, constrained by the 'window' and the 'period' of days
+    being considered.
     Smoothes 'period' days of demand and records the new number of drop-offs
     and pick-ups to be made to each site each day in this period.
 
@@ -88,7 +634,9 @@ def iterate(period_inputs, current_start_index):
         days are in our window, the dataframe recording demand, an array
         storing how much demand each day has after smoothing, the largest
         demand seen for any one day, and a flag for if this period length
-        returns a feasible solution for every 'period' days smoothed.
+        returns a feasible solution for every 'period' days smoothed. With a
+        'cache' (see memo.LruCache), periods smoothed before are reused and
+        those newly smoothed are kept in it and in 'smoothed'.
 
     current_start_index : int
         The column of the demand dataframe from which the next 'period' days
@@ -106,6 +654,10 @@ def iterate(period_inputs, current_start_index):
     feasible = period_inputs['feasible']
     daily_totals = period_inputs['daily_totals']
     largest_objective = period_inputs['largest_objective']
+    backend = period_inputs.get('backend')
+    time_limit = period_inputs.get('time_limit')
+    cache = period_inputs.get('cache')
+    engine = period_inputs.get('engine', 'ip')
     
     # set the index where the smoothing algorithm will stop for this iteration
     current_end_index = current_start_index + period
@@ -114,58 +666,51 @@ def iterate(period_inputs, current_start_index):
     df = demand_df.iloc[:,current_start_index:current_end_index]
     d = df.values
 
-    locations, days = d.shape
-    
-    # matrix to store which days are drop-offs and need to have negative values
-    # when we finish
-    transform = np.ones((locations,days))
-    
-    # lists the dates within the time window for drop-off/pick-up if a site has
-    # demand for a drop-off/pick-up that day 
-    s = [[[] for i in range(days)] for i in range(locations)]
-    
-    for i in range(locations):
-        for l in range(days):
-            
-            # list all days drop-off(s) for a site can occur and mark them in
-            # our transform matrix so we can return their negative values
-            # after smoothing
-            if d[i,l] < 0:
-                magnitude = min(window, l+1)
-                s[i][l] = range(l-(magnitude-1), l+1)
-                for day in s[i][l]:
-                    transform[i,day] = -1
-            
-            # list all days pick-up(s) for a site can occur if it has demand
-            # for pick-up(s) that day
-            if d[i,l] > 0:
-                magnitude = min(window, period-l)
-                s[i][l] = range(l, l+magnitude)
+    # the days each site's demand can be moved to, and which are drop-offs
+    windows, transform = make_windows(d, window)
 
     # spread the drop-off(s) and pick-up(s) of all sites as evenly as possible
-    # keeping them all within the time window
-    results = smoothing_model(d,s)
+    # keeping them all within the time window, unless this same period has
+    # been smoothed before
+    key = fingerprint(window, period, engine, type(backend).__name__, d)
+    results = cache.get(key) if cache is not None else None
+    if results is None:
+        if engine == 'flow':
+            results = smoothing_flow(d,windows,time_limit)
+        else:
+            # one model is built for each shape of period, and re-solved for
+            # every period of that shape
+            models = period_inputs.setdefault('models', {})
+            if d.shape not in models:
+                models[d.shape] = SmoothingModel(d.shape[0], d.shape[1],
+                    window, backend)
+            results = models[d.shape].solve(d,windows,time_limit)
+
+        # a period that ran out of time might be smoothed given more
+        if cache is not None and results['outcome'] != TIMED_OUT:
+            cache.put(key, results)
+            period_inputs.setdefault('smoothed', {})[key] = results
 
     status = results['status']
+    outcome = results['outcome']
     objective = results['objective']
-    variables = results['variables']
-
-    # if the solver does not optimally assign all drop-offs/pick-ups, mark this
-    # period length as infeasible so its results will not be considered
-    if status != 'Optimal':
+    w = results['w']
+
+    # if the solver runs out of time before assigning all drop-offs/pick-ups,
+    # leave them on the days they were originally requested
+    if outcome == TIMED_OUT:
+        print('smoothing timed out, days %s-%s left unsmoothed' % (
+            current_start_index + 1, current_end_index))
+        w = np.absolute(d)
+        objective = w.sum(axis=0).max()
+
+    # if the solver cannot assign all drop-offs/pick-ups, mark this period
+    # length as infeasible so its results will not be considered
+    elif status != 'Optimal':
         feasible = False
 
-    # assign the number of visits each site will be made each day by parsing
-    # site and date values from variables
-    for v in variables:
-        if v.name[0] == 'w':    
-            first_underscore_index = v.name.find('_')
-            second_underscore_index = v.name.rfind('_')
-
-            i = int(v.name[first_underscore_index+1:second_underscore_index])
-            l = int(v.name[second_underscore_index+1:])
-
-            d[i,l] = v.varValue
+    # assign the number of visits each site will be made each day
+    d = w
 
     # record absolute values of deliveries made daily
     daily_totals[current_start_index:current_end_index] = d.sum(axis=0)
@@ -187,14 +732,135 @@ def iterate(period_inputs, current_start_index):
 
     return period_inputs
 
-def smooth_demand(demand_df, window, start_date, end_date):
+# the lowest variance of daily totals of any period length fully smoothed so
+# far in a sweep, shared by every process smoothing a candidate period length
+sweep_inputs = {}
+
+def start_smoothing_worker(best_variance, cache = None):
+    """Readies a process to smooth candidate period lengths of a sweep
+
+    Parameters
+    ----------
+    best_variance : multiprocessing.Value
+        The lowest variance of any period length smoothed so far, shared by
+        all processes of the sweep
+
+    cache : memo.LruCache, optional
+        The periods smoothed before, to reuse, or None to smooth every period
+    """
+
+    sweep_inputs['best_variance'] = best_variance
+    sweep_inputs['cache'] = cache
+
+def smooth_with_period(candidate):
+    """Smoothes demand 'period' days at a time for one candidate period length
+    of a sweep
+
+    Gives up as soon as the period length can no longer have the lowest
+    variance of any feasible period length of the sweep, since the variance
+    of all the days' totals is at least the share of days smoothed so far
+    times the variance of theirs.
+
+    Parameters
+    ----------
+    candidate : dict
+        The period length, window, its own copy of the demand_df to smooth,
+        the backend and engine (see smooth_demand), and the sweep's
+        deadline with how many equal 'parts' of the time left this candidate
+        gets
+
+    Returns
+    -------
+    candidate : dict
+        The period length, its smoothed demand_df (None if abandoned), the
+        variance of its daily totals, the largest demand of any one day,
+        whether every period was feasible, whether it was abandoned, and the
+        periods it newly smoothed ('smoothed'), so the process that started
+        the sweep can reuse them
+    """
+
+    best_variance = sweep_inputs['best_variance']
+    period = candidate['period']
+    demand_df = candidate['demand_df']
+    num_days = len(demand_df.columns)
+    deadline = candidate['deadline'].split(candidate['parts'])
+
+    # indices from which our smoothing algorithm will start
+    indices = range(0, num_days, period)
+
+    period_inputs = {
+        'period': period,
+        'window': candidate['window'],
+        'demand_df': demand_df,
+        # total number of drop-offs and pick-ups that will be made each day
+        'daily_totals': np.zeros(num_days),
+        # record the largest minimum value we'll see throughout
+        # all iterations in this period
+        'largest_objective': 0,
+        # whether or not the smoothing algorithm returns a feasible answer
+        # for a given length of periods
+        'feasible': True,
+        'backend': candidate['backend'],
+        'cache': sweep_inputs.get('cache'),
+        'engine': candidate['engine']
+    }
+
+    abandoned = False
+    for current_start_index in indices:
+
+        # if on last index, adjust the copy of period to remaining number of days
+        if (indices.index(current_start_index) == len(indices)-1 and
+            num_days % period != 0):
+
+            period_inputs['period'] = num_days % period
+
+        # share the time left between this and the remaining periods
+        period_inputs['time_limit'] = deadline.share(len(indices) -
+            indices.index(current_start_index))
+
+        period_inputs = iterate(period_inputs, current_start_index)
+
+        # stop once this period length can't be the one kept
+        smoothed_days = current_start_index + period_inputs['period']
+        lower_bound = (smoothed_days/float(num_days) *
+            period_inputs['daily_totals'][:smoothed_days].var())
+        if lower_bound > best_variance.value + 1e-9:
+            abandoned = True
+            break
+
+    variance = period_inputs['daily_totals'].var()
+
+    if not abandoned and period_inputs['feasible']:
+        with best_variance.get_lock():
+            if variance < best_variance.value:
+                best_variance.value = variance
+
+    candidate = {
+        'period': period,
+        'demand_df': None if abandoned else period_inputs['demand_df'],
+        'variance': variance,
+        'largest_objective': period_inputs['largest_objective'],
+        'feasible': period_inputs['feasible'],
+        'abandoned': abandoned,
+        'smoothed': period_inputs.get('smoothed', {})
+    }
+
+    return candidate
+
+def smooth_demand(demand_df, window, start_date, end_date, backend = None,
+    deadline = None, reuse = False, engine = 'ip', periods = None,
+    workers = 1, cache = None):
     """Smooth the demand for drop-offs and pick-ups for a given variation as
     much as possible constrained to the time window
 
     Defines a list of period lengths. For each period length, demand is smoothed
     'period length' days at a time. Returns the smoothed demand for the entire
     time range corresponding to the length of period which results in the lowest
-    variance in total daily demand.
+    variance in total daily demand. Period lengths of at least the number of
+    days all smooth the whole time range as one period, so only the first of
+    them is tried. Each period length smoothes its own copy of the demand, in
+    'workers' processes at once if more than one, and is abandoned as soon as
+    it can no longer have the lowest variance (see smooth_with_period).
     
     Parameters
     ----------
@@ -212,6 +878,32 @@ def smooth_demand(demand_df, window, start_date, end_date):
     end_date : str
         The last day in our range of time we are considering ('yyyy-mm-dd'
         format)
+
+    backend : solvers.PulpBackend or solvers.HighsBackend, optional
+        The solver to hand each period's IP to, CBC through PuLP if not given
+
+    deadline : solvers.Deadline, optional
+        When smoothing must be finished by, split evenly across the period
+        lengths still to be tried and then across their periods
+
+    reuse : bool, optional
+        Whether to reuse the smoothing of any period with the same demand
+        smoothed before by this process
+
+    cache : memo.LruCache, optional
+        Where the periods smoothed before are kept when reusing them, the
+        process's 'smoothing' cache (see memo.get_cache) if not given
+
+    engine : str, optional
+        'ip' to smooth each period with the integer program, or 'flow' to
+        solve it as a bottleneck transportation problem (see smoothing_flow)
+
+    periods : list, optional
+        The period lengths to try, 3 to 10 days if not given
+
+    workers : int, optional
+        How many period lengths to smooth at once in worker processes, or 1
+        (the default) to smooth them one after another in this process
         
     Returns
     -------
@@ -223,75 +915,78 @@ def smooth_demand(demand_df, window, start_date, end_date):
 
     #print('smoothing demand for %s' % variation)
 
-    # number of days to do at once
-    periods = np.array([5]) #arange(3,11)
-
-    # minimum variance of all seen period lengths
-    min_variance = 999 
-    
-    # the period length and objective for the period length with minimum variance
-    mv_period = 999
-    mv_objective = 999
-
-    # need to find a way to refresh df if running for multiple periods
-    for period in periods:
+    if deadline is None:
+        deadline = Deadline()
 
-        # commented out for web app - deep copy if re-implemented
-        # dataframe with demands for drop-offs/pick-ups at each site each day
-        #demand_df = pd.read_excel(file_path, sheetname=variation, index_col=0)
-        
-        # drop columns outside of date range
-        start_index = demand_df.columns.get_loc(start_date)
-        end_index = demand_df.columns.get_loc(end_date)
-        demand_df = demand_df.iloc[:,start_index:end_index+1]
-        num_days = len(demand_df.columns)
-
-        # total number of drop-offs and pick-ups that will be made each day
-        daily_totals = np.zeros(num_days)
-                
-        # whether or not the smoothing algorithm returns a feasible answer
-        # for a given length of periods
-        feasible = True
-
-        # indices from which our smoothing algorithm will start
-        indices = range(0, num_days, period)
-        
-        # record the largest minimum value we'll see throughout
-        # all iterations in this period
-        largest_objective = 0
-
-        period_inputs = {
-            'period': period,
-            'window': window,
-            'demand_df': demand_df,
-            'daily_totals': daily_totals,
-            'largest_objective': largest_objective,
-            'feasible': feasible
-        }
-
-        for current_start_index in indices:
-
-            # if on last index, adjust the copy of period to remaining number of days
-            if (indices.index(current_start_index) == len(indices)-1 and
-                num_days % period != 0):
-
-                period_inputs['period'] = num_days % period
-                period_inputs['period']
-
-            period_inputs = iterate(period_inputs, current_start_index)
-
-        variance = period_inputs['daily_totals'].var()
-
-        if feasible == True:
-            if variance < min_variance:
-                
-                mv_demand_df = period_inputs['demand_df']
-                min_variance = variance
-                mv_period = period
-                mv_objective = period_inputs['largest_objective']
+    # number of days to do at once
+    if periods is None:
+        periods = np.arange(3,11)
+
+    # drop columns outside of date range
+    start_index = demand_df.columns.get_loc(start_date)
+    end_index = demand_df.columns.get_loc(end_date)
+    demand_df = demand_df.iloc[:,start_index:end_index+1]
+
+    # period lengths as long as the time range or longer smooth it all in one
+    # period, and so smooth it the same
+    num_days = len(demand_df.columns)
+    whole_range = [period for period in periods if period >= num_days][:1]
+    periods = [period for period in periods if period < num_days or period in
+        whole_range]
+
+    # each period length gets its own copy of the demand to smooth, and an
+    # equal share of the time left for it and the period lengths after it
+    workers = max(min(workers, len(periods)), 1)
+    rounds = -(-len(periods)//workers)
+    candidates = [{
+        'period': int(period),
+        'window': window,
+        'demand_df': demand_df.copy(),
+        'backend': backend,
+        'engine': engine,
+        'deadline': deadline,
+        'parts': rounds - position//workers
+    } for position, period in enumerate(periods)]
+
+    if not reuse:
+        cache = None
+    elif cache is None:
+        cache = get_cache('smoothing', {})
+
+    # lowest variance of all feasible period lengths smoothed so far
+    best_variance = multiprocessing.Value('d', np.inf)
+
+    # period lengths can be smoothed at once, except by a worker process,
+    # which can't start processes of its own
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        pool = multiprocessing.Pool(workers, start_smoothing_worker,
+            (best_variance, cache))
+        try:
+            candidates = pool.map(smooth_with_period, candidates, chunksize = 1)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        start_smoothing_worker(best_variance, cache)
+        candidates = [smooth_with_period(candidate) for candidate in
+            candidates]
+
+    # keep any periods the workers smoothed for next time
+    if cache is not None:
+        for candidate in candidates:
+            for key, results in candidate['smoothed'].items():
+                cache.keep(key, results)
+
+    # keep the feasible period length with minimum variance, the first tried
+    # if tied, or if none is feasible the one with minimum variance of all
+    finished = [candidate for candidate in candidates if not
+        candidate['abandoned']]
+    feasible = [candidate for candidate in finished if candidate['feasible']]
+    mv_candidate = min(feasible or finished, key = lambda candidate:
+        candidate['variance'])
 
     #print('best period had length %s with a variance of %s and objective %s' % 
-        #(mv_period, min_variance, mv_objective))
-
-    return mv_demand_df
+        #(mv_candidate['period'], mv_candidate['variance'],
+        #mv_candidate['largest_objective']))
 
+    return mv_candidate['demand_df']
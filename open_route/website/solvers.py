@@ -0,0 +1,674 @@
+from pulp import *
+import numpy as np
+import tempfile
+import time
+import os
+
+# how a solve ended: proven optimal, stopped with a solution that may not be
+# optimal, stopped on time without any solution, or proven to have none
+OPTIMAL = 'optimal'
+FEASIBLE_WITH_GAP = 'feasible with gap'
+TIMED_OUT = 'timed out'
+NO_SOLUTION = 'no solution'
+
+def get_backend(fixed_parameters, default = 'pulp'):
+    """Creates the solver backend named by the 'solver' fixed parameter
+
+    'pulp' solves with CBC through PuLP. 'highs' solves in memory with HiGHS
+    through scipy.optimize.milp, so no model or solution files are written;
+    it needs scipy 1.9 or later, and so Python 3. If the 'debug_lp_dir' fixed
+    parameter is set, every model solved is also written there as an LP file
+    with a name unique to that solve. The 'solve_time_limit' (seconds) and 'mip_gap' (relative)
+    fixed parameters bound the effort spent on every solve.
+
+    Parameters
+    ----------
+    fixed_parameters : dict
+        Parameters that are constant for any variation and region (as defined
+        in the main function)
+
+    default : str, optional
+        The solver to use if none is named
+
+    Returns
+    -------
+    backend : PulpBackend or HighsBackend
+        The backend both the routing and smoothing models solve with
+    """
+
+    solver = fixed_parameters.get('solver', default)
+    debug_lp_dir = fixed_parameters.get('debug_lp_dir')
+    time_limit = fixed_parameters.get('solve_time_limit')
+    gap = fixed_parameters.get('mip_gap')
+
+    if solver == 'pulp':
+        return PulpBackend(debug_lp_dir, time_limit, gap)
+    elif solver == 'highs':
+        return HighsBackend(debug_lp_dir, time_limit, gap)
+    else:
+        raise ValueError('unknown solver %s' % solver)
+
+def write_debug_lp(prob, debug_lp_dir):
+    """Writes a PuLP problem to its own LP file if debugging is enabled
+
+    Parameters
+    ----------
+    prob : pulp.LpProblem
+        The problem about to be solved
+
+    debug_lp_dir : str
+        The directory to write LP files to, or None to not write them
+    """
+
+    if debug_lp_dir is not None:
+        # a unique name per solve so concurrent runs never share a file
+        handle, path = tempfile.mkstemp(prefix = prob.name + '_',
+            suffix = '.lp', dir = debug_lp_dir)
+        os.close(handle)
+        prob.writeLP(path)
+
+def read_cbc_log(log_path):
+    """Reads how a CBC solve ended and the best bound it proved from its log
+
+    Parameters
+    ----------
+    log_path : str
+        The file CBC's output was written to
+
+    Returns
+    -------
+    result : str
+        The reason CBC gave for stopping, such as 'Optimal solution found
+        (within gap tolerance)', or None if the log doesn't give one
+
+    bound : float
+        The best bound on the objective CBC proved, or None if it didn't
+        report one separately from the objective
+    """
+
+    result, bound = None, None
+    with open(log_path) as log:
+        for line in log:
+            if line.startswith('Result - '):
+                result = line[len('Result - '):].strip()
+            elif line.startswith(('Lower bound:', 'Upper bound:')):
+                try:
+                    bound = float(line.split(':')[1])
+                except ValueError:
+                    pass
+
+    return result, bound
+
+def combine_time_limits(time_limit, other_limit):
+    """Finds the tighter of two time limits, either of which may be None
+
+    Parameters
+    ----------
+    time_limit, other_limit : float
+        Seconds allowed for a solve, or None for no limit
+
+    Returns
+    -------
+    time_limit : float
+        The smaller of the limits, or None if neither is set
+    """
+
+    limits = [limit for limit in (time_limit, other_limit) if limit is not None]
+    if len(limits) == 0:
+        return None
+
+    return min(limits)
+
+class Deadline(object):
+    """A point in time by which a group of solves must be finished
+
+    A deadline can be split into shorter deadlines for each part of the work
+    it covers, such as the days of a horizon or the fleet sizes tried in a
+    day, so that no one part can use up the time left for the rest.
+
+    Parameters
+    ----------
+    seconds : float, optional
+        How long from now the deadline is, or None for no deadline
+    """
+
+    def __init__(self, seconds = None):
+        self.end = None if seconds is None else time.time() + seconds
+
+    def remaining(self):
+        """The seconds left before the deadline, or None if there is none"""
+
+        if self.end is None:
+            return None
+
+        return max(self.end - time.time(), 0)
+
+    def share(self, parts):
+        """The seconds one of 'parts' equal shares of the time left gets, or
+        None if there is no deadline
+        """
+
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+
+        return remaining/float(max(parts, 1))
+
+    def split(self, parts):
+        """Creates a deadline for one of 'parts' equal shares of the time left
+
+        Parameters
+        ----------
+        parts : int
+            How many parts the remaining time is split into
+
+        Returns
+        -------
+        deadline : Deadline
+            A deadline that passes once this share of the time is used
+        """
+
+        return Deadline(self.share(parts))
+
+# solves given less time than this are reported as timed out without starting
+MIN_SOLVE_SECONDS = 0.01
+
+# a solution whose objective is this close to its bound, relative to the
+# objective, is reported as optimal
+OPTIMAL_GAP = 1e-9
+
+def problem_to_matrices(prob):
+    """Converts a PuLP problem to the objective, constraint matrix and bounds
+    of its matrix form
+
+    The matrix form is always minimized, so the objective of a problem that
+    is maximized is negated.
+
+    Parameters
+    ----------
+    prob : pulp.LpProblem
+        The problem to convert
+
+    Returns
+    -------
+    matrices : dict
+        The objective coefficients and constant, sparse constraint matrix, row
+        bounds, column bounds and integrality of every column
+
+    variables : list
+        The problem's variables, in the order of the matrices' columns
+    """
+
+    import scipy.sparse as sp
+
+    variables = prob.variables()
+    index = dict((v.name, n) for n, v in enumerate(variables))
+
+    c = np.zeros(len(variables))
+    for v, coefficient in prob.objective.items():
+        c[index[v.name]] = prob.sense*coefficient
+
+    # PuLP 2 keeps constraints in a dict, later versions return a list
+    if callable(prob.constraints):
+        constraints = prob.constraints()
+    else:
+        constraints = prob.constraints.values()
+
+    rows, columns, data = [], [], []
+    row_lower, row_upper = [], []
+    for r, constraint in enumerate(constraints):
+        expression = getattr(constraint, 'expr', constraint)
+        for v, coefficient in expression.items():
+            rows.append(r)
+            columns.append(index[v.name])
+            data.append(coefficient)
+
+        # constraints are stored as expression + constant (sense) 0
+        rhs = -constraint.constant
+        row_lower.append(rhs if constraint.sense != LpConstraintLE else -np.inf)
+        row_upper.append(rhs if constraint.sense != LpConstraintGE else np.inf)
+
+    A = sp.csr_matrix((data, (rows, columns)),
+        shape = (len(row_lower), len(variables)))
+
+    matrices = {
+        'c': c,
+        'constant': prob.sense*prob.objective.constant,
+        'A': A,
+        'row_lower': np.array(row_lower, dtype=float),
+        'row_upper': np.array(row_upper, dtype=float),
+        'lower': np.array([-np.inf if v.lowBound is None else v.lowBound
+            for v in variables], dtype=float),
+        'upper': np.array([np.inf if v.upBound is None else v.upBound
+            for v in variables], dtype=float),
+        'integrality': np.array([v.cat == LpInteger for v in variables],
+            dtype=float)
+    }
+
+    return matrices, variables
+
+def matrices_to_problem(matrices, name):
+    """Converts the matrix form of a problem to a PuLP problem
+
+    Parameters
+    ----------
+    matrices : dict
+        The objective coefficients, sparse constraint matrix, row bounds,
+        column bounds and integrality of every column
+
+    name : str
+        The name to give the problem
+
+    Returns
+    -------
+    prob : pulp.LpProblem
+        The problem, with one variable per column named by its index
+
+    variables : list
+        The problem's variables, in the order of the matrices' columns
+    """
+
+    A = matrices['A'].tocsr()
+
+    prob = LpProblem(name, LpMinimize)
+
+    variables = []
+    for n in range(len(matrices['c'])):
+        lower = matrices['lower'][n]
+        upper = matrices['upper'][n]
+        variables.append(LpVariable('v_%s' % n,
+            lowBound = None if np.isinf(lower) else lower,
+            upBound = None if np.isinf(upper) else upper,
+            cat = LpInteger if matrices['integrality'][n] else LpContinuous))
+
+    # expressions are built from (variable, coefficient) pairs, as
+    # multiplying each variable makes an expression of its own
+    prob += LpAffineExpression([(variables[n], coefficient) for n,
+        coefficient in enumerate(matrices['c']) if coefficient != 0])
+
+    for r in range(A.shape[0]):
+        start, end = A.indptr[r], A.indptr[r+1]
+        expression = LpAffineExpression([(variables[A.indices[e]], A.data[e])
+            for e in range(start, end)])
+        lower = matrices['row_lower'][r]
+        upper = matrices['row_upper'][r]
+
+        if lower == upper:
+            prob += expression == lower, 'row_%s' % r
+        else:
+            if not np.isinf(lower):
+                prob += expression >= lower, 'row_%s_lower' % r
+            if not np.isinf(upper):
+                prob += expression <= upper, 'row_%s_upper' % r
+
+    return prob, variables
+
+class PulpBackend(object):
+    """Solves models with CBC through PuLP
+
+    Parameters
+    ----------
+    debug_lp_dir : str, optional
+        The directory to write an LP file of every model solved to, or None
+        to not write them
+
+    time_limit : float, optional
+        The most seconds any one solve may take, or None for no limit
+
+    gap : float, optional
+        The relative gap between a solution and the best bound at which a
+        solve may stop, or None to solve to optimality
+    """
+
+    name = 'pulp'
+
+    def __init__(self, debug_lp_dir = None, time_limit = None, gap = None):
+        self.debug_lp_dir = debug_lp_dir
+        self.time_limit = time_limit
+        self.gap = gap
+
+    def solve_problem(self, prob, relax = False, warm_start = False,
+        time_limit = None):
+        """Solves a PuLP problem, leaving the solution in its variables
+
+        Parameters
+        ----------
+        prob : pulp.LpProblem
+            The problem to solve
+
+        relax : bool, optional
+            Whether to solve only the LP relaxation of the problem
+
+        warm_start : bool, optional
+            Whether to start from the initial values set on the variables
+
+        time_limit : float, optional
+            The most seconds this solve may take, on top of the backend's own
+            limit
+
+        Returns
+        -------
+        status : str
+            The solver's status for the problem, 'Optimal' whenever a
+            solution was found
+
+        objective : float
+            The value of the objective
+
+        outcome : str
+            Whether the solution is optimal, feasible with a gap, timed out
+            without a solution, or proven not to exist
+        """
+
+        time_limit = combine_time_limits(self.time_limit, time_limit)
+        if time_limit is not None and time_limit < MIN_SOLVE_SECONDS:
+            return 'Not Solved', None, TIMED_OUT
+
+        write_debug_lp(prob, self.debug_lp_dir)
+
+        # PuLP doesn't pass back whether CBC stopped at its gap, so CBC's
+        # output is written to a log of its own to be read afterwards
+        handle, log_path = tempfile.mkstemp(prefix = 'cbc_', suffix = '.log')
+        os.close(handle)
+        try:
+            prob.solve(PULP_CBC_CMD(msg = False, mip = not relax,
+                warmStart = warm_start, timeLimit = time_limit,
+                gapRel = self.gap, logPath = log_path))
+            result, bound = read_cbc_log(log_path)
+        finally:
+            os.remove(log_path)
+
+        status = LpStatus[prob.status]
+        objective = value(prob.objective)
+
+        # PuLP reports a solve stopped early with a solution as optimal, and
+        # only tells the two apart by the status of the solution
+        if status == 'Optimal':
+            if prob.sol_status != LpSolutionOptimal:
+                outcome = FEASIBLE_WITH_GAP
+            elif relax or self.gap_closed(result, bound, objective):
+                outcome = OPTIMAL
+            else:
+                outcome = FEASIBLE_WITH_GAP
+        elif status == 'Not Solved':
+            outcome = TIMED_OUT
+        else:
+            outcome = NO_SOLUTION
+
+        return status, objective, outcome
+
+    def gap_closed(self, result, bound, objective):
+        """Whether a CBC solve that stopped with a solution proved it optimal
+
+        CBC stops as soon as its solution is within the gap asked for, and
+        then gives the bound it had proved, so the solution is only optimal
+        if that bound meets it.
+
+        Parameters
+        ----------
+        result : str
+            The reason CBC gave for stopping, or None if it couldn't be read
+
+        bound : float
+            The best bound on the objective CBC proved, or None
+
+        objective : float
+            The value of the objective
+
+        Returns
+        -------
+        closed : bool
+            Whether the solution is proven optimal
+        """
+
+        if result is None:
+            # without CBC's log, only a solve never allowed a gap is optimal
+            return not self.gap
+
+        if result == 'Optimal solution found':
+            return True
+
+        if bound is None or objective is None:
+            return False
+
+        return abs(objective - bound) <= OPTIMAL_GAP*max(abs(objective), 1)
+
+    def solve_matrices(self, matrices, relax = False, name = 'matrices',
+        time_limit = None, start = None):
+        """Solves a problem given in matrix form
+
+        Parameters
+        ----------
+        matrices : dict
+            The objective coefficients, sparse constraint matrix, row bounds,
+            column bounds and integrality of every column
+
+        relax : bool, optional
+            Whether to solve only the LP relaxation of the problem
+
+        name : str, optional
+            The name to give the problem
+
+        time_limit : float, optional
+            The most seconds this solve may take, on top of the backend's own
+            limit
+
+        start : numpy.ndarray, optional
+            The value of each column to start the solve from
+
+        Returns
+        -------
+        status : str
+            The solver's status for the problem
+
+        objective : float
+            The value of the objective
+
+        solution : numpy.ndarray
+            The value of each column, or None if no solution was found
+
+        outcome : str
+            Whether the solution is optimal, feasible with a gap, timed out
+            without a solution, or proven not to exist
+        """
+
+        prob, variables = matrices_to_problem(matrices, name)
+
+        warm_start = start is not None and not relax
+        if warm_start:
+            for v, initial in zip(variables, start):
+                v.setInitialValue(initial)
+
+        status, objective, outcome = self.solve_problem(prob, relax,
+            warm_start, time_limit)
+
+        solution = None
+        if status == 'Optimal':
+            solution = np.array([v.varValue for v in variables], dtype=float)
+
+        return status, objective, solution, outcome
+
+class HighsBackend(object):
+    """Solves models in memory with HiGHS through scipy.optimize.milp
+
+    Parameters
+    ----------
+    debug_lp_dir : str, optional
+        The directory to write an LP file of every PuLP model solved to, or
+        None to not write them
+
+    time_limit : float, optional
+        The most seconds any one solve may take, or None for no limit
+
+    gap : float, optional
+        The relative gap between a solution and the best bound at which a
+        solve may stop, or None to solve to optimality
+    """
+
+    name = 'highs'
+
+    # scipy.optimize.milp status codes and their PuLP equivalents
+    statuses = {
+        0: 'Optimal',
+        1: 'Not Solved',
+        2: 'Infeasible',
+        3: 'Unbounded',
+        4: 'Undefined'
+    }
+
+    def __init__(self, debug_lp_dir = None, time_limit = None, gap = None):
+        # fail now rather than part way through the first solve
+        try:
+            from scipy.optimize import milp
+        except ImportError:
+            raise ValueError("the 'highs' solver needs scipy.optimize.milp, "
+                "which is in scipy 1.9 or later (on Python 3); use the "
+                "'pulp' solver instead")
+
+        self.debug_lp_dir = debug_lp_dir
+        self.time_limit = time_limit
+        self.gap = gap
+
+    def solve_problem(self, prob, relax = False, warm_start = False,
+        time_limit = None):
+        """Solves a PuLP problem, leaving the solution in its variables
+
+        Parameters
+        ----------
+        prob : pulp.LpProblem
+            The problem to solve
+
+        relax : bool, optional
+            Whether to solve only the LP relaxation of the problem
+
+        warm_start : bool, optional
+            Ignored, as scipy.optimize.milp can't be given a starting solution
+
+        time_limit : float, optional
+            The most seconds this solve may take, on top of the backend's own
+            limit
+
+        Returns
+        -------
+        status : str
+            The solver's status for the problem, 'Optimal' whenever a
+            solution was found
+
+        objective : float
+            The value of the objective
+
+        outcome : str
+            Whether the solution is optimal, feasible with a gap, timed out
+            without a solution, or proven not to exist
+        """
+
+        write_debug_lp(prob, self.debug_lp_dir)
+
+        matrices, variables = problem_to_matrices(prob)
+        status, objective, solution, outcome = self.solve_matrices(matrices,
+            relax, time_limit = time_limit)
+
+        for n, v in enumerate(variables):
+            v.varValue = None if solution is None else solution[n]
+
+        # undo the negation of a maximized objective
+        if objective is not None:
+            objective = prob.sense*objective
+
+        # report the status the same way PuLP's own solvers do
+        prob.status = dict((name, code) for code, name in
+            LpStatus.items())[status]
+
+        return status, objective, outcome
+
+    def solve_matrices(self, matrices, relax = False, name = 'matrices',
+        time_limit = None, start = None):
+        """Solves a problem given in matrix form
+
+        Parameters
+        ----------
+        matrices : dict
+            The objective coefficients, sparse constraint matrix, row bounds,
+            column bounds and integrality of every column
+
+        relax : bool, optional
+            Whether to solve only the LP relaxation of the problem
+
+        name : str, optional
+            Unused, kept so every backend can be called the same way
+
+        time_limit : float, optional
+            The most seconds this solve may take, on top of the backend's own
+            limit
+
+        start : numpy.ndarray, optional
+            Ignored, as scipy.optimize.milp can't be given a starting solution
+
+        Returns
+        -------
+        status : str
+            The solver's status for the problem, 'Optimal' whenever a
+            solution was found
+
+        objective : float
+            The value of the objective
+
+        solution : numpy.ndarray
+            The value of each column, or None if no solution was found
+
+        outcome : str
+            Whether the solution is optimal, feasible with a gap, timed out
+            without a solution, or proven not to exist
+        """
+
+        from scipy.optimize import milp, LinearConstraint, Bounds
+
+        time_limit = combine_time_limits(self.time_limit, time_limit)
+        if time_limit is not None and time_limit < MIN_SOLVE_SECONDS:
+            return 'Not Solved', None, None, TIMED_OUT
+
+        options = {}
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        if self.gap is not None:
+            options['mip_rel_gap'] = self.gap
+
+        integrality = matrices['integrality']
+        if relax:
+            integrality = np.zeros(len(integrality))
+
+        # milp can't be handed a matrix without rows
+        constraints = []
+        if matrices['A'].shape[0] > 0:
+            constraints = LinearConstraint(matrices['A'], matrices['row_lower'],
+                matrices['row_upper'])
+
+        res = milp(matrices['c'], constraints = constraints,
+            integrality = integrality,
+            bounds = Bounds(matrices['lower'], matrices['upper']),
+            options = options)
+
+        status = self.statuses.get(res.status, 'Undefined')
+
+        # a solve stopped on its limit may still have found a solution
+        if res.status == 1 and res.x is not None:
+            status = 'Optimal'
+
+        if status == 'Optimal':
+            # HiGHS always stops within its own tiny default gap, so only a
+            # gap target asked for can leave a solution short of optimal
+            mip_gap = getattr(res, 'mip_gap', None) or 0
+            if res.status == 0 and (not self.gap or mip_gap <= OPTIMAL_GAP):
+                outcome = OPTIMAL
+            else:
+                outcome = FEASIBLE_WITH_GAP
+        elif status == 'Not Solved':
+            outcome = TIMED_OUT
+        else:
+            outcome = NO_SOLUTION
+
+        objective = None
+        if res.x is not None:
+            objective = res.fun + matrices.get('constant', 0)
+
+        return status, objective, res.x, outcome
@@ -1,6 +1,366 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
 from django.test import TestCase
+from pulp import LpProblem, LpVariable, LpMaximize, lpSum
+
+from .views import post_to_df
+from .iterate import iterate_horizon, solve_horizon, solve_day
+from .checkpoints import CheckpointStore
+from .memo import LruCache
+from .smoothing import smoothing_model, smoothing_flow, make_windows
+from .solvers import (PulpBackend, HighsBackend, OPTIMAL, FEASIBLE_WITH_GAP,
+    TIMED_OUT)
+
+def make_post(num_sites, num_days, seed = 0):
+    """Makes form data like views.index posts, for any number of sites and
+    days, with each site asking for drop-offs and later pick-ups over and
+    over"""
+
+    rng = np.random.RandomState(seed)
+
+    post = {}
+    for site in range(1, num_sites + 1):
+        for day in range(1, num_days + 1):
+            post['%s_%s' % (site, day)] = '0'
+
+        day = rng.randint(0, 5)
+        while day < num_days:
+            post['%s_%s' % (site, day + 1)] = str(-rng.randint(1, 3))
+            end = day + rng.randint(2, 6)
+            if end < num_days:
+                post['%s_%s' % (site, end + 1)] = str(rng.randint(1, 3))
+            day = end + rng.randint(1, 6)
+
+    # the hub is site 0, with every site within a degree of it
+    for site in range(num_sites + 1):
+        post['lat%s' % site] = str(40 + rng.rand())
+        post['long%s' % site] = str(-88 + rng.rand())
+
+    return post
+
+def make_fixed_parameters(demand_df, site_df, directory_name):
+    """Makes the same fixed parameters views.end gives a request, with a
+    short time limit on each solve"""
+
+    return {
+        'start_date': demand_df.columns[0],
+        'end_date': demand_df.columns[-1],
+        'travel_rate': 50/60.,
+        'day_length': 720,
+        'handle': 90,
+        'fleet_upper_bound': max(12, int(demand_df.abs().sum().max())),
+        'window': 2,
+        'solve_time_limit': 2,
+        'mip_gap': 0.01,
+        'directory_name': directory_name,
+        'site_df': site_df
+    }
+
+class FormTest(TestCase):
+
+    def test_form_without_demands(self):
+        # only coordinates, as an empty grid on index.html would post
+        post = make_post(3, 4)
+        for key in list(post.keys()):
+            if '_' in key:
+                del post[key]
+
+        self.assertRaises(ValueError, post_to_df, post)
+
+def make_knapsack(num_items, seed = 0):
+    """Makes a small knapsack problem, which CBC and HiGHS both solve to
+    optimality well within any gap"""
+
+    rng = np.random.RandomState(seed)
+    weights = rng.randint(10, 60, num_items)
+    values = weights + rng.randint(-5, 6, num_items)
+
+    prob = LpProblem('knapsack', LpMaximize)
+    x = [LpVariable('x_%s' % n, cat = 'Binary') for n in range(num_items)]
+    prob += lpSum([int(value)*item for value, item in zip(values, x)])
+    prob += lpSum([int(weight)*item for weight, item in zip(weights, x)]) \
+        <= int(weights.sum())//2
+
+    return prob
+
+class HorizonTest(TestCase):
+
+    def run_horizon(self, num_sites, num_days):
+        """Solves a horizon posted as form data day by day, then as the
+        report, and checks the report's totals against the days"""
+
+        demand_df, site_df = post_to_df(make_post(num_sites, num_days))
+        self.assertEqual(demand_df.shape, (num_sites, num_days))
+
+        directory_name = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory_name)
+
+        fixed_parameters = make_fixed_parameters(demand_df, site_df,
+            directory_name)
+        fleet_upper_bound = fixed_parameters['fleet_upper_bound']
+
+        days = list(iterate_horizon(fixed_parameters, demand_df.copy()))
+        self.assertEqual([day['date_index'] for day in days],
+            list(range(num_days)))
+
+        # every day with demand was routed by some fleet
+        fleet_searches = [search for day in days for name, search in
+            day['fleet_searches']]
+        for day in days:
+            if np.absolute(day['demand'].values).sum() > 0:
+                self.assertTrue(day['fleet_size'] > 0)
+
+        # the report reuses the days just solved, so its totals must be
+        # those of the days
+        output = solve_horizon(fixed_parameters, demand_df.copy())
+
+        miles = sum([day['mileage'][fleet_upper_bound] for day in days])
+        reported_miles = float(output['truck_miles'].split(': ')[1])
+        self.assertAlmostEqual(reported_miles, miles, places = 6)
+
+        outcomes = [search['outcome'] for search in fleet_searches]
+        self.assertEqual(output['solve_outcomes'],
+            'Days Solved Optimally: %s, With a Gap: %s, Timed Out: %s' % (
+            outcomes.count(OPTIMAL), outcomes.count(FEASIBLE_WITH_GAP),
+            outcomes.count(TIMED_OUT)))
+        self.assertEqual(output['solves_avoided'],
+            'Fleet Size Solves Avoided: %s' % sum([search['solves_avoided']
+            for search in fleet_searches]))
+        self.assertEqual(output['recomputed_days'],
+            'Days Recomputed: 0 of %s' % num_days)
+
+        self.assertEqual(list(output['fleet_searches']), [name for day in
+            days for name, search in day['fleet_searches']])
+        self.assertEqual(list(output['hauler_routes']), [name for day in
+            days for name, routes in day['hauler_routes']])
+        self.assertEqual(output['demand_df'].shape, (num_sites, num_days))
+
+    def test_small_horizon(self):
+        self.run_horizon(8, 14)
+
+    @unittest.skipUnless(os.environ.get('OPEN_ROUTE_SLOW_TESTS'),
+        'set OPEN_ROUTE_SLOW_TESTS to run the scaling test')
+    def test_year_of_many_sites(self):
+        # 120 sites over a year, with days above the site threshold routed
+        # by the ALNS engine
+        self.run_horizon(120, 365)
+
+class CheckpointTest(TestCase):
+
+    def test_save_and_load(self):
+        directory_name = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory_name)
+
+        store = CheckpointStore(os.path.join(directory_name, 'checkpoints'))
+        self.assertEqual(store.load('day'), None)
+
+        store.save('day', {'fleet_size': 3})
+        store.save('day', {'fleet_size': 4, 'miles': np.arange(3.)})
+        day = store.load('day')
+        self.assertEqual(day['fleet_size'], 4)
+        self.assertTrue((day['miles'] == np.arange(3.)).all())
+
+        # every save is renamed over its file, leaving no temporary files
+        self.assertEqual(os.listdir(store.directory), ['day' + store.suffix])
+
+    def test_resume_solves_timed_out_days(self):
+        """A day checkpointed as timed out, as a run that hit its deadline
+        could leave it, is solved again rather than resumed from"""
+
+        demand_df, site_df = post_to_df(make_post(6, 5))
+
+        directory_name = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory_name)
+
+        checkpoint_dir = os.path.join(directory_name, 'checkpoints')
+        fixed_parameters = make_fixed_parameters(demand_df, site_df,
+            directory_name)
+        fixed_parameters.update({
+            'checkpoint_dir': checkpoint_dir,
+            'reuse_days': False
+        })
+
+        days = list(iterate_horizon(fixed_parameters, demand_df.copy()))
+        self.assertTrue(all([day['recomputed'] for day in days]))
+
+        # time out the first checkpointed day with a fleet search
+        store = CheckpointStore(checkpoint_dir)
+        for name in sorted(os.listdir(checkpoint_dir)):
+            fingerprint = name[:-len(store.suffix)]
+            day = store.load(fingerprint)
+            if len(day['fleet_searches']) > 0:
+                break
+
+        for label, search in day['fleet_searches']:
+            search['outcome'] = TIMED_OUT
+        day['fleet_size'] = None
+        store.save(fingerprint, day)
+
+        resumed = list(iterate_horizon(fixed_parameters, demand_df.copy()))
+        self.assertEqual([resumed_day['date'] for resumed_day in resumed if
+            resumed_day['recomputed']], [day['date']])
+
+        resumed_day = resumed[[resumed_day['date'] for resumed_day in
+            resumed].index(day['date'])]
+        self.assertNotEqual(resumed_day['fleet_searches'][0][1]['outcome'],
+            TIMED_OUT)
+        self.assertTrue(resumed_day['fleet_size'] > 0)
+
+        # the day solved again replaces its timed-out checkpoint
+        self.assertNotEqual(store.load(fingerprint)['fleet_searches'][0][1][
+            'outcome'], TIMED_OUT)
+
+class MemoTest(TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_evicted_results_are_kept_on_disk(self):
+        directory_name = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory_name)
+
+        cache = LruCache(1, directory_name)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(list(cache.entries), ['b'])
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(list(cache.entries), ['a'])
+
+class DecompositionTest(TestCase):
+
+    def solve(self, daily_demand, site_df, decomposition):
+        fixed_parameters = {
+            'travel_rate': 50/60.,
+            'day_length': 600,
+            'handle': 30,
+            'fleet_upper_bound': 20,
+            'site_df': site_df,
+            'decomposition': decomposition
+        }
+        daily_inputs = {
+            'fleet_mileage': np.zeros((21, 1)),
+            'hauler_hours': np.zeros((21, 1)),
+            'hauler_routes': [],
+            'fleet_searches': [],
+            'date': '2015-01-01',
+            'daily_demand': daily_demand,
+            'date_index': 0
+        }
+
+        fleet_mileage, hauler_hours, hauler_routes, fleet_searches = \
+            solve_day(fixed_parameters, daily_inputs)
+        search = fleet_searches[0][1]
+        self.assertEqual(search['outcome'], OPTIMAL)
+
+        return search['fleet_size'], fleet_mileage[-1, 0], search
+
+    def test_exact_matches_whole_day(self):
+        # three regions of two sites, further apart than a hauler can drive
+        # between in a day, so the day splits into them
+        rng = np.random.RandomState(0)
+        sites = np.zeros((8, 3))
+        sites[:, 0] = np.arange(8)
+        sites[0, 1:] = [40, -85]
+        for region, (lat, lng) in enumerate([(2.2, 0), (-2.2, 0), (0, 2.8)]):
+            sites[1 + 2*region:3 + 2*region, 1] = 40 + lat + rng.rand(2)*0.4
+            sites[1 + 2*region:3 + 2*region, 2] = -85 + lng + rng.rand(2)*0.4
+        sites[-1, 1:] = sites[0, 1:]
+        site_df = pd.DataFrame(sites, columns = ['Project #', 'Lat', 'Long'])
+        daily_demand = pd.Series(rng.choice([-2, -1, 1, 2], size = 6).astype(
+            float), index = np.arange(1, 7))
+
+        fleet_size, miles, whole = self.solve(daily_demand, site_df, None)
+        decomposed_size, decomposed_miles, decomposed = self.solve(
+            daily_demand, site_df, 'exact')
+
+        self.assertTrue(decomposed['components'] > 1)
+        self.assertEqual(decomposed_size, fleet_size)
+        self.assertAlmostEqual(decomposed_miles, miles, places = 6)
+
+class SmoothingTest(TestCase):
+
+    def test_flow_matches_model_without_overlaps(self):
+        try:
+            from scipy.sparse.csgraph import maximum_flow
+        except ImportError:
+            self.skipTest('the flow engine needs scipy 1.4 or later')
+
+        # one demand per site, so no site's windows overlap and the flow and
+        # the integer program solve the same problem
+        for seed in range(5):
+            rng = np.random.RandomState(seed)
+            d = np.zeros((12, 6))
+            d[np.arange(12), rng.randint(0, 6, 12)] = rng.choice([-3, -2, -1,
+                1, 2, 3], 12)
+            windows, transform = make_windows(d, 2 + seed % 2)
+
+            flow = smoothing_flow(d, windows)
+            model = smoothing_model(d, windows)
+            self.assertEqual(flow['outcome'], OPTIMAL)
+            self.assertEqual(model['outcome'], OPTIMAL)
+            self.assertEqual(flow['objective'], model['objective'])
+
+            # the flow moves each demand within its window, in full
+            self.assertEqual(flow['w'].sum(axis=0).max(), flow['objective'])
+            self.assertTrue((flow['w'].sum(axis=1) == np.absolute(d).sum(
+                axis=1)).all())
+
+class SolverTest(TestCase):
+
+    def test_pulp_outcomes(self):
+        # CBC proves a small problem optimal well within its gap
+        status, objective, outcome = PulpBackend(gap = 0.01).solve_problem(
+            make_knapsack(8))
+        self.assertEqual((status, outcome), ('Optimal', OPTIMAL))
+
+        status, objective, outcome = PulpBackend().solve_problem(
+            make_knapsack(8), relax = True)
+        self.assertEqual(outcome, OPTIMAL)
+
+        # a solve given no time doesn't start
+        status, objective, outcome = PulpBackend(time_limit = 0).solve_problem(
+            make_knapsack(8))
+        self.assertEqual((status, outcome), ('Not Solved', TIMED_OUT))
+
+    def test_pulp_gap_closed(self):
+        backend = PulpBackend(gap = 0.05)
+        self.assertTrue(backend.gap_closed('Optimal solution found', None, 5))
+        self.assertTrue(backend.gap_closed(
+            'Optimal solution found (within gap tolerance)', 832., 832.))
+        self.assertFalse(backend.gap_closed(
+            'Optimal solution found (within gap tolerance)', 874.4, 832.))
+        self.assertFalse(backend.gap_closed('Stopped on time', None, 832.))
+
+        # without a log, only solves never allowed a gap are optimal
+        self.assertFalse(backend.gap_closed(None, None, 832.))
+        self.assertTrue(PulpBackend().gap_closed(None, None, 832.))
+
+    def test_highs_outcomes(self):
+        try:
+            backend = HighsBackend(gap = 0.01)
+        except ValueError:
+            self.skipTest('the highs solver needs scipy 1.9 or later')
+
+        status, objective, outcome = backend.solve_problem(make_knapsack(8))
+        self.assertEqual((status, outcome), ('Optimal', OPTIMAL))
 
-# Create your tests here.
+        pulp_objective = PulpBackend().solve_problem(make_knapsack(8))[1]
+        self.assertAlmostEqual(objective, pulp_objective, places = 6)
@@ -2,7 +2,7 @@
 from __future__ import unicode_literals
 
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.template import loader
 from django.utils import timezone
 from django.conf import settings
@@ -13,6 +13,7 @@ from .iterate import solve_horizon
 import numpy as np
 import pandas as pd
 import os
+import re
 
 def index(request):
     template = loader.get_template('website/index.html')
@@ -22,40 +23,52 @@ def index(request):
 
 def post_to_df(post_data):
 
-    # pull POST data into proper data frames 
-    demand = np.zeros((5,5))
-    sites = np.zeros((7,3))
+    # pull POST data into (site, day) demands and site coordinates. Demands
+    # are named by site then day, either as '<site>_<day>' or, as the form
+    # in index.html does, as two digits when there are fewer than 10 of each
+    demands = {}
+    coordinates = {}
     for key in post_data.keys():
         if key != 'csrfmiddlewaretoken':
-            
-            # assign values for demands here 
-            if len(key) == 2:
-                row = int(key[0])-1
-                col = int(key[1])-1
-                demand[row, col] = post_data[key]
-   
-            # assign values for coordinates here 
-            elif 'long' == key[:4] or 'lat' == key[:3]:
-                row = int(key[-1])
-                if key[:3] == 'lat':
-                    col = 1
-                else:
-                    col = 2
-
-                # coordinate value
-                sites[row, col] = post_data[key]
-
-                # site number (for travel_matrix generator in parameters.py)
-                sites[row, 0] = row
-
-                # add entry for end location
-                if row == 0:
-                    row = len(sites) - 1
-                    sites[row, col] = post_data[key]
-                    sites[row, 0] = row
+
+            # assign values for demands here
+            demand_key = re.match(r'^(\d+)_(\d+)$', key) or \
+                re.match(r'^(\d)(\d)$', key)
+            coordinate_key = re.match(r'^(lat|long)(\d+)$', key)
+
+            if demand_key:
+                site, day = int(demand_key.group(1)), int(demand_key.group(2))
+                demands[site, day] = float(post_data[key])
+
+            # assign values for coordinates here
+            elif coordinate_key:
+                col = 1 if coordinate_key.group(1) == 'lat' else 2
+                coordinates[int(coordinate_key.group(2)), col] = \
+                    float(post_data[key])
+
+    if not demands:
+        raise ValueError('the form has no demand cells to route')
+
+    # sites are numbered 1 to N and days 1 to D; site 0 is the hub
+    num_sites = max([site for site, day in demands] +
+        [site for site, col in coordinates])
+    num_days = max([day for site, day in demands])
+
+    demand = np.zeros((num_sites, num_days))
+    for (site, day), value in demands.items():
+        demand[site - 1, day - 1] = value
+
+    # site number (for travel_matrix generator in parameters.py), with an
+    # entry for the end location (the hub again) after the last site
+    sites = np.zeros((num_sites + 2, 3))
+    sites[:, 0] = np.arange(num_sites + 2)
+    for (site, col), value in coordinates.items():
+        sites[site, col] = value
+    sites[-1, 1:] = sites[0, 1:]
 
     # create dataframe from input demand that can be passed to routing service
-    dates = ['2015-01-01', '2015-01-02', '2015-01-03', '2015-01-04', '2015-01-05']
+    dates = pd.date_range('2015-01-01', periods = num_days)
+    dates = [date.strftime('%Y-%m-%d') for date in dates]
     demand_df = pd.DataFrame(data=demand, columns=dates)
 
     # start indices at 1 as required by parameters.py
@@ -71,16 +84,33 @@ def post_to_df(post_data):
 
 def end(request):
     
+    # pull the demand data and site coordinates from post data, turning an
+    # empty or non-numeric form back as a bad request rather than a 500
+    try:
+        demand_df, site_df = post_to_df(request.POST)
+    except ValueError as error:
+        return HttpResponseBadRequest('Invalid input: %s' % error)
+
     # assign values for all fixed inputs
     # give arbitrary values to start and end to fit function inputs
-    start_date = '2015-01-01'
-    end_date = '2015-01-05'
+    start_date = demand_df.columns[0]
+    end_date = demand_df.columns[-1]
     travel_rate = float(request.POST['travel_rate'])/60
     day_length = int(request.POST['day_length'])
     handle = int(request.POST['handle'])
-    fleet_upper_bound = 12
+    # the most haulers recorded for any day; each day's fleet search is capped
+    # by the fleet its constructed routes need instead. No day needs more
+    # haulers than it has drop-offs and pick-ups, and smoothing never makes
+    # the busiest day busier
+    fleet_upper_bound = max(12, int(demand_df.abs().sum().max()))
     window = int(request.POST['window'])
 
+    # keep the request responsive, accepting routes within 1% of optimal
+    # over waiting for proof of optimality
+    horizon_time_limit = 60
+    solve_time_limit = 20
+    mip_gap = 0.01
+
     # save the user data from this instance in our database
     current_run = Run()
     current_run.name = request.POST['name']
@@ -92,9 +122,6 @@ def end(request):
     directory_name = settings.MEDIA_ROOT
     #directory_name = '/home/ubuntu/open_route/open_route/media/'
     #directory_name = '/Users/skelley/Documents/personal/senior_design/web_app/open_route/media/'
-    
-    # pull the demand data and site coordinates from post data
-    demand_df, site_df = post_to_df(request.POST)
 
     # save a copy of our demand to show side by side with smoothed demand
     input_df = demand_df.copy()
@@ -107,6 +134,9 @@ def end(request):
         'handle' : handle,
         'fleet_upper_bound' : fleet_upper_bound,
         'window' : window,
+        'horizon_time_limit' : horizon_time_limit,
+        'solve_time_limit' : solve_time_limit,
+        'mip_gap' : mip_gap,
         'directory_name' : directory_name,
         'site_df' : site_df
     }
@@ -121,8 +151,8 @@ def end(request):
     demand_df = output['demand_df']
 
     # change demand dataframes to match format from views.index
-    indices = ['Site 1', 'Site 2', 'Site 3', 'Site 4', 'Site 5']
-    days = ['day 1', 'day 2', 'day 3', 'day 4', 'day 5']
+    indices = ['Site %s' % site for site in demand_df.index]
+    days = ['day %s' % (day + 1) for day in range(len(demand_df.columns))]
 
     demand_df = pd.DataFrame(data=demand_df.values, index=indices, columns=days)
     input_df = pd.DataFrame(data=input_df.values, index=indices, columns=days)
@@ -133,7 +163,13 @@ def end(request):
         'demand_df' : demand_df.to_html(),
         'truck_table' : truck_table,
         'pictures' : pictures,
-        'hauler_routes' : hauler_routes
+        'hauler_routes' : hauler_routes,
+        'truck_miles' : output['truck_miles'],
+        'solve_outcomes' : output['solve_outcomes'],
+        'solves_avoided' : output['solves_avoided'],
+        'recomputed_days' : output['recomputed_days'],
+        'recomputed_dates' : output['recomputed_dates'],
+        'fleet_searches' : output['fleet_searches']
     }
     return HttpResponse(template.render(context, request))
 